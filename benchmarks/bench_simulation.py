@@ -0,0 +1,102 @@
+"""
+Timings of the simulation hot paths, in the format of airspeed velocity
+(https://asv.readthedocs.io): each `time_*` method is timed for every
+combination of `params`, after calling `setup` with the same arguments.
+"""
+import numpy as np
+
+from pulsee.propagators import default_propagator_cache
+from pulsee.simulation import FID_signal, ed_evolve, evolve, fourier_transform_signal, power_absorption_spectrum
+
+from .common import pulse_modes, spin_system
+
+
+class NuclearSystemSetup:
+    params = ([1 / 2, 3 / 2, 7 / 2], [1, 2, 3])
+    param_names = ['quantum number', 'n_spins']
+
+    def time_nuclear_system_setup(self, quantum_number, n_spins):
+        spin_system(quantum_number, n_spins)
+
+    def peakmem_nuclear_system_setup(self, quantum_number, n_spins):
+        spin_system(quantum_number, n_spins)
+
+
+class Evolve:
+    params = (['mesolve', 'magnus', 'propagator', 'rwa'], [1, 3])
+    param_names = ['solver', 'n_modes']
+    timeout = 240
+
+    def setup(self, solver, n_modes):
+        self.spin, self.h_unperturbed, self.dm_0 = spin_system(3 / 2, 1)
+        self.mode = pulse_modes(n_modes)
+
+    def time_evolve(self, solver, n_modes):
+        # The propagator cache would otherwise turn every repeat into a lookup.
+        default_propagator_cache.clear()
+        evolve(self.spin, self.h_unperturbed, self.dm_0, solver, mode=self.mode, display_progress=None)
+
+
+class EvolveSpinSize:
+    params = ([1 / 2, 3 / 2, 5 / 2], [1, 2], [False, True])
+    param_names = ['quantum number', 'n_spins', 'sparse']
+    timeout = 240
+
+    def setup(self, quantum_number, n_spins, sparse):
+        self.spin, self.h_unperturbed, self.dm_0 = spin_system(quantum_number, n_spins, sparse=sparse)
+        self.mode = pulse_modes(1)
+
+    def time_evolve_mesolve(self, quantum_number, n_spins, sparse):
+        evolve(self.spin, self.h_unperturbed, self.dm_0, 'mesolve', mode=self.mode, display_progress=None)
+
+
+class FIDSignal:
+    params = ([1 / 2, 3 / 2, 7 / 2], [1000, 10000])
+    param_names = ['quantum number', 'n_points']
+
+    def setup(self, quantum_number, n_points):
+        self.spin, self.h_unperturbed, self.dm_0 = spin_system(quantum_number, 1)
+        self.dm = evolve(self.spin, self.h_unperturbed, self.dm_0, 'mesolve', mode=pulse_modes(1),
+                         display_progress=None)
+
+    def time_FID_signal(self, quantum_number, n_points):
+        FID_signal(self.spin, self.h_unperturbed, self.dm, acquisition_time=100, n_points=n_points)
+
+
+class EdEvolve:
+    params = ([2, 4, 6], [100, 1000])
+    param_names = ['n_spins', 'n_times']
+
+    def setup(self, n_spins, n_times):
+        self.spin, self.h_unperturbed, self.dm_0 = spin_system(1 / 2, n_spins)
+        self.tlist = np.linspace(0, 10, n_times)
+
+    def time_ed_evolve(self, n_spins, n_times):
+        ed_evolve(self.h_unperturbed, self.dm_0, self.spin, self.tlist, e_ops=[self.spin.I['z']], fid=True)
+
+    def peakmem_ed_evolve(self, n_spins, n_times):
+        ed_evolve(self.h_unperturbed, self.dm_0, self.spin, self.tlist, e_ops=[self.spin.I['z']], fid=True)
+
+
+class PowerAbsorptionSpectrum:
+    params = ([1 / 2, 3 / 2, 9 / 2], [1, 2, 3])
+    param_names = ['quantum number', 'n_spins']
+    timeout = 120
+
+    def setup(self, quantum_number, n_spins):
+        self.spin, self.h_unperturbed, self.dm_0 = spin_system(quantum_number, n_spins)
+
+    def time_power_absorption_spectrum(self, quantum_number, n_spins):
+        power_absorption_spectrum(self.spin, self.h_unperturbed, dm_initial=self.dm_0)
+
+
+class FourierTransformSignal:
+    params = [1000, 10000, 100000]
+    param_names = ['n_points']
+
+    def setup(self, n_points):
+        self.times = np.linspace(0, 100, n_points)
+        self.signal = np.exp(-self.times / 20) * np.exp(1j * 2 * np.pi * self.times)
+
+    def time_fourier_transform_signal(self, n_points):
+        fourier_transform_signal(self.signal, self.times)
@@ -0,0 +1,43 @@
+import numpy as np
+
+from pulsee.pulses import Pulses
+from pulsee.simulation import nuclear_system_setup
+
+
+def spin_system(quantum_number: float, n_spins: int, sparse: bool = False):
+    """
+    Returns (spin, h_unperturbed, dm_initial) for n_spins spins with the given
+    quantum number in a static field, with quadrupolar interactions (for
+    quantum numbers above 1/2) and nearest-neighbour J-couplings.
+    """
+    spin_par = [{'quantum number': quantum_number,
+                 'gamma/2pi': 1. + 0.1 * i} for i in range(n_spins)]
+    zeem_par = {'field magnitude': 1.,
+                'theta_z': np.pi / 3,
+                'phi_z': 0.}
+    quad_par = None
+    if quantum_number > 1 / 2:
+        quad_par = [{'coupling constant': 2.,
+                     'asymmetry parameter': 0.3,
+                     'alpha_q': 0.,
+                     'beta_q': np.pi / 4,
+                     'gamma_q': 0.,
+                     'order': 0} for _ in range(n_spins)]
+    j_matrix = None
+    if n_spins > 1:
+        j_matrix = np.diag(np.full(n_spins - 1, 0.1), k=1)
+    return nuclear_system_setup(spin_par, quad_par, zeem_par, j_matrix=j_matrix,
+                                initial_state='canonical', temperature=1e-4, sparse=sparse)
+
+
+def pulse_modes(n_modes: int, pulse_time: float = 1.) -> Pulses:
+    """
+    Returns n_modes resonant modes with the same carrier frequency and
+    different phases and polarizations.
+    """
+    return Pulses(frequencies=[2 * np.pi] * n_modes,
+                  amplitudes=[0.1] * n_modes,
+                  phases=list(np.linspace(0, np.pi / 2, n_modes)),
+                  theta_p=[np.pi / 2] * n_modes,
+                  phi_p=list(np.linspace(0, np.pi / 4, n_modes)),
+                  pulse_times=[pulse_time] * n_modes)
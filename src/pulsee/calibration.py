@@ -0,0 +1,279 @@
+from dataclasses import dataclass
+
+import numpy as np
+from qutip import Qobj
+from scipy.optimize import brentq
+
+from .hamiltonians import carrier_frequency, h_rotating_frame, rotation_sense
+from .nuclear_spin import ManySpins, NuclearSpin
+from .operators import diagonalize_hamiltonian
+from .pulses import Pulses
+
+CALIBRATION_PARAMETERS = ("pulse_time", "amplitude")
+
+
+class NutationModel:
+    """
+    Final state of a rectangular pulse as a function of its duration or of
+    its amplitude, within the rotating-wave approximation (as in
+    evolve(solver='rwa')), together with its analytic derivative with
+    respect to that parameter.
+
+    In the frame rotating at the carrier frequency, the Hamiltonian during
+    the pulse is constant and affine in the amplitude, so that the
+    propagator is exp(-i 2 pi H_rot tau). When the duration is varied the
+    eigenbasis of H_rot is computed once and reused by all the evaluations;
+    when the amplitude is varied each evaluation takes one diagonalization,
+    which also gives the derivative of the exponential through the divided
+    differences of its eigenvalues.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Time-independent unperturbed Hamiltonian of the system (in MHz).
+    dm_initial : Qobj
+        Density matrix of the system just before the pulse.
+    mode : Pulses
+        Template of the pulse, as in evolve. All the modes must share the
+        same pulse time and carrier frequency, and the pulse must be square.
+    parameter : str
+        Either 'pulse_time' or 'amplitude': the parameter which is varied.
+        The amplitude is set on all the modes.
+
+    Attributes
+    ----------
+    evaluations : int
+        Number of evaluations of the propagator so far.
+    """
+
+    def __init__(self, spin: NuclearSpin | ManySpins, h_unperturbed: list[Qobj], dm_initial: Qobj, mode: Pulses,
+                 parameter: str = "pulse_time"):
+        if parameter not in CALIBRATION_PARAMETERS:
+            raise ValueError(f"The calibrated parameter must be one of {CALIBRATION_PARAMETERS}. Given: {parameter}")
+        pulse_times = np.atleast_1d(np.asarray(mode.pulse_times, dtype=float))
+        if not np.allclose(pulse_times, pulse_times[0]):
+            raise ValueError("The calibration requires all the modes of the pulse to share the same pulse time.")
+        if mode.shape != "square":
+            raise ValueError(f"The calibration requires a square pulse. Given shape: {mode.shape}")
+
+        mode = mode.copy()
+        mode.numpify()
+        # Same convention as evolve: flip the pulse for positive gamma.
+        if spin.gyro_ratio_over_2pi > 0:
+            mode.phase_add_pi()
+        h0 = Qobj(sum(h_unperturbed), dims=spin.dims)
+        self.parameter = parameter
+        self.dims = h0.dims
+        self.sense = rotation_sense(spin, h0)
+        self.omega = carrier_frequency(mode)
+        self.pulse_time = float(pulse_times[0])
+        self.rho0 = Qobj(dm_initial).full()
+        self.iz = np.real(spin.I["z"].diag())
+
+        if parameter == "amplitude":
+            # H_rot = h_static + amplitude * h_unit. Both are taken from non-zero
+            # amplitudes, since without pulse there is no rotating frame.
+            unit, double = mode.copy(), mode.copy()
+            unit.amplitudes = np.ones(mode.size)
+            double.amplitudes = 2 * np.ones(mode.size)
+            h_1 = h_rotating_frame(spin, h0, unit, 0., self.sense).full()
+            h_2 = h_rotating_frame(spin, h0, double, 0., self.sense).full()
+            self.h_static, self.h_unit = 2 * h_1 - h_2, h_2 - h_1
+        else:
+            self.h_rot = h_rotating_frame(spin, h0, mode, 0., self.sense).full()
+            self.energies, self.eigvects = np.linalg.eigh(self.h_rot)
+        self.evaluations = 0
+
+    def propagator(self, x: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the LAB frame propagator of the pulse when the parameter
+        takes the value x, and its derivative with respect to x.
+        """
+        self.evaluations += 1
+        if self.parameter == "pulse_time":
+            tau = x
+            energies, eigvects = self.energies, self.eigvects
+        else:
+            tau = self.pulse_time
+            energies, eigvects = np.linalg.eigh(self.h_static + x * self.h_unit)
+        exps = np.exp(-2j * np.pi * energies * tau)
+        u_rot = (eigvects * exps) @ eigvects.conj().T
+        # Back to the LAB frame: the rotating frame is exp(-i sense omega t Iz).
+        rotation = np.exp(-1j * self.sense * self.omega * tau * self.iz)[:, np.newaxis]
+        u = rotation * u_rot
+
+        if self.parameter == "pulse_time":
+            du = -1j * self.sense * self.omega * self.iz[:, np.newaxis] * u - 2j * np.pi * rotation * (self.h_rot @ u_rot)
+        else:
+            # Derivative of the exponential in the eigenbasis of H_rot: the
+            # divided differences of exp(-i 2 pi E tau).
+            gaps = energies[:, np.newaxis] - energies[np.newaxis, :]
+            degenerate = np.isclose(gaps, 0, atol=1e-12 * max(1., np.max(np.abs(energies))))
+            divided = np.where(degenerate, -2j * np.pi * tau * exps[:, np.newaxis],
+                               (exps[:, np.newaxis] - exps[np.newaxis, :]) / np.where(degenerate, 1., gaps))
+            h_unit = eigvects.conj().T @ self.h_unit @ eigvects
+            du = rotation * (eigvects @ (h_unit * divided) @ eigvects.conj().T)
+        return u, du
+
+    def state(self, x: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the density matrix at the end of the pulse when the parameter
+        takes the value x, and its derivative with respect to x (as arrays).
+        """
+        u, du = self.propagator(x)
+        rho = u @ self.rho0 @ u.conj().T
+        drho = du @ self.rho0 @ u.conj().T
+        return rho, drho + drho.conj().T
+
+
+@dataclass
+class Calibration:
+    """
+    Result of calibrate_pulse.
+
+    Attributes
+    ----------
+    value : float
+        Calibrated value of the parameter (pulse time in microseconds or
+        amplitude in tesla).
+    mode : Pulses
+        Copy of the template with the calibrated value.
+    parameter : str
+        Calibrated parameter ('pulse_time' or 'amplitude').
+    evaluations : int
+        Number of evaluations of the propagator taken by the calibration.
+    """
+    value: float
+    mode: Pulses
+    parameter: str
+    evaluations: int
+
+
+def calibrate_pulse(
+    spin: NuclearSpin | ManySpins,
+    h_unperturbed: list[Qobj],
+    dm_initial: Qobj,
+    mode: Pulses,
+    transition: tuple[int, int],
+    flip_angle: float = np.pi,
+    target: str = "population",
+    parameter: str = "pulse_time",
+    x_max: float | None = None,
+    n_scan: int = 16,
+    xtol: float = 1e-12,
+) -> Calibration:
+    """
+    Finds the duration (or amplitude) of a pulse which rotates a transition
+    by the given flip angle, e.g. pi and pi/2 pulses.
+
+    The transition is selected by the indices of two eigenstates of
+    h_unperturbed, sorted by increasing energy as in diagonalize_hamiltonian,
+    for NuclearSpin and ManySpins alike. Treating the transition as a
+    two-level system,
+    - with target='population', the normalized population difference
+      (p_i - p_j) / (p_i - p_j)(0) equals cos(flip_angle), or is minimal
+      when flip_angle is pi;
+    - with target='coherence', the modulus of the coherence rho_ij is
+      maximal (the flip angle is ignored: this is a pi/2 pulse).
+
+    The evolution follows the rotating-wave approximation of
+    evolve(solver='rwa') and is evaluated by a NutationModel, together with
+    its analytic derivative. The interval (0, x_max] is first scanned with
+    n_scan points to bracket the first solution, which is then refined with
+    Brent's method on either the target quantity or its derivative, so that
+    the whole calibration takes a few tens of propagator evaluations.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Time-independent unperturbed Hamiltonian of the system (in MHz).
+    dm_initial : Qobj
+        Density matrix of the system just before the pulse.
+    mode : Pulses
+        Template of the pulse, as in evolve.
+    transition : tuple(int, int)
+        Indices of the eigenstates of h_unperturbed involved in the transition.
+    flip_angle : float
+        Target flip angle (in radians), in (0, pi].
+        Default is pi.
+    target : str
+        Either 'population' or 'coherence'.
+        Default is 'population'.
+    parameter : str
+        Either 'pulse_time' or 'amplitude'.
+        Default is 'pulse_time'.
+    x_max : float
+        Upper end of the interval where the parameter is searched.
+        Default is None, i.e. the duration (or amplitude) of a full nutation
+        of a spin 1/2 with the gyromagnetic ratio of the (first) spin.
+    n_scan : int
+        Number of points of the scan which brackets the solution.
+        Default is 16.
+    xtol : float
+        Absolute tolerance on the calibrated value.
+        Default is 1e-12.
+
+    Returns
+    -------
+    A Calibration.
+
+    Raises
+    ------
+    ValueError, when the target is not reached in (0, x_max] or the
+    transition is not populated.
+    """
+    if target not in ("population", "coherence"):
+        raise ValueError("The target of the calibration must be either 'population' or 'coherence'.")
+    if target == "population" and not 0 < flip_angle <= np.pi:
+        raise ValueError("The flip angle must lie in (0, pi].")
+    model = NutationModel(spin, h_unperturbed, dm_initial, mode, parameter)
+    _, eigvects = diagonalize_hamiltonian(h_unperturbed)
+    i, j = transition
+    bra_i, bra_j = eigvects[:, i].conj(), eigvects[:, j].conj()
+
+    def population_difference(rho):
+        return np.real(bra_i @ rho @ bra_i.conj() - bra_j @ rho @ bra_j.conj())
+
+    # The objective decreases through zero at the first solution.
+    if target == "population":
+        initial = population_difference(model.rho0)
+        if np.isclose(initial, 0):
+            raise ValueError("The populations of the levels of the transition are equal: nothing to invert.")
+
+        def objective(x):
+            rho, drho = model.state(x)
+            if np.isclose(flip_angle, np.pi):
+                # The normalized population difference touches -1: find its minimum.
+                return -population_difference(drho) / initial
+            return population_difference(rho) / initial - np.cos(flip_angle)
+    else:
+        def objective(x):
+            # Derivative of |rho_ij|^2, which vanishes at its maximum.
+            rho, drho = model.state(x)
+            return 2 * np.real(np.conj(bra_i @ rho @ bra_j.conj()) * (bra_i @ drho @ bra_j.conj()))
+
+    if x_max is None:
+        spins = spin.spins if isinstance(spin, ManySpins) else [spin]
+        gamma = abs(spins[0].gyro_ratio_over_2pi)
+        if parameter == "pulse_time":
+            x_max = 1 / (gamma * np.max(np.abs(mode.amplitudes)))
+        else:
+            x_max = 1 / (gamma * model.pulse_time)
+
+    previous_x, previous = None, 0.
+    for x in np.linspace(0, x_max, n_scan + 1)[1:]:
+        current = objective(x)
+        if previous > 0 and current <= 0:
+            value = brentq(objective, previous_x, x, xtol=xtol)
+            break
+        previous_x, previous = x, current
+    else:
+        raise ValueError(f"The target was not reached for {parameter} in (0, {x_max}]: increase x_max.")
+
+    calibrated = mode.copy()
+    setattr(calibrated, "pulse_times" if parameter == "pulse_time" else "amplitudes", [value] * mode.size)
+    return Calibration(value=value, mode=calibrated, parameter=parameter, evaluations=model.evaluations)
@@ -3,12 +3,13 @@ from typing import Any, Callable
 import numpy as np
 import pandas as pd
 from numpy.typing import NDArray
-from qutip import Qobj, commutator, qeye, tensor
-from qutip.solver import Result
-from tqdm import trange
+from qutip import Qobj, coefficient, qeye, tensor
+from qutip.core.coefficient import Coefficient
 
 from .nuclear_spin import ManySpins, NuclearSpin
-from .operators import apply_exp_op, changed_picture
+from .operators import (StaticHamiltonian, apply_exp_op, changed_picture, diagonalize_hamiltonian, krylov_propagate,
+                        use_krylov)
+from .profiling import add_solver_steps, profiled, stage
 from .pulses import Pulses
 
 
@@ -253,6 +254,93 @@ def cosine_wrapper(frequency: float, phase: float, pulse_time: float) -> Callabl
     return time_dependence_function
 
 
+# Shared by all the modes: QuTiP compiles it once and only the args change.
+_PULSE_COEFFICIENT = "cos(w * t - phase) * (t <= tau)"
+_PULSE_QUADRATURE = "sin(w * t - phase) * (t <= tau)"
+
+
+def pulse_coefficient(
+    frequency: float, phase: float, pulse_time: float, tlist: NDArray | None = None, order: int = 3
+) -> Coefficient:
+    """
+    Return the time-dependent coefficient of a pulse Hamiltonian as a QuTiP
+    Coefficient, the compiled counterpart of cosine_wrapper. Unlike a Python
+    function, it is evaluated by the solvers without calling back into the
+    interpreter at every step of the integration.
+
+    Parameters
+    ----------
+    frequency : non-negative float
+        Frequency of the monochromatic wave (expressed in rad/sec).
+    phase : float
+        Initial phase of the wave (at t=0) (expressed in radians).
+    pulse_time : float
+        Time duration of the pulse (in microseconds).
+    tlist : numpy.ndarray
+        When given, the coefficient is sampled at these times (in microseconds)
+        and interpolated by an array coefficient, instead of being compiled
+        from a string.
+        Default is None.
+    order : int
+        Order of the interpolation of the array coefficient (0, 1 or 3).
+        Ignored when tlist is None.
+        Default is 3.
+
+    Returns
+    -------
+    A qutip Coefficient c, such that c(t) = cos(frequency * t - phase) for
+    t <= pulse_time and 0 otherwise.
+    """
+    if tlist is not None:
+        tlist = np.asarray(tlist, dtype=float)
+        values = np.cos(frequency * tlist - phase) * (tlist <= pulse_time)
+        return coefficient(values, tlist=tlist, order=order)
+    return coefficient(
+        _PULSE_COEFFICIENT, args={"w": float(frequency), "phase": float(phase), "tau": float(pulse_time)}
+    )
+
+
+def shaped_pulse_coefficient(mode: Pulses, i: int, n_samples: int = 1001) -> Coefficient:
+    """
+    Return the time-dependent coefficient of the i-th mode of a shaped pulse
+    (see Pulses.envelope) as a QuTiP Coefficient. The envelope is sampled
+    once into array coefficients (held constant between the samples of a
+    'sampled' pulse, cubic-interpolated otherwise), which modulate the
+    compiled carrier:
+    a(t) cos(w t - phase - phi(t)) = a cos(phi) cos(w t - phase) + a sin(phi) sin(w t - phase).
+
+    Parameters
+    ----------
+    mode : Pulses
+        Parameters of the modes of the pulse.
+    i : int
+        Index of the mode.
+    n_samples : int
+        Number of samples of an analytic envelope over the pulse time.
+        Default is 1001.
+
+    Returns
+    -------
+    A qutip Coefficient.
+    """
+    pulse_time = float(np.atleast_1d(mode.pulse_times)[i])
+    if mode.shape == "sampled":
+        tlist = np.union1d(np.asarray(mode.shape_par["times"], dtype=float), [pulse_time])
+        order = 0
+    else:
+        tlist = np.linspace(0, pulse_time, n_samples)
+        order = 3
+    a, phi = mode.envelope(tlist)
+    args = {"w": float(np.atleast_1d(mode.frequencies)[i]), "phase": float(np.atleast_1d(mode.phases)[i]),
+            "tau": pulse_time}
+    in_phase = coefficient(a[i] * np.cos(phi[i]), tlist=tlist, order=order)
+    result = in_phase * coefficient(_PULSE_COEFFICIENT, args=args)
+    if np.any(phi[i] != 0):
+        quadrature = coefficient(a[i] * np.sin(phi[i]), tlist=tlist, order=order)
+        result = result + quadrature * coefficient(_PULSE_QUADRATURE, args=args)
+    return result
+
+
 def pulse_t_independent_op(spin: NuclearSpin, B_1: float, theta_1: float, phi_1: float) -> Qobj:
     """
     Computes the time-independent portion of the Hamiltonian interaction with a
@@ -318,7 +406,7 @@ def h_single_mode_pulse(
         Time duration of the pulse
     factor_t_dependence : bool
         If true, return tuple (H, f(t)) where f(t) is the  time-dependence of
-        the Hamiltonian as a function.
+        the Hamiltonian as a compiled QuTiP coefficient (see pulse_coefficient).
         Does not evaluate f(t) at the given time.
 
     Returns
@@ -335,12 +423,12 @@ def h_single_mode_pulse(
     # must be a positive quantity")
     if B_1 < 0:
         raise ValueError("The amplitude of the electromagnetic wave must be positive.")
-    # Notice the following does not depend on spin
-    t_dependence = cosine_wrapper(frequency, phase, pulse_time)  # this variable is a function!
     h_t_independent = pulse_t_independent_op(spin, B_1, theta_1, phi_1)
     if factor_t_dependence:
-        return Qobj(h_t_independent), t_dependence
+        return Qobj(h_t_independent), pulse_coefficient(frequency, phase, pulse_time)
     else:
+        # Notice the following does not depend on spin
+        t_dependence = cosine_wrapper(frequency, phase, pulse_time)  # this variable is a function!
         # Need pass empty list because of QuTiP compatability necessary
         # arguments of t_dependence; `args` argument functionless
         return Qobj((t_dependence(t, []) * h_t_independent))
@@ -381,9 +469,13 @@ def h_multiple_mode_pulse(
 
     factor_t_dependence : bool
     If true, return tuple (H, f(t)) where f(t) is the
-    time-dependence of the Hamiltonian as a function.
+    time-dependence of the Hamiltonian as a compiled QuTiP coefficient
+    (see pulse_coefficient).
     Does not evaluate f(t) at the given time.
 
+    Shaped pulses (mode.shape other than 'square') follow Pulses.envelope,
+    and their coefficients are those of shaped_pulse_coefficient.
+
     Returns
     -------
     A Qobj which represents the Hamiltonian of the coupling with
@@ -404,22 +496,15 @@ def h_multiple_mode_pulse(
         mode_hamiltonians = []
         if isinstance(spin, ManySpins):
             for i in range(mode.size):
-                t_dependence = cosine_wrapper(omegas[i], phases[i], pulse_times[i])
-                h_t_independent = Qobj(np.zeros((spin.d, spin.d)), dims=dims)
+                t_dependence = pulse_coefficient(omegas[i], phases[i], pulse_times[i])
+                h_t_independent = spin.zero_operator()
 
                 # Construct tensor product of operators acting on each spin.
                 # Take a tensor product where every operator except the nth
                 # is the identity, add those together
                 for n in range(spin.n_spins):
                     term = pulse_t_independent_op(spin.spins[n], amplitudes[i], thetas[i], phis[i])
-                    ops = []
-                    for m in range(spin.n_spins):
-                        if m == n:
-                            ops.append(term)
-                        else:
-                            ops.append(qeye(spin.spins[m].d))
-                    term_n = tensor(ops)
-                    h_t_independent += term_n
+                    h_t_independent += spin.embed(term, n)
 
                 # Append total hamiltonian for this mode to mode_hamiltonians
                 mode_hamiltonians.append([Qobj(h_t_independent), t_dependence])
@@ -443,10 +528,18 @@ def h_multiple_mode_pulse(
                 # for a simple pulse in the transverse plane: [(-gamma/2pi * B1 * Ix, 'time_dependence_function'
                 # (which returns cos(w0*t)))]
 
+        if mode.shape != "square":
+            mode_hamiltonians = [[h, shaped_pulse_coefficient(mode, i)] for i, (h, _) in enumerate(mode_hamiltonians)]
         return mode_hamiltonians
+    elif mode.shape != "square":
+        envelopes = pulse_envelopes(mode, [t])[:, 0]
+        h_pulse = spin.zero_operator() if isinstance(spin, ManySpins) else Qobj(np.zeros((spin.d, spin.d)), dims=dims)
+        for envelope, (h, _) in zip(envelopes, h_multiple_mode_pulse(spin, mode, t, factor_t_dependence=True)):
+            h_pulse += envelope * h
+        return Qobj(h_pulse)
     else:
-        h_pulse = Qobj(np.zeros((spin.d, spin.d)), dims=dims)
         if isinstance(spin, ManySpins):
+            h_pulse = spin.zero_operator()
             for i in range(mode.size):
                 # Construct tensor product of operators acting on each spin.
                 # Take a tensor product where every operator except the nth
@@ -463,15 +556,9 @@ def h_multiple_mode_pulse(
                         pulse_times[i],
                         factor_t_dependence=False,
                     )
-                    ops = []
-                    for m in range(spin.n_spins):
-                        if m == n:
-                            ops.append(term)
-                        else:
-                            ops.append(qeye(spin.spins[m].d))
-                    term_n = tensor(ops)
-                    h_pulse += term_n
+                    h_pulse += spin.embed(term, n)
         elif isinstance(spin, NuclearSpin):
+            h_pulse = Qobj(np.zeros((spin.d, spin.d)), dims=dims)
             for i in range(mode.size):
                 h_pulse += h_single_mode_pulse(
                     spin,
@@ -490,7 +577,12 @@ def h_multiple_mode_pulse(
 # Global Hamiltonian of the system (stationary term + pulse term) cast in the picture generated by
 # the Operator h_change_of_picture
 def h_changed_picture(
-    spin: NuclearSpin | ManySpins, mode: Pulses, h_unperturbed: Qobj, h_change_of_picture: Qobj, t: float
+    spin: NuclearSpin | ManySpins,
+    mode: Pulses,
+    h_unperturbed: Qobj,
+    h_change_of_picture: Qobj,
+    t: float,
+    backend: str = "dense",
 ) -> Qobj:
     """
     Returns the global Hamiltonian of the system, made up of the time-dependent
@@ -505,6 +597,9 @@ def h_changed_picture(
         Stationary term of the global Hamiltonian (in MHz).
     h_change_of_picture : Qobj
         Operator which generates the new picture (in MHz).
+    backend : str
+        Either 'dense', 'krylov' or 'auto' (see operators.use_krylov).
+        Default is 'dense'.
 
     Returns
     -------
@@ -512,7 +607,7 @@ def h_changed_picture(
     time t in the new picture (in MHz).
     """
     h_pulse = h_multiple_mode_pulse(spin, mode, t)
-    h_cp = changed_picture(h_unperturbed + h_pulse - h_change_of_picture, h_change_of_picture, t)
+    h_cp = changed_picture(h_unperturbed + h_pulse - h_change_of_picture, h_change_of_picture, t, backend=backend)
     return Qobj(h_cp)
 
 
@@ -547,6 +642,222 @@ def h_changed_picture_func(
     return func
 
 
+def secular_part(h: Qobj, spin: NuclearSpin | ManySpins) -> Qobj:
+    """
+    Returns the secular part of an operator with respect to the z component of
+    the total spin, i.e. the part which commutes with it. Since Iz is diagonal
+    in the basis of the spin operators, this amounts to keeping the matrix
+    elements between states with the same total magnetic quantum number.
+
+    Parameters
+    ----------
+    h : Qobj
+        Operator acting on the Hilbert space of spin.
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+
+    Returns
+    -------
+    A Qobj representing the secular part of h.
+    """
+    m = np.real(spin.I["z"].diag())
+    same_m = np.isclose(m[:, None], m[None, :])
+    return Qobj(h.full() * same_m, dims=h.dims)
+
+
+def rotation_sense(spin: NuclearSpin | ManySpins, h_unperturbed: Qobj) -> int:
+    """
+    Returns the sense (+1 or -1) of the rotation about the z axis of the frame
+    co-rotating with the spins: the sense of the Larmor precession of the
+    linear-in-Iz part of the secular Hamiltonian. When this part vanishes
+    (e.g. pure NQR) +1 is returned.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : Qobj
+        Unperturbed Hamiltonian of the system (in MHz).
+
+    Returns
+    -------
+    An int, either +1 or -1.
+    """
+    i_z = spin.I["z"]
+    larmor = np.real((h_unperturbed * i_z).tr()) / np.real((i_z * i_z).tr())
+    return -1 if larmor < 0 else 1
+
+
+def pulse_rotating_frame_op(
+    spin: NuclearSpin, B_1: float, phase: float, theta_1: float, phi_1: float, sense: int = 1
+) -> Qobj:
+    """
+    Computes the secular part of the interaction with a monochromatic and
+    linearly polarized pulse (see h_single_mode_pulse) in the reference frame
+    rotating about z with the carrier frequency, in the sense given by
+    `sense`. Only the co-rotating component of the transverse field survives
+    the rotating-wave approximation, with half of the amplitude of the
+    linearly polarized wave, while the longitudinal component averages out.
+
+    Parameters
+    ----------
+    spin : NuclearSpin
+        Spin under study.
+    B_1 : non-negative float
+        Maximum amplitude of the oscillating magnetic field (expressed in tesla).
+    phase : float
+        Initial phase of the wave (at t=0) (expressed in radians).
+    theta_1, phi_1 : float
+        Polar and azimuthal angles of the direction of polarization of the
+        magnetic wave in the LAB frame (expressed in radians).
+    sense : int
+        Sense (+1 or -1) of the rotation of the frame about the z axis.
+
+    Returns
+    -------
+    A time-independent Qobj (expressed in MHz).
+    """
+    angle = phi_1 - sense * phase
+    return Qobj(
+        -spin.gyro_ratio_over_2pi * B_1 * np.sin(theta_1) * (np.cos(angle) * spin.I["x"] + np.sin(angle) * spin.I["y"])
+    )
+
+
+def h_rotating_frame(
+    spin: NuclearSpin | ManySpins, h_unperturbed: Qobj, mode: Pulses, t: float, sense: int = 1
+) -> Qobj:
+    """
+    Returns the Hamiltonian of the system in the frame rotating about the z
+    axis at the common carrier frequency of the modes in `mode`, within the
+    rotating-wave approximation: the secular part of h_unperturbed, minus the
+    frame frequency times the total Iz, plus the secular pulse terms of the
+    modes which are on at time t. The result is time-independent between two
+    successive switch-off times of the modes (for shaped pulses, the
+    amplitudes and phases of the modes at time t are used, see
+    Pulses.instantaneous). When the carrier frequency vanishes, the exact
+    (static) Hamiltonian is returned instead.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : Qobj
+        Unperturbed Hamiltonian of the system (in MHz).
+    mode : Pulses
+        Parameters of the electromagnetic modes of the pulse. All the modes with
+        non-zero amplitude must share the same frequency.
+    t : float
+        Time (in microseconds) at which the set of active modes is evaluated
+        (a mode is active when t <= its pulse time).
+    sense : int
+        Sense (+1 or -1) of the rotation of the frame, see rotation_sense.
+
+    Returns
+    -------
+    A Qobj representing the rotating-frame Hamiltonian (in MHz).
+
+    Raises
+    ------
+    ValueError, when the modes have different carrier frequencies.
+    """
+    return Qobj(rwa_hamiltonians(spin, h_unperturbed, [mode], [t], sense)[0], dims=Qobj(h_unperturbed).dims)
+
+
+def _unit_pulse_operators(spin: NuclearSpin | ManySpins, theta: float, phi: float) -> tuple:
+    """
+    Returns, as arrays, the operators X and Y such that the rotating-frame
+    pulse term per unit amplitude of a mode polarized along (theta, phi) is
+    cos(a) X + sin(a) Y, with a = phi - sense * phase (see
+    pulse_rotating_frame_op), and the LAB frame operator per unit amplitude
+    of a static field along the same direction (see pulse_t_independent_op).
+    """
+    spins = spin.spins if isinstance(spin, ManySpins) else [spin]
+    x, y, z = 0, 0, 0
+    for n, s in enumerate(spins):
+        terms = (pulse_rotating_frame_op(s, 1., 0., theta, 0.),
+                 pulse_rotating_frame_op(s, 1., 0., theta, np.pi / 2),
+                 pulse_t_independent_op(s, 1., theta, phi))
+        if isinstance(spin, ManySpins):
+            terms = tuple(spin.embed(term, n) for term in terms)
+        x, y, z = (acc + Qobj(term).full() for acc, term in zip((x, y, z), terms))
+    return x, y, z
+
+
+def rwa_hamiltonians(
+    spin: NuclearSpin | ManySpins, h_unperturbed: Qobj, modes: list[Pulses], times: NDArray, sense: int = 1
+) -> NDArray:
+    """
+    Evaluates h_rotating_frame(spin, h_unperturbed, modes[k], times[k], sense)
+    for all k at once. The operators shared by the pulses (the secular part of
+    h_unperturbed and the pulse terms per unit amplitude) are built only once,
+    and the Hamiltonians are assembled as a stack of arrays.
+
+    Parameters
+    ----------
+    spin, h_unperturbed, sense :
+        same meaning as the corresponding arguments of h_rotating_frame.
+    modes : List[Pulses]
+        Pulses in whose rotating frame (at their carrier frequency) each
+        Hamiltonian is computed. They must all have the same number of modes.
+    times : array_like
+        Time (in microseconds) at which each Hamiltonian is evaluated.
+
+    Returns
+    -------
+    A numpy.ndarray of shape (len(modes), d, d) with the Hamiltonians (in MHz).
+
+    Raises
+    ------
+    ValueError, when the modes of a pulse have different carrier frequencies.
+    """
+    h0 = Qobj(h_unperturbed)
+    h_full = h0.full()
+    h_secular = secular_part(h0, spin).full()
+    m = np.real(spin.I["z"].diag())
+    times = np.asarray(times, dtype=float)
+
+    nus = np.array([carrier_frequency(mode) for mode in modes]) / (2 * np.pi)
+    # The frame keeps the carrier even where the envelope of a shaped pulse vanishes.
+    modes = [mode if mode.shape == "square" else mode.instantaneous(t) for mode, t in zip(modes, times)]
+    amplitudes, phases, theta_p, phi_p, pulse_times = (
+        np.array([np.atleast_1d(np.asarray(getattr(mode, field), dtype=float)) for mode in modes])
+        for field in ("amplitudes", "phases", "theta_p", "phi_p", "pulse_times")
+    )
+    rotating = nus != 0
+    weights = amplitudes * (times[:, np.newaxis] <= pulse_times)
+
+    # Static fields: no rotating frame and no approximation.
+    h = np.where(rotating[:, np.newaxis, np.newaxis], h_secular - sense * nus[:, np.newaxis, np.newaxis] * np.diag(m),
+                 h_full).astype(complex)
+    angles = phi_p - sense * phases
+    for theta, phi in set(zip(theta_p.ravel().tolist(), phi_p.ravel().tolist())):
+        w = weights * ((theta_p == theta) & (phi_p == phi))
+        x, y, z = _unit_pulse_operators(spin, theta, phi)
+        c_x = np.sum(w * np.cos(angles), axis=1) * rotating
+        c_y = np.sum(w * np.sin(angles), axis=1) * rotating
+        c_z = np.sum(w * np.cos(phases), axis=1) * ~rotating
+        h += c_x[:, np.newaxis, np.newaxis] * x + c_y[:, np.newaxis, np.newaxis] * y \
+            + c_z[:, np.newaxis, np.newaxis] * z
+    return h
+
+
+def carrier_frequency(mode: Pulses) -> float:
+    """
+    Returns the frequency (in rad/sec) shared by all the modes of `mode` with
+    non-zero amplitude, or 0 if all the amplitudes vanish.
+
+    Raises
+    ------
+    ValueError, when the modes have different frequencies.
+    """
+    frequencies = np.asarray(mode.frequencies, dtype=float)[np.asarray(mode.amplitudes, dtype=float) != 0]
+    if len(frequencies) == 0:
+        return 0.0
+    if not np.allclose(frequencies, frequencies[0], rtol=1e-12, atol=0):
+        raise ValueError("The rotating frame requires all the modes of the pulse to have the same frequency.")
+    return float(frequencies[0])
+
+
 def h_j_coupling(spins: ManySpins, j_matrix: NDArray) -> Qobj:
     """
     Returns the term of the Hamiltonian describing the J-coupling between the
@@ -571,25 +882,13 @@ def h_j_coupling(spins: ManySpins, j_matrix: NDArray) -> Qobj:
     A Qobj acting on the full Hilbert space of the spins' system
     representing the Hamiltonian of the J-coupling between the spins.
     """
-    # dimensions of vector inputs to tensor; should be same as dual vector
-    # inputs, i.e., tensor valence/rank should be (r, k) with r = k. equiv.
-    # to matrix being square.
-    dims = spins.dims
-    h_j = Qobj(np.zeros((spins.d, spins.d)), dims=dims)
+    h_j = spins.zero_operator()
 
     # row
     for m in range(j_matrix.shape[0]):
         # column
         for n in range(m):
-            term_nm = j_matrix[n, m] * spins.spins[n].I["z"]
-            for l in range(n):
-                term_nm = tensor(qeye(spins.spins[l].d), term_nm)
-            for k in range(m)[n + 1 :]:
-                term_nm = tensor(term_nm, qeye(spins.spins[k].d))
-            term_nm = tensor(term_nm, spins.spins[m].I["z"])
-            for j in range(spins.n_spins)[m + 1 :]:
-                term_nm = tensor(term_nm, qeye(spins.spins[j].d))
-
+            term_nm = spins.embed({n: j_matrix[n, m] * spins.spins[n].I["z"], m: spins.spins[m].I["z"]})
             h_j = h_j + term_nm
 
     return h_j
@@ -761,15 +1060,201 @@ def h_tensor_coupling(spins: ManySpins, t: NDArray) -> Qobj:
     spin_1_ops = [spins.spins[1].I[key] for key in ["x", "y", "z"]]
 
     # Initialize empty operator of appropriate dimension as base case for the for loop.
-    h = Qobj(np.zeros((spins.d, spins.d)), dims=spins.dims)
+    h = spins.zero_operator()
 
     for m, op_1 in enumerate(spin_0_ops):
         for n, op_2 in enumerate(spin_1_ops):
-            h += t[m, n] * tensor(op_1, op_2)
+            h += t[m, n] * spins.embed({0: op_1, 1: op_2})
     return h
 
 
 # TODO: Better way to calculate Magnus terms...
+def pulse_envelopes(mode: Pulses, tlist: NDArray) -> NDArray:
+    """
+    Evaluates the time dependence of every mode of a pulse at all the given
+    instants at once, i.e. the values of cosine_wrapper (and
+    pulse_coefficient) for each mode, multiplied by the envelope of shaped
+    pulses (see Pulses.envelope).
+
+    Parameters
+    ----------
+    mode : Pulses
+        Parameters of the modes of the pulse (see h_multiple_mode_pulse).
+    tlist : numpy.ndarray
+        Times of evaluation (in microseconds).
+
+    Returns
+    -------
+    A numpy.ndarray of shape (number of modes, len(tlist)) whose element
+    [m, k] is a_m(t_k) cos(frequency_m * t_k - phase_m - phi_m(t_k)) if
+    t_k <= pulse_time_m and 0 otherwise (a = 1 and phi = 0 for square pulses).
+    """
+    tlist = np.asarray(tlist, dtype=float)
+    omegas = np.asarray(mode.frequencies, dtype=float)[:, np.newaxis]
+    phases = np.asarray(mode.phases, dtype=float)[:, np.newaxis]
+    pulse_times = np.asarray(mode.pulse_times, dtype=float)[:, np.newaxis]
+    if mode.shape != "square":
+        a, phi = mode.envelope(tlist)
+        return a * np.cos(omegas * tlist - phases - phi)
+    return np.cos(omegas * tlist - phases) * (tlist <= pulse_times)
+
+
+def picture_change_terms(
+    spin: NuclearSpin | ManySpins, mode: Pulses, h_unperturbed: Qobj, h_change_of_picture: Qobj
+) -> tuple[NDArray, NDArray, NDArray, NDArray]:
+    """
+    Diagonalizes the generator of a change of picture and expresses in its
+    eigenbasis the time-independent operators which make up the global
+    Hamiltonian in the new picture (see picture_change_hamiltonians). The
+    Krylov backend of magnus skips this dense diagonalization (see
+    krylov_picture_change_hamiltonians).
+
+    Parameters
+    ----------
+    spin, mode :
+        same meaning as the corresponding arguments of h_multiple_mode_pulse.
+    h_unperturbed : Qobj
+        Stationary term of the global Hamiltonian (in MHz).
+    h_change_of_picture : Qobj or StaticHamiltonian
+        Operator which generates the new picture (in MHz). The memoized
+        eigendecomposition of a StaticHamiltonian is reused.
+
+    Returns
+    -------
+    A tuple (eigvals, eigvecs, h_static, h_modes), where eigvals and eigvecs
+    are the eigenvalues and eigenvectors of h_change_of_picture, h_static is
+    h_unperturbed - h_change_of_picture and h_modes is the array of the
+    time-independent operators of the modes of the pulse, both in the
+    eigenbasis.
+    """
+    eigvals, eigvecs = diagonalize_hamiltonian(h_change_of_picture)
+    if isinstance(h_change_of_picture, StaticHamiltonian):
+        h_change_of_picture = h_change_of_picture.total
+    eigvecs_dag = eigvecs.conj().T
+    h_static = eigvecs_dag @ Qobj(h_unperturbed - h_change_of_picture).full() @ eigvecs
+    h_modes = np.array(
+        [eigvecs_dag @ Qobj(term[0]).full() @ eigvecs
+         for term in h_multiple_mode_pulse(spin, mode, 0, factor_t_dependence=True)]
+    ).reshape(-1, *h_static.shape)
+    return eigvals, eigvecs, h_static, h_modes
+
+
+def picture_change_hamiltonians(
+    eigvals: NDArray, h_static: NDArray, h_modes: NDArray, mode: Pulses, tlist: NDArray
+) -> NDArray:
+    """
+    Evaluates the global Hamiltonian in the new picture at all the given
+    times, in the eigenbasis of the generator of the picture, where the
+    change of picture only multiplies each matrix element by a phase.
+
+    Parameters
+    ----------
+    eigvals, h_static, h_modes :
+        as returned by picture_change_terms.
+    mode : Pulses
+        Parameters of the modes of the pulse.
+    tlist : numpy.ndarray
+        Times of evaluation (in microseconds).
+
+    Returns
+    -------
+    A numpy.ndarray of shape (len(tlist), d, d) (in MHz).
+    """
+    tlist = np.asarray(tlist, dtype=float)
+    h = np.broadcast_to(h_static, (len(tlist), *h_static.shape))
+    if len(h_modes):
+        h = h + np.tensordot(pulse_envelopes(mode, tlist).T, h_modes, axes=1)
+    gaps = eigvals[:, np.newaxis] - eigvals[np.newaxis, :]
+    return np.exp(2j * np.pi * tlist[:, np.newaxis, np.newaxis] * gaps) * h
+
+
+def krylov_picture_change_hamiltonians(
+    spin: NuclearSpin | ManySpins, mode: Pulses, h_unperturbed: Qobj, h_change_of_picture: Qobj, tlist: NDArray
+) -> NDArray:
+    """
+    Same as h_changed_picture_array, but without diagonalizing the generator
+    of the picture: each time-independent operator X of the global
+    Hamiltonian is carried to the new picture by stepping
+    exp(i 2 pi A t) X exp(-i 2 pi A t) through tlist with Krylov
+    expm_multiply (see operators.krylov_propagate), which only needs products
+    of the (sparse) generator A with vectors.
+
+    Parameters
+    ----------
+    spin, mode, h_unperturbed, h_change_of_picture, tlist :
+        same meaning as the corresponding arguments of h_changed_picture_array.
+
+    Returns
+    -------
+    A numpy.ndarray of shape (len(tlist), d, d) with the Hamiltonian in the
+    new picture at each time (in MHz).
+    """
+    tlist = np.asarray(tlist, dtype=float)
+    if isinstance(h_change_of_picture, StaticHamiltonian):
+        h_change_of_picture = h_change_of_picture.total
+    h_change_of_picture = Qobj(h_change_of_picture)
+    terms = [Qobj(h_unperturbed - h_change_of_picture)] + \
+        [Qobj(term[0]) for term in h_multiple_mode_pulse(spin, mode, 0, factor_t_dependence=True)]
+    # krylov_propagate evolves under -A, i.e. yields exp(i 2 pi A t) X exp(-i 2 pi A t).
+    rotated = [np.array(list(krylov_propagate(term, -h_change_of_picture, tlist))) for term in terms]
+    h = rotated[0]
+    if len(terms) > 1:
+        h = h + np.einsum("mk,mkij->kij", pulse_envelopes(mode, tlist), np.array(rotated[1:]))
+    return h
+
+def h_changed_picture_array(
+    spin: NuclearSpin | ManySpins, mode: Pulses, h_unperturbed: Qobj, h_change_of_picture: Qobj, tlist: NDArray
+) -> NDArray:
+    """
+    Returns the global Hamiltonian of the system, made up of the pulse term
+    and the stationary term h_unperturbed, cast in the picture generated by
+    `h_change_of_picture` at all the times in tlist at once. The generator is
+    diagonalized once, so that the change of picture at each time costs a
+    product by a matrix of phases instead of two exponentiations.
+
+    Unlike h_changed_picture, the change of picture follows the usual
+    convention of the interaction picture, i.e. the Hamiltonian at time t is
+    exp(i 2 pi A t) (H(t) - A) exp(-i 2 pi A t), with A = h_change_of_picture.
+
+    Parameters
+    ----------
+    spin, mode :
+        same meaning as the corresponding arguments of h_multiple_mode_pulse.
+    h_unperturbed : Qobj
+        Stationary term of the global Hamiltonian (in MHz).
+    h_change_of_picture : Qobj
+        Operator which generates the new picture (in MHz).
+    tlist : numpy.ndarray
+        Times of evaluation (in microseconds).
+
+    Returns
+    -------
+    A numpy.ndarray of shape (len(tlist), d, d) with the Hamiltonian in the
+    new picture at each time (in MHz).
+    """
+    eigvals, eigvecs, h_static, h_modes = picture_change_terms(spin, mode, h_unperturbed, h_change_of_picture)
+    h = picture_change_hamiltonians(eigvals, h_static, h_modes, mode, tlist)
+    return eigvecs @ h @ eigvecs.conj().T
+
+
+def _commutator(a: NDArray, b: NDArray) -> NDArray:
+    return a @ b - b @ a
+
+
+def _trapezoid_weights(tlist: NDArray) -> NDArray:
+    steps = np.diff(tlist)
+    weights = np.zeros(len(tlist))
+    weights[:-1] += steps / 2
+    weights[1:] += steps / 2
+    return weights
+
+
+# Bound on the memory taken by the arrays of Hamiltonians built at once by
+# magnus (in bytes).
+MAGNUS_CHUNK_BYTES = 2 ** 27
+
+
+@profiled("magnus")
 def magnus(
     h_total: Qobj,
     rho0: Qobj,
@@ -778,11 +1263,24 @@ def magnus(
     spin: NuclearSpin,
     mode: pd.DataFrame,
     o_change_of_picture: Qobj,
-) -> Result:
+    backend: str = "dense",
+) -> Qobj:
     """
     Magnus expansion solver, up to 3rd order.
     Integration by the trapezoid rule.
 
+    The Hamiltonians in the new picture at all the times in tlist are built
+    as arrays (see h_changed_picture_array), in chunks of at most
+    MAGNUS_CHUNK_BYTES bytes. The nested integrals of the 2nd and 3rd order
+    terms are reduced to single integrals of the cumulative integral
+    B(t) = int_0^t H(t') dt' of the Hamiltonian:
+
+        Omega_2 ~ int_0^T [H(t), B(t)] dt,
+        Omega_3 ~ int_0^T ([B(T) - B(t), [H(t), B(t)]]
+                           + [B(t), [H(t), B(T) - B(t)]]) dt,
+
+    so that all the orders cost O(len(tlist)) matrix products.
+
     Parameters
     ----------
     h_total : Qobj
@@ -800,82 +1298,81 @@ def magnus(
         Spin under study.
     mode : pandas.DataFrame
         Table of the parameters of each electromagnetic mode in the pulse.
-    o_change_of_picture : Qobj
+    o_change_of_picture : Qobj or StaticHamiltonian
         Operator which generates the change to the new picture.
+    backend : str
+        Either 'dense', 'krylov' or 'auto' (see operators.use_krylov). With
+        the Krylov backend, neither the generator of the picture is
+        diagonalized (see krylov_picture_change_hamiltonians) nor the final
+        exponential is formed. The Hamiltonians in the new picture and the
+        terms of the expansion are still dense d x d arrays.
+        Default is 'dense'.
 
     Returns
     -------
-    qutip.Result instance with the evolved density matrix.
+    The evolved density matrix at time tlist[-1], in the new picture.
     """
     if order > 3:
         raise ValueError("Magnus expansion solver does not support order > 3. " + f"Given order {order}.")
 
-    #output = Result()
-    #output.times = tlist
-    #output.solver = "magnus"
-    time_step = (tlist[-1] - tlist[0]) / (len(tlist) - 1)
-    h = []
-    integral = 0
-    for t in trange(len(tlist)):
-        H = h_changed_picture(spin, mode, h_total, o_change_of_picture, tlist[t])
-        # Trapezoid Rule
-        factor = 1
-        if t == 0 or t == len(tlist) - 1:
-            factor *= 1
-        else:
-            factor *= 2
-
-        integral += factor * H * 2j * np.pi * time_step / 2
-
-        if order >= 2:
-            h.append(H)
-            for t2 in range(t + 1):
-                factor = 1
-
-                if t == 0 or t == len(tlist) - 1:
-                    factor *= 1
-                else:
-                    factor *= 2
-
-                if t2 == 0 or t2 == t:
-                    factor *= 1
-                else:
-                    factor *= 2
-
-                integral += factor * commutator(h[t], h[t2]) * ((2 * np.pi * time_step) ** 2) * (1 / 2)
-
-            # TODO: is this supposed to be inside the for loop? It's weird to reference `t2` outside the loop.
+    tlist = np.asarray(tlist, dtype=float)
+    d = rho0.shape[0]
+    krylov = use_krylov(backend, d)
+    if not krylov:
+        with stage("picture_change"):
+            eigvals, eigvecs, h_static, h_modes = picture_change_terms(spin, mode, h_total, o_change_of_picture)
+    weights = _trapezoid_weights(tlist)
+    # steps[k] = t_k - t_(k-1), with steps[0] = 0.
+    steps = np.diff(tlist, prepend=tlist[0])
+    # Several (chunk, d, d) arrays are alive at once.
+    chunk = max(1, MAGNUS_CHUNK_BYTES // (16 * 6 * d * d))
+    chunks = [slice(start, min(start + chunk, len(tlist))) for start in range(0, len(tlist), chunk)]
+
+    def hamiltonians(s):
+        with stage("picture_change"):
+            if krylov:
+                return krylov_picture_change_hamiltonians(spin, mode, h_total, o_change_of_picture, tlist[s])
+            return picture_change_hamiltonians(eigvals, h_static, h_modes, mode, tlist[s])
+
+    # integral_1 = B(T) is needed in advance by the 3rd order, which takes an additional pass.
+    integral_1 = np.zeros((d, d), dtype=complex)
+    if order >= 3:
+        for s in chunks:
+            integral_1 += np.tensordot(weights[s], hamiltonians(s), axes=1)
+    integral_2 = np.zeros((d, d), dtype=complex)
+    integral_3 = np.zeros((d, d), dtype=complex)
+    b_last = np.zeros((d, d), dtype=complex)
+    h_last = None
+    for s in chunks:
+        h = hamiltonians(s)
+        with stage("integration"):
+            w = weights[s]
+            if order < 3:
+                integral_1 += np.tensordot(w, h, axes=1)
+            if order < 2:
+                continue
+            # Cumulative trapezoid rule: B(t_k) at the times of the chunk.
+            h_previous = np.concatenate([h[:1] if h_last is None else h_last[np.newaxis], h[:-1]])
+            b = b_last + np.cumsum((h_previous + h) * (steps[s, np.newaxis, np.newaxis] / 2), axis=0)
+            hb = _commutator(h, b)
+            integral_2 += np.tensordot(w, hb, axes=1)
             if order >= 3:
-                for t3 in range(1, t2 + 1):
-                    factor = 1
-
-                    if t == 0 or t == len(tlist) - 1:
-                        factor *= 1
-                    else:
-                        factor *= 2
-
-                    if t2 == 0 or t2 == t:
-                        factor *= 1
-                    else:
-                        factor *= 2
-
-                    if t3 == 0 or t3 == t2:
-                        factor *= 1
-                    else:
-                        factor *= 2
-
-                    integral += (
-                        factor
-                        * (commutator(h[t], commutator(h[t2], h[t3])) + commutator(h[t3], commutator(h[t2], h[t])))
-                        * ((2 * np.pi * time_step) ** 3)
-                        * (-1j / 6)
-                    )
-
-    # dm_evolved_new_picture = rho0.transform((- integral).expm())
-    # dm_evolved_new_picture = (- integral).expm() * rho0 * ((- integral).expm()).dag()
-    dm_evolved_new_picture = apply_exp_op(rho0, -integral)
-    #output.states = [rho0, dm_evolved_new_picture]
-    #return output
+                rest = integral_1 - b
+                integral_3 += np.tensordot(w, _commutator(rest, hb) + _commutator(b, _commutator(h, rest)), axes=1)
+            h_last, b_last = h[-1], b[-1]
+
+    omega = -2j * np.pi * integral_1
+    if order >= 2:
+        omega += (-2j * np.pi) ** 2 / 2 * integral_2
+    if order >= 3:
+        omega += (-2j * np.pi) ** 3 / 6 * integral_3
+
+    add_solver_steps(len(tlist))
+    with stage("exponentiation"):
+        if not krylov:
+            omega = eigvecs @ omega @ eigvecs.conj().T
+        omega = Qobj(omega, dims=rho0.dims)
+        dm_evolved_new_picture = apply_exp_op(rho0, omega, backend=backend)
     return dm_evolved_new_picture
 
 
@@ -957,10 +1454,8 @@ def make_h_unperturbed(
     for i in range(n_spins):
         
         h_i = h_quad[i] + h_zeem[i]
-        for j in range(i):
-            h_i = tensor(qeye(spin_system.spins[j].d), h_i)
-        for k in range(n_spins)[i + 1:]:
-            h_i = tensor(h_i, qeye(spin_system.spins[k].d))
+        if isinstance(spin_system, ManySpins):
+            h_i = spin_system.embed(h_i, i)
         h_unperturbed = h_unperturbed + [Qobj(h_i)]
 
     if j_matrix is not None:
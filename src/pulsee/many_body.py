@@ -2,7 +2,7 @@ import numpy as np
 from qutip import Qobj
 
 
-def partial_trace(operator : Qobj, subspaces_dimensions : list, index_positions : int):
+def partial_trace(operator : Qobj, subspaces_dimensions : list, index_positions : int | list[int]):
     """
     Legacy wrapper for pulsee.many_body.ptrace_subspace.
 
@@ -26,7 +26,8 @@ def partial_trace(operator : Qobj, subspaces_dimensions : list, index_positions
     return ptrace_subspace(operator, subspaces_dimensions, index_positions)
 
 
-def ptrace_subspace(operator : Qobj, subspaces_dimensions : list, index_position : int):
+def ptrace_subspace(operator : Qobj | list[Qobj] | np.ndarray, subspaces_dimensions : list,
+                    index_position : int | list[int]):
     """
     Returns the partial trace of an operator over the specified subspace of the Hilbert space.
     Different from QuTip.Qobj.ptrace() in that it *traces over* the given subspace as opposed to *keeping* the given subspace.
@@ -35,46 +36,51 @@ def ptrace_subspace(operator : Qobj, subspaces_dimensions : list, index_position
     Parameters
     ----------
 
-    - operator: Qobj
-                Operator to be sliced through the partial trace operation.
+    - operator: Qobj, list of Qobj or numpy.ndarray
+                Operator to be sliced through the partial trace operation. A list of Qobj (e.g. the states
+                of a system at successive times) or an array of shape (..., D, D) is traced in a single pass.
     - subspaces_dimensions: list
                             List of the dimensions of the subspaces whose direct sum is the Hilbert space where operator acts.
-    - index_position: int
+    - index_position: int or list of int
                       Indicates the subspace over which the partial trace of operator is to be taken by referring to the corresponding position along the list subspace_dimensions.
+                      When a list is passed, all the corresponding subspaces are traced over at once.
+
+    Action
+    ------
+    The matrix is reshaped into a tensor with one row and one column index per subspace, e.g.
+    (d_up, d_i, d_down, d_up, d_i, d_down), and the row and column indices of the traced subspaces
+    are contracted with a single call to numpy.einsum.
 
     Returns
     -------
-    There are 3 possibilities:
-    1. If operator belongs to type DensityMatrix, the function returns a DensityMatrix object representing the desired partial trace;
-    2. If operator belongs to type Observable, the function returns a Observable object representing the desired partial trace;
-    3. Otherwise, the function returns a generic Operator object representing the desired partial trace.
+    A Qobj representing the desired partial trace when operator is a Qobj, a list of Qobj when it is a
+    list of Qobj, and an array of shape (..., D', D') otherwise, where D' is the product of the dimensions
+    of the subspaces which are not traced over.
     """
-
-    m = operator.full()
-    d = subspaces_dimensions
-
+    d = [int(d_k) for d_k in subspaces_dimensions]
     n = len(d)
-    i = index_position
-
-    d_downhill = int(np.prod(d[i + 1:n]))
-
-    d_block = d[i] * d_downhill
-
-    d_uphill = int(np.prod(d[0:i]))
-
-    ptrace_subspace = np.empty(
-        (d_downhill, d_downhill * (d_uphill + 1)), dtype=np.ndarray)
-    for j in range(d_uphill):
-        p_t_row = np.empty((d_downhill, d_downhill), dtype=np.ndarray)
-        for k in range(d_uphill):
-            block = m[j * d_block:(j + 1) * d_block, k *
-                                                     d_block: (k + 1) * d_block]
-            p_t_block = np.zeros((d_downhill, d_downhill))
-            for l in range(d[i]):
-                p_t_block = p_t_block + block[l * d_downhill:(l + 1) * d_downhill,
-                                              l * d_downhill:(l + 1) * d_downhill]
-            p_t_row = np.concatenate((p_t_row, p_t_block), axis=1)
-        ptrace_subspace = np.concatenate((ptrace_subspace, p_t_row), axis=0)
-
-    ptrace_subspace = Qobj(ptrace_subspace[d_downhill:, d_downhill:])
-    return ptrace_subspace
+    traced = sorted({i % n for i in np.atleast_1d(index_position).tolist()})
+    kept = [k for k in range(n) if k not in traced]
+    d_kept = int(np.prod([d[k] for k in kept]))
+
+    if isinstance(operator, Qobj):
+        m = operator.full()
+    elif isinstance(operator, (list, tuple)) and all(isinstance(o, Qobj) for o in operator):
+        m = np.array([o.full() for o in operator])
+    else:
+        m = np.asarray(operator)
+    batch_shape = m.shape[:-2]
+
+    # Row index k and column index n + k of each subspace; tracing identifies the two.
+    rows = list(range(n))
+    columns = [k if k in traced else n + k for k in range(n)]
+    tensor = m.reshape(*batch_shape, *d, *d)
+    traced_tensor = np.einsum(tensor, [Ellipsis] + rows + columns,
+                              [Ellipsis] + kept + [n + k for k in kept])
+    result = traced_tensor.reshape(*batch_shape, d_kept, d_kept)
+
+    if isinstance(operator, Qobj):
+        return Qobj(result)
+    if isinstance(operator, (list, tuple)) and all(isinstance(o, Qobj) for o in operator):
+        return [Qobj(r) for r in result]
+    return result
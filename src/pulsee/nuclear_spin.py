@@ -1,6 +1,6 @@
 import numpy as np
 
-from qutip import Qobj, tensor, spin_J_set, qeye
+from qutip import Qobj, tensor, spin_J_set, qeye, qzero
 
 
 class NuclearSpin:
@@ -119,7 +119,7 @@ class ManySpins(NuclearSpin):
     the dimensions of the full Hilbert space and the components of the overall spin operator.
     """
 
-    def __init__(self, spins: list[NuclearSpin]):
+    def __init__(self, spins: list[NuclearSpin], sparse: bool = False):
         """
         Constructs an instance of ManySpins.
   
@@ -127,6 +127,15 @@ class ManySpins(NuclearSpin):
         ----------
         spins : list[NuclearSpin]
             A list of the NuclearSpin objects which represent the spins in the system.
+
+        sparse : bool
+            When True, the operators acting on the full Hilbert space (the
+            components of the overall spin and the terms of the Hamiltonian
+            built from this object) are stored in CSR format, and the tensor
+            products are taken directly between sparse factors. This keeps
+            the memory proportional to the number of non-zero elements instead
+            of d^2, which is needed for clusters of 10 or more spins.
+            Default is False (dense storage).
         
         Action
         ------
@@ -145,6 +154,7 @@ class ManySpins(NuclearSpin):
         self.n_spins = len(spins)
 
         self.spins = spins
+        self.sparse = sparse
         self.d = np.prod([spin.d for spin in spins])  # multiply all the d's together
 
         self.dims = spins[0].dims
@@ -204,7 +214,7 @@ class ManySpins(NuclearSpin):
         corresponding cartesian spin component is returned.
         """
 
-        many_spin_op = Qobj(np.zeros(self.shape), dims=self.dims)
+        many_spin_op = self.zero_operator()
         if isinstance(component, list):
             assert len(component) == self.n_spins, 'If spin components are different for each spin, ' \
                                                    'must specify the operator as a string for each spin. ' \
@@ -226,16 +236,49 @@ class ManySpins(NuclearSpin):
                 term = self.spins[i].I[component[i]]
             else:
                 # Apply nothing to the given spin
-                term = Qobj(0 * qeye(self.spins[i].d))
+                continue
 
-            for j in range(self.n_spins)[:i]:
-                term = tensor(qeye(self.spins[j].d), term)
-            for k in range(self.n_spins)[i + 1:]:
-                term = tensor(term, qeye(self.spins[k].d))
-            many_spin_op += Qobj(term.full(), dims=self.dims)
+            many_spin_op += self.embed(term, i)
 
         return many_spin_op
 
+    def embed(self, ops: Qobj | dict[int, Qobj], target: int | None = None) -> Qobj:
+        """
+        Returns the operator acting on the full Hilbert space of the system
+        given by the tensor product of the passed single-spin operators with
+        the identity on all the other spins, e.g. for ops = {1: A, 3: B}:
+
+        Id (x) A (x) Id (x) B (x) Id (x) ...
+
+        Parameters
+        ----------
+        ops : Qobj or dict[int, Qobj]
+            Either a single-spin operator, which is applied to the spin at
+            position `target`, or a map from the positions of the spins to the
+            operators acting on them.
+
+        target : int
+            Position of the spin acted on by ops, when ops is a Qobj.
+
+        Returns
+        -------
+        A Qobj with the dims of the system, stored in CSR format if the system
+        is sparse and as a dense matrix otherwise.
+        """
+        if isinstance(ops, Qobj):
+            ops = {target: ops}
+        dtype = 'csr' if self.sparse else 'dense'
+        factors = [Qobj(ops[i]).to(dtype) if i in ops else qeye(self.spins[i].d, dtype=dtype)
+                   for i in range(self.n_spins)]
+        return tensor(factors)
+
+    def zero_operator(self) -> Qobj:
+        """
+        Returns the null operator on the full Hilbert space of the system,
+        stored in the same format as the other operators of the system.
+        """
+        return qzero(self.dims[0], dtype='csr' if self.sparse else 'dense')
+
     def spin_J_set(self):
         """
         Returns the Ix, Iy, and Iz operators.
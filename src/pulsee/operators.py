@@ -1,8 +1,113 @@
 import numpy as np
-from qutip import Qobj
+from qutip import Qobj, qeye_like
 from scipy.constants import Planck, Boltzmann
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import expm_multiply
+from scipy.special import logsumexp
 from tqdm import tqdm
 
+# Dimension of the Hilbert space above which backend='auto' propagates with
+# Krylov expm_multiply instead of forming dense exponentials. Can be changed
+# by the user.
+KRYLOV_DIMENSION_THRESHOLD = 256
+
+
+def use_krylov(backend : str, d : int) -> bool:
+    """
+    Returns whether the Krylov backend is to be used for an operator of
+    dimension d.
+
+    Parameters
+    ----------
+    backend : str
+        Either 'dense', 'krylov' or 'auto'. 'auto' selects 'krylov' when d
+        exceeds KRYLOV_DIMENSION_THRESHOLD.
+    d : int
+        Dimension of the Hilbert space.
+
+    Returns
+    -------
+    True, when the Krylov backend is to be used.
+
+    Raises
+    ------
+    ValueError, when backend is not one of the accepted values.
+    """
+    if backend == "auto":
+        return d > KRYLOV_DIMENSION_THRESHOLD
+    if backend not in ("dense", "krylov"):
+        raise ValueError(f"Invalid backend: {backend}. Must be either 'dense', 'krylov' or 'auto'.")
+    return backend == "krylov"
+
+
+def _as_csr(q):
+    if isinstance(q, Qobj):
+        return csr_matrix(q.to("csr").data_as("csr_matrix"))
+    return csr_matrix(q)
+
+
+def krylov_apply_exp_op(q : Qobj, U : Qobj) -> Qobj:
+    """
+    Same as apply_exp_op, but without forming U.expm(): the exponential is
+    applied to the columns of q (and then to those of the result's adjoint)
+    through the Krylov-type algorithm of scipy.sparse.linalg.expm_multiply,
+    which only needs products of U with vectors. A ket q is propagated as a
+    single vector.
+
+    Parameters
+    ----------
+    q : Qobj
+        Density matrix or ket.
+    U : Qobj
+        Generator of the transformation.
+
+    Returns
+    -------
+    U.expm() * q * U.expm()_dagger, or U.expm() * q if q is a ket.
+    """
+    generator = _as_csr(U)
+    rho = expm_multiply(generator, Qobj(q).full())
+    if not q.isket:
+        rho = expm_multiply(generator, rho.conj().T).conj().T
+    return Qobj(rho, dims=q.dims)
+
+
+def krylov_propagate(rho0 : Qobj, hamiltonian : Qobj, times : np.ndarray):
+    """
+    Propagates the state rho0 under a time-independent Hamiltonian with
+    Krylov expm_multiply, stepping from each time in `times` to the next, and
+    yields the state at each of them:
+
+        rho(t) = exp(-i 2 pi H t) rho0 exp(i 2 pi H t).
+
+    The propagator exp(-i 2 pi H t) is never formed, so that only products of
+    the (sparse) Hamiltonian with vectors are computed.
+
+    Parameters
+    ----------
+    rho0 : Qobj
+        Density matrix or ket of the system at time t=0.
+    hamiltonian : Qobj
+        Hamiltonian of the system (in MHz).
+    times : numpy.ndarray
+        Instants of time (in microseconds).
+
+    Yields
+    ------
+    A numpy.ndarray with the density matrix (or ket) at each time in `times`.
+    """
+    generator = -1j * 2 * np.pi * _as_csr(hamiltonian)
+    is_ket = Qobj(rho0).isket
+    rho = Qobj(rho0).full()
+    t_prev = 0.
+    for t in np.asarray(times, dtype=float):
+        if t != t_prev:
+            rho = expm_multiply(generator * (t - t_prev), rho)
+            if not is_ket:
+                rho = expm_multiply(generator * (t - t_prev), rho.conj().T).conj().T
+            t_prev = t
+        yield rho
+
 
 def exp_diagonalize(q : Qobj) -> list[Qobj]:
     """
@@ -38,7 +143,184 @@ def exp_diagonalize(q : Qobj) -> list[Qobj]:
     return u, d, dexp
 
 
-def changed_picture(q : Qobj, h_change_of_picture : Qobj, time : float, invert : bool =False) -> Qobj:
+class StaticHamiltonian(list):
+    """
+    List of the terms of a time-independent Hamiltonian (in MHz) which
+    memoizes their sum and its eigendecomposition, so that the O(d^3)
+    diagonalization is carried out once and then shared by all the
+    functions receiving it (the thermal state of nuclear_system_setup,
+    power_absorption_spectrum, FID_signal, the interaction picture of the
+    Magnus solvers, ...).
+
+    Being a list, it can be passed wherever the list of the terms of
+    h_unperturbed is accepted. The memoized quantities are recomputed when
+    the terms of the list are changed.
+    """
+
+    def __init__(self, terms=()):
+        if isinstance(terms, Qobj):
+            terms = [terms]
+        super().__init__(terms)
+        self._terms = None
+        self._total = None
+        self._eigh = None
+
+    def _refresh(self):
+        if self._terms is None or len(self._terms) != len(self) \
+                or any(a is not b for a, b in zip(self._terms, self)):
+            if not all(isinstance(h, Qobj) for h in self):
+                raise ValueError("A StaticHamiltonian must be made of time-independent Qobj terms.")
+            self._terms = tuple(self)
+            self._total = None
+            self._eigh = None
+
+    @property
+    def total(self) -> Qobj:
+        """
+        Sum of the terms of the Hamiltonian.
+        """
+        self._refresh()
+        if self._total is None:
+            self._total = Qobj(sum(self), dims=self[0].dims)
+        return self._total
+
+    @property
+    def dims(self) -> list:
+        return self.total.dims
+
+    def eigh(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the eigenvalues of the Hamiltonian in ascending order and the
+        unitary matrix whose columns are the corresponding eigenvectors, as
+        diagonalize_hamiltonian. The arrays are shared between the calls, and
+        thus read-only.
+        """
+        self._refresh()
+        if self._eigh is None:
+            energies, eigvects = np.linalg.eigh(self.total.full())
+            energies.flags.writeable = False
+            eigvects.flags.writeable = False
+            self._eigh = (energies, eigvects)
+        return self._eigh
+
+
+def static_hamiltonian(hamiltonian : Qobj | list[Qobj]) -> StaticHamiltonian:
+    """
+    Returns the passed Hamiltonian as a StaticHamiltonian, without copying it
+    (and hence keeping its memoized eigendecomposition) when it already is one.
+    """
+    if isinstance(hamiltonian, StaticHamiltonian):
+        return hamiltonian
+    return StaticHamiltonian(hamiltonian)
+
+
+def diagonalize_hamiltonian(hamiltonian : Qobj | list[Qobj]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Diagonalizes the given time-independent Hamiltonian.
+
+    Parameters
+    ----------
+    hamiltonian : Qobj, List[Qobj] or StaticHamiltonian
+        Hermitian operator (in MHz). If a list is passed, the terms are
+        summed before the diagonalization. The eigendecomposition of a
+        StaticHamiltonian is computed only once.
+
+    Returns
+    -------
+    [0]: numpy.ndarray
+        The eigenvalues of the Hamiltonian in ascending order.
+
+    [1]: numpy.ndarray
+        The unitary matrix whose columns are the corresponding eigenvectors.
+    """
+    if isinstance(hamiltonian, StaticHamiltonian):
+        return hamiltonian.eigh()
+    if isinstance(hamiltonian, (list, tuple)):
+        hamiltonian = sum(hamiltonian)
+    return np.linalg.eigh(Qobj(hamiltonian).full())
+
+
+def eigenbasis_expect(energies : np.ndarray, eigvects : np.ndarray, rho0 : Qobj, e_ops : list[Qobj],
+                      times : np.ndarray) -> np.ndarray:
+    """
+    Computes the expectation values of the operators in `e_ops` on the state
+    `rho0` evolved under a time-independent Hamiltonian, given through its
+    eigendecomposition. No ODE is integrated: in the eigenbasis of the
+    Hamiltonian each expectation value reads
+
+        <O>(t) = sum_jk O_kj rho_jk exp(-i 2 pi (E_j - E_k) t),
+
+    which is evaluated for all the times at once as p(t) M p(t)^*,
+    with p_j(t) = exp(-i 2 pi E_j t) and M_jk = rho_jk O_kj.
+
+    Parameters
+    ----------
+    energies : numpy.ndarray
+        Eigenvalues of the Hamiltonian (in MHz).
+    eigvects : numpy.ndarray
+        Matrix whose columns are the eigenvectors of the Hamiltonian.
+    rho0 : Qobj
+        Density matrix of the system at time t=0.
+    e_ops : List[Qobj]
+        Operators whose expectation values are computed.
+    times : numpy.ndarray
+        Instants of time (in microseconds).
+
+    Returns
+    -------
+    A numpy.ndarray of shape (len(e_ops), len(times)) with the expectation
+    values of each operator at each time.
+    """
+    times = np.asarray(times, dtype=float)
+    v_dag = eigvects.conj().T
+    rho_eig = v_dag @ Qobj(rho0).full() @ eigvects
+    weights = np.array([rho_eig * (v_dag @ Qobj(op).full() @ eigvects).T for op in e_ops])
+    # A global energy offset only contributes a global phase.
+    frequencies = 2 * np.pi * (energies - np.mean(energies))
+
+    exp_vals = np.empty((len(e_ops), len(times)), dtype=complex)
+    # Process the time axis in blocks so that memory stays bounded for long acquisitions.
+    block = max(1, 2 ** 22 // max(len(energies), 1))
+    for start in range(0, len(times), block):
+        phases = np.exp(-1j * np.outer(times[start:start + block], frequencies))
+        exp_vals[:, start:start + block] = np.sum((phases @ weights) * phases.conj(), axis=-1)
+    return exp_vals
+
+
+def eigenbasis_evolve(energies : np.ndarray, eigvects : np.ndarray, rho0 : Qobj, times : np.ndarray) -> np.ndarray:
+    """
+    Evolves the state `rho0` under a time-independent Hamiltonian, given
+    through its eigendecomposition, for all the passed times at once:
+
+        rho(t) = V (rho' * exp(-i 2 pi (E_j - E_k) t)) V^dagger,
+
+    where rho' is rho0 in the eigenbasis V.
+
+    Parameters
+    ----------
+    energies : numpy.ndarray
+        Eigenvalues of the Hamiltonian (in MHz).
+    eigvects : numpy.ndarray
+        Matrix whose columns are the eigenvectors of the Hamiltonian.
+    rho0 : Qobj
+        Density matrix of the system at time t=0.
+    times : numpy.ndarray
+        Instants of time (in microseconds).
+
+    Returns
+    -------
+    A numpy.ndarray of shape (len(times), d, d) with the evolved density
+    matrices.
+    """
+    v_dag = eigvects.conj().T
+    rho_eig = v_dag @ Qobj(rho0).full() @ eigvects
+    phases = np.exp(-1j * 2 * np.pi * np.outer(np.asarray(times, dtype=float), energies - np.mean(energies)))
+    rho_t = phases[:, :, None] * rho_eig[None, :, :] * phases.conj()[:, None, :]
+    return eigvects @ rho_t @ v_dag
+
+
+def changed_picture(q : Qobj, h_change_of_picture : Qobj, time : float, invert : bool =False,
+                    backend : str ="dense") -> Qobj:
     """
     Casts the operator either in a new picture generated by the Operator h_change_of_picture or
     back to the Schroedinger picture, according to the parameter invert.
@@ -46,9 +328,11 @@ def changed_picture(q : Qobj, h_change_of_picture : Qobj, time : float, invert :
     Parameters
     ----------
     q : Qobj
-    h_change_of_picture : Qobj
+    h_change_of_picture : Qobj or StaticHamiltonian
         Operator which generates the change to the new picture. Typically,
-        this operator is a term of the Hamiltonian (measured in MHz).
+        this operator is a term of the Hamiltonian (measured in MHz). The
+        exponential of a StaticHamiltonian is formed from its memoized
+        eigendecomposition.
     time : float
         Instant of evaluation of the operator in the new picture, expressed in microseconds.
     invert : bool
@@ -56,15 +340,26 @@ def changed_picture(q : Qobj, h_change_of_picture : Qobj, time : float, invert :
         Schroedinger picture and is converted into the new one.
         When it is True, the owner object is thought in the new picture and the
         opposite operation is performed.
+    backend : str
+        Either 'dense', 'krylov' or 'auto' (see use_krylov).
+        Default is 'dense'.
 
     Returns
     -------
     A new Operator object equivalent to the owner object but expressed in a different picture.
     """
+    if isinstance(h_change_of_picture, StaticHamiltonian) and not use_krylov(backend, q.shape[0]):
+        energies, eigvects = h_change_of_picture.eigh()
+        sign = -1 if invert else 1
+        u = Qobj((eigvects * np.exp(-1j * sign * 2 * np.pi * energies * time)) @ eigvects.conj().T,
+                 dims=h_change_of_picture.dims)
+        return u * q * u.dag()
+    if isinstance(h_change_of_picture, StaticHamiltonian):
+        h_change_of_picture = h_change_of_picture.total
     t = Qobj(-1j * 2 * np.pi * h_change_of_picture * time)
     if invert:
         t = -t
-    return t.expm() * q * (t.expm()).dag()
+    return apply_exp_op(q, t, backend=backend)
 
 
 def unit_trace(q : Qobj) -> bool:
@@ -117,22 +412,28 @@ def apply_op(q : Qobj, U):
     return U * q * U.dag()
 
 
-def apply_exp_op(q : Qobj, U):
+def apply_exp_op(q : Qobj, U, backend : str ="dense"):
     """
     Applies the operator U.expm() onto the density matrix q
 
     Parameters
     ----------
     q : Qobj
+    backend : str
+        Either 'dense' (U.expm() is computed), 'krylov' (see
+        krylov_apply_exp_op) or 'auto' (see use_krylov).
+        Default is 'dense'.
 
     Returns
     -------
     apply_op(U) = U.expm() * dm * U.expm()_dagger
     """
+    if use_krylov(backend, U.shape[0]):
+        return krylov_apply_exp_op(q, U)
     return U.expm() * q * (U.expm()).dag()
 
 
-def evolve_by_hamiltonian(dm : Qobj, static_hamiltonian : Qobj, time : float):
+def evolve_by_hamiltonian(dm : Qobj, static_hamiltonian : Qobj, time : float, backend : str ="dense"):
     """
     Returns the density matrix represented by the owner object evolved through a
     time interval time under the action of the stationary Hamiltonian static_hamiltonian.
@@ -146,6 +447,9 @@ def evolve_by_hamiltonian(dm : Qobj, static_hamiltonian : Qobj, time : float):
         Time-independent Hamiltonian of the system, in MHz.
     time : float
         Duration of the evolution, expressed in microseconds.
+    backend : str
+        Either 'dense', 'krylov' or 'auto' (see use_krylov).
+        Default is 'dense'.
 
     Returns
     -------
@@ -154,7 +458,7 @@ def evolve_by_hamiltonian(dm : Qobj, static_hamiltonian : Qobj, time : float):
     iHt = 1j * 2 * np.pi * static_hamiltonian * time
     # dm.transform(U) = U * dm * U_dagger
     # not sure if above is true
-    return apply_exp_op(dm, iHt)
+    return apply_exp_op(dm, iHt, backend=backend)
 
 
 def random_operator(d : int) -> Qobj:
@@ -178,16 +482,29 @@ def random_operator(d : int) -> Qobj:
     return Qobj(random_array)
 
 
-def canonical_density_matrix(hamiltonian : Qobj, temperature : float):
+def canonical_density_matrix(hamiltonian : Qobj | list[Qobj], temperature : float, high_temperature : bool =False):
     """
     Returns the density matrix of a canonical ensemble of quantum systems at thermal equilibrium.
 
     Parameters
     ----------
-    hamiltonian : Operator
-        Hamiltonian of the system at equilibrium, expressed in MHz.
+    hamiltonian : Operator, List[Operator] or StaticHamiltonian
+        Hamiltonian of the system at equilibrium, expressed in MHz. The
+        memoized eigendecomposition of a StaticHamiltonian is reused.
     temperature : positive float
         Temperature of the system in kelvin.
+    high_temperature : bool
+        When True, the density matrix is linearized in the inverse
+        temperature, (1 - beta H) / Tr(1 - beta H), which is accurate when
+        beta ||H|| << 1 (e.g. room-temperature NMR) and requires no
+        diagonalization.
+        Default is False.
+
+    Action
+    ------
+    The exact density matrix is built in the eigenbasis of the Hamiltonian,
+    where the Boltzmann weights are normalized in log-space
+    (log-sum-exp), so that it is finite at any temperature and field.
 
     Returns
     -------
@@ -199,16 +516,20 @@ def canonical_density_matrix(hamiltonian : Qobj, temperature : float):
     """
     if temperature <= 0:
         raise ValueError("The temperature must take a positive value")
-
-    exponent = - (Planck / Boltzmann) * hamiltonian * 2 * np.pi * 1e6 / temperature
-    numerator = exponent.expm()
-    try:
-        canonical_dm = numerator.unit()
-    except ValueError:
-        raise ValueError('Most likely exponent cannot be taken because the value is too large. '
-                         'Either hamiltonian has a very strong interaction in MHz, or the temperature'
-                         'is too low.')
-    return canonical_dm
+    beta = (Planck / Boltzmann) * 2 * np.pi * 1e6 / temperature
+    if isinstance(hamiltonian, (list, tuple)):
+        hamiltonian = static_hamiltonian(hamiltonian)
+
+    if high_temperature:
+        if isinstance(hamiltonian, StaticHamiltonian):
+            hamiltonian = hamiltonian.total
+        numerator = qeye_like(hamiltonian) - beta * hamiltonian
+        return numerator / numerator.tr()
+
+    energies, eigvects = diagonalize_hamiltonian(hamiltonian)
+    log_weights = -beta * energies
+    weights = np.exp(log_weights - logsumexp(log_weights))
+    return Qobj((eigvects * weights) @ eigvects.conj().T, dims=hamiltonian.dims)
 
 
 def calc_e_ops(dms : list[Qobj], e_ops : list[Qobj]) -> list:
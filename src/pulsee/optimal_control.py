@@ -0,0 +1,363 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+from qutip import Qobj
+from scipy.optimize import minimize
+
+from .hamiltonians import rotation_sense, secular_part
+from .nuclear_spin import ManySpins, NuclearSpin
+from .pulses import Pulses
+
+
+def rotating_frame_drift(spin: NuclearSpin | ManySpins, h_unperturbed: list[Qobj], frequency: float) -> Qobj:
+    """
+    Returns the drift Hamiltonian of the system in the frame rotating about z
+    at the given carrier frequency, within the rotating-wave approximation
+    (the same frame as evolve(solver='rwa')).
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Time-independent unperturbed Hamiltonian of the system (in MHz).
+    frequency : float
+        Carrier frequency of the pulse (in rad/sec, as in Pulses).
+
+    Returns
+    -------
+    A Qobj (in MHz).
+    """
+    h0 = Qobj(sum(h_unperturbed), dims=spin.dims)
+    sense = rotation_sense(spin, h0)
+    return secular_part(h0, spin) - sense * frequency / (2 * np.pi) * spin.I["z"]
+
+
+def transverse_controls(spin: NuclearSpin | ManySpins, per_spin: bool = False) -> list[Qobj]:
+    """
+    Returns the control Hamiltonians of the x and y components of a field
+    rotating with the frame, -gamma/2pi * Ix and -gamma/2pi * Iy summed over
+    the spins (in MHz per tesla of rotating field).
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    per_spin : bool
+        When True, each spin of a ManySpins gets its own pair of controls
+        (e.g. for spins addressed at separate frequencies), in the order
+        [x_0, y_0, x_1, y_1, ...].
+        Default is False.
+
+    Returns
+    -------
+    A list of Qobj.
+    """
+    if not isinstance(spin, ManySpins):
+        return [Qobj(-spin.gyro_ratio_over_2pi * spin.I[c]) for c in ("x", "y")]
+    terms = [[Qobj(spin.embed(-s.gyro_ratio_over_2pi * s.I[c], n), dims=spin.dims) for c in ("x", "y")]
+             for n, s in enumerate(spin.spins)]
+    if per_spin:
+        return [h for pair in terms for h in pair]
+    return [sum(h[i] for h in terms) for i in range(2)]
+
+
+class GrapeProblem:
+    """
+    Fidelity of a piecewise constant control sequence, and its exact gradient
+    with respect to all the control amplitudes.
+
+    The Hamiltonian of slice j is H_j = h_drift + sum_k u[k, j] h_controls[k],
+    constant over a time dt = duration / n_slices, so that the propagator of
+    the slice is U_j = exp(-i 2 pi H_j dt). All the slices are diagonalized
+    at once; the derivative of U_j with respect to u[k, j] is then
+    V ((V^dag h_k V) * G) V^dag, where V are the eigenvectors of H_j and G the
+    divided differences of exp(-i 2 pi E dt) over its eigenvalues E, so the
+    gradient is exact (no finite differences or first-order approximation of
+    the exponential).
+
+    The target is either
+    - a gate W (when initial_state is None), with fidelity
+      |Tr(W^dag U)|^2 / d^2, insensitive to the global phase; or
+    - a density matrix rho_target reached from initial_state, with fidelity
+      Re Tr(rho_target^dag U rho_0 U^dag) / (|rho_target| |rho_0|) (Frobenius
+      norms), which equals 1 when the transfer is exact.
+
+    Parameters
+    ----------
+    h_drift : Qobj
+        Drift Hamiltonian (in MHz), e.g. from rotating_frame_drift.
+    h_controls : List[Qobj]
+        Control Hamiltonians (in MHz per unit of control), e.g. from
+        transverse_controls.
+    duration : float
+        Duration of the control sequence (in microseconds).
+    n_slices : int
+        Number of piecewise constant slices.
+    target : Qobj or numpy.ndarray
+        Target gate (e.g. quantum_computing.cnot) or target density matrix.
+    initial_state : Qobj or numpy.ndarray
+        Initial density matrix for a state transfer.
+        Default is None (gate optimization).
+    """
+
+    def __init__(self, h_drift: Qobj, h_controls: list[Qobj], duration: float, n_slices: int,
+                 target: Qobj | np.ndarray, initial_state: Qobj | np.ndarray | None = None):
+        self.dims = Qobj(h_drift).dims
+        self.h_drift = Qobj(h_drift).full()
+        self.h_controls = np.array([Qobj(h).full() for h in h_controls])
+        self.duration = duration
+        self.n_slices = n_slices
+        self.dt = duration / n_slices
+        self.target = Qobj(target).full() if isinstance(target, Qobj) else np.asarray(target, dtype=complex)
+        self.initial_state = None
+        if initial_state is not None:
+            self.initial_state = Qobj(initial_state).full() if isinstance(initial_state, Qobj) \
+                else np.asarray(initial_state, dtype=complex)
+            self.norm = np.linalg.norm(self.target) * np.linalg.norm(self.initial_state)
+        if self.target.shape != self.h_drift.shape:
+            raise ValueError(f"The target has shape {self.target.shape}, while the Hamiltonian has shape "
+                             f"{self.h_drift.shape}.")
+
+    @property
+    def n_controls(self) -> int:
+        return len(self.h_controls)
+
+    def _slices(self, controls: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Eigendecomposition and propagators of all the slices.
+        controls = np.asarray(controls, dtype=float).reshape(self.n_controls, self.n_slices)
+        h = self.h_drift + np.tensordot(controls.T, self.h_controls, axes=1)
+        energies, eigvects = np.linalg.eigh(h)
+        exps = np.exp(-2j * np.pi * energies * self.dt)
+        u = (eigvects * exps[:, np.newaxis, :]) @ eigvects.conj().swapaxes(-1, -2)
+        return energies, eigvects, u
+
+    def propagator(self, controls: np.ndarray) -> Qobj:
+        """
+        Returns the propagator of the whole control sequence.
+        """
+        _, _, u = self._slices(controls)
+        total = np.identity(len(self.h_drift), dtype=complex)
+        for u_j in u:
+            total = u_j @ total
+        return Qobj(total, dims=self.dims)
+
+    def fidelity(self, controls: np.ndarray) -> float:
+        """
+        Returns the fidelity of the control sequence (an array of shape
+        (n_controls, n_slices)).
+        """
+        return self.fidelity_and_gradient(controls)[0]
+
+    def fidelity_and_gradient(self, controls: np.ndarray) -> tuple[float, np.ndarray]:
+        """
+        Returns the fidelity of the control sequence and its gradient, an
+        array of shape (n_controls, n_slices).
+        """
+        energies, eigvects, u = self._slices(controls)
+        n, d = self.n_slices, len(self.h_drift)
+
+        if self.initial_state is None:
+            # forward[j] = U_j ... U_1, backward[j] = W^dag U_N ... U_(j+2), for j = 0, ..., N-1.
+            forward = np.empty_like(u)
+            backward = np.empty_like(u)
+            total = np.identity(d, dtype=complex)
+            for j in range(n):
+                total = u[j] @ total
+                forward[j] = total
+            lam = self.target.conj().T
+            for j in range(n - 1, -1, -1):
+                backward[j] = lam
+                lam = lam @ u[j]
+            overlap = np.trace(lam)
+            fidelity = np.abs(overlap) ** 2 / d ** 2
+            previous = np.concatenate([np.identity(d, dtype=complex)[np.newaxis], forward[:-1]])
+            # d Tr(W^dag U) = Tr(M_j dU_j), with M_j = U_(j-1) ... U_1 W^dag U_N ... U_(j+1).
+            m = previous @ backward
+            scale = 2 * np.conj(overlap) / d ** 2
+        else:
+            # Density matrices forward and the target backward.
+            states = np.empty_like(u)
+            rho = self.initial_state
+            for j in range(n):
+                states[j] = rho
+                rho = u[j] @ rho @ u[j].conj().T
+            fidelity = np.real(np.vdot(self.target, rho)) / self.norm
+            lam = self.target.conj().T
+            m = np.empty_like(u)
+            for j in range(n - 1, -1, -1):
+                # d Tr(C rho_N) = 2 Re Tr(M_j dU_j), with M_j = rho_(j-1) U_j^dag lambda_j.
+                m[j] = states[j] @ u[j].conj().T @ lam
+                lam = u[j].conj().T @ lam @ u[j]
+            scale = 2 / self.norm
+
+        # Divided differences of exp(-i 2 pi E dt).
+        exps = np.exp(-2j * np.pi * energies * self.dt)
+        gaps = energies[:, :, np.newaxis] - energies[:, np.newaxis, :]
+        degenerate = np.abs(gaps) < 1e-10 * max(1., np.max(np.abs(energies)))
+        divided = np.where(degenerate, -2j * np.pi * self.dt * exps[:, :, np.newaxis],
+                           (exps[:, :, np.newaxis] - exps[:, np.newaxis, :]) / np.where(degenerate, 1., gaps))
+        eigvects_dag = eigvects.conj().swapaxes(-1, -2)
+        m_eig = eigvects_dag @ m @ eigvects
+        h_eig = eigvects_dag[np.newaxis] @ self.h_controls[:, np.newaxis] @ eigvects[np.newaxis]
+        # Tr(M V (h * G) V^dag) = sum_ab (V^dag M V)_ba h_ab G_ab
+        traces = np.einsum("jba,kjab,jab->kj", m_eig, h_eig, divided)
+        return float(fidelity), np.real(scale * traces)
+
+
+@dataclass
+class GrapeResult:
+    """
+    Result of grape.
+
+    Attributes
+    ----------
+    controls : numpy.ndarray
+        Optimized control amplitudes, of shape (n_controls, n_slices).
+    fidelity : float
+        Fidelity of the optimized controls.
+    propagator : Qobj
+        Propagator of the optimized control sequence.
+    dt : float
+        Duration of each slice (in microseconds).
+    iterations : int
+        Number of iterations of the optimizer.
+    history : list of float
+        Fidelity after each iteration.
+    """
+    controls: np.ndarray
+    fidelity: float
+    propagator: Qobj
+    dt: float
+    iterations: int
+    history: list[float] = field(default_factory=list)
+
+
+def grape(
+    h_drift: Qobj,
+    h_controls: list[Qobj],
+    duration: float,
+    n_slices: int,
+    target: Qobj | np.ndarray,
+    initial_state: Qobj | np.ndarray | None = None,
+    initial_controls: np.ndarray | None = None,
+    max_amplitude: float | None = None,
+    method: str = "L-BFGS-B",
+    max_iter: int = 500,
+    tol: float = 1e-10,
+    seed: int | None = None,
+) -> GrapeResult:
+    """
+    Optimizes piecewise constant controls with the GRAPE algorithm (GRadient
+    Ascent Pulse Engineering) to implement a gate or a state transfer, using
+    the exact gradient of GrapeProblem and a quasi-Newton optimizer.
+
+    Parameters
+    ----------
+    h_drift : Qobj
+        Drift Hamiltonian (in MHz), e.g. from rotating_frame_drift.
+    h_controls : List[Qobj]
+        Control Hamiltonians (in MHz per unit of control), e.g. from
+        transverse_controls.
+    duration : float
+        Duration of the control sequence (in microseconds).
+    n_slices : int
+        Number of piecewise constant slices.
+    target : Qobj or numpy.ndarray
+        Target gate (e.g. quantum_computing.cnot) or target density matrix
+        (when initial_state is given).
+    initial_state : Qobj or numpy.ndarray
+        Initial density matrix for a state transfer.
+        Default is None (gate optimization).
+    initial_controls : numpy.ndarray
+        Initial guess, of shape (n_controls, n_slices).
+        Default is None, i.e. random controls of the order of the amplitude
+        which rotates by pi over the whole duration.
+    max_amplitude : float
+        Bound on the modulus of each control amplitude.
+        Default is None (unbounded).
+    method : str
+        Method of scipy.optimize.minimize using the gradient.
+        Default is 'L-BFGS-B'.
+    max_iter : int
+        Maximum number of iterations.
+        Default is 500.
+    tol : float
+        Tolerance on the infidelity passed to the optimizer.
+        Default is 1e-10.
+    seed : int
+        Seed of the random initial guess.
+        Default is None.
+
+    Returns
+    -------
+    A GrapeResult.
+    """
+    problem = GrapeProblem(h_drift, h_controls, duration, n_slices, target, initial_state)
+    # The controls are optimized in units of the amplitude of a pi rotation,
+    # so that the optimizer sees a well-scaled problem.
+    scale = np.array([1 / (2 * duration * max(np.linalg.norm(h, 2), 1e-300)) for h in problem.h_controls])
+    if initial_controls is None:
+        x0 = np.random.default_rng(seed).uniform(-1, 1, (problem.n_controls, n_slices))
+    else:
+        x0 = np.asarray(initial_controls, dtype=float).reshape(problem.n_controls, n_slices) / scale[:, np.newaxis]
+    bounds = None
+    if max_amplitude is not None:
+        bounds = [(-max_amplitude / s, max_amplitude / s) for s in scale for _ in range(n_slices)]
+        x0 = np.clip(x0, -max_amplitude / scale[:, np.newaxis], max_amplitude / scale[:, np.newaxis])
+
+    history = []
+
+    def infidelity(x):
+        fidelity, gradient = problem.fidelity_and_gradient(x.reshape(problem.n_controls, n_slices) * scale[:, None])
+        return 1 - fidelity, -(gradient * scale[:, np.newaxis]).ravel()
+
+    def record(x, *args):
+        history.append(problem.fidelity(x.reshape(problem.n_controls, n_slices) * scale[:, np.newaxis]))
+
+    result = minimize(infidelity, x0.ravel(), jac=True, method=method, bounds=bounds, tol=tol,
+                      callback=record, options={"maxiter": max_iter})
+    controls = result.x.reshape(problem.n_controls, n_slices) * scale[:, np.newaxis]
+    return GrapeResult(controls=controls, fidelity=problem.fidelity(controls), propagator=problem.propagator(controls),
+                       dt=problem.dt, iterations=result.nit, history=history)
+
+
+def controls_to_pulses(spin: NuclearSpin | ManySpins, h_unperturbed: list[Qobj], controls: np.ndarray,
+                       duration: float, frequency: float) -> Pulses:
+    """
+    Converts the x and y controls of transverse_controls (per_spin=False),
+    in tesla of rotating field, into a sampled pulse (see Pulses.envelope)
+    at the given carrier frequency, to be passed to evolve. With
+    evolve(solver='rwa'), the propagator in the rotating frame is the one
+    of the controls.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Time-independent unperturbed Hamiltonian of the system (in MHz).
+    controls : numpy.ndarray
+        Array of shape (2, n_slices) of the x and y controls.
+    duration : float
+        Duration of the control sequence (in microseconds).
+    frequency : float
+        Carrier frequency of the pulse (in rad/sec).
+
+    Returns
+    -------
+    A Pulses object with a single mode of shape 'sampled', polarized along x
+    in the LAB frame.
+    """
+    controls = np.asarray(controls, dtype=float)
+    n_slices = controls.shape[1]
+    sense = rotation_sense(spin, Qobj(sum(h_unperturbed), dims=spin.dims))
+    amplitudes = np.hypot(controls[0], controls[1])
+    peak = np.max(amplitudes)
+    # The rotating-frame field points at the angle -sense * phase (see
+    # pulse_rotating_frame_op); evolve adds pi to the phase for positive gamma.
+    phases = -sense * np.arctan2(controls[1], controls[0]) - np.pi * (spin.gyro_ratio_over_2pi > 0)
+    return Pulses(frequencies=[frequency], amplitudes=[peak], phases=[0.], theta_p=[np.pi / 2], phi_p=[0.],
+                  pulse_times=[duration], shape="sampled",
+                  shape_par={"times": np.arange(n_slices) * duration / n_slices,
+                             "amplitudes": amplitudes / peak if peak > 0 else amplitudes, "phases": phases})
@@ -0,0 +1,327 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from .pulses import Pulses
+from .simulation import FID_signal, evolve, nuclear_system_setup
+
+# Lebedev point sets as (generator, weight) pairs. The points of each set are
+# all the sign changes and permutations of the generator.
+_LEBEDEV_SETS = {
+    6: [((1., 0., 0.), 1 / 6)],
+    14: [((1., 0., 0.), 1 / 15),
+         ((1., 1., 1.), 3 / 40)],
+    26: [((1., 0., 0.), 1 / 21),
+         ((1., 1., 0.), 4 / 105),
+         ((1., 1., 1.), 9 / 280)],
+    38: [((1., 0., 0.), 1 / 105),
+         ((1., 1., 1.), 9 / 280),
+         ((0.4597008433809831, 0.8880738339771153, 0.), 1 / 35)],
+}
+
+
+def _fibonacci(m: int) -> int:
+    a, b = 1, 1
+    for _ in range(m):
+        a, b = b, a + b
+    return a
+
+
+def zcw_grid(m: int, hemisphere: bool = False) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the Zaremba-Conroy-Wolfsberg (ZCW) grid of orientations, whose
+    number of points is the Fibonacci number F(m+2).
+
+    Parameters
+    ----------
+    m : non-negative int
+        Index of the grid.
+    hemisphere : bool
+        When True, the points only cover the upper hemisphere (z >= 0), which is
+        enough for interactions invariant under inversion (e.g. the quadrupolar
+        one).
+        Default is False.
+
+    Returns
+    -------
+    [0], [1] : numpy.ndarray
+        Polar and azimuthal angles of the points (in radians).
+    [2] : numpy.ndarray
+        Weights of the points (summing to 1).
+    """
+    n = _fibonacci(m + 2)
+    g = _fibonacci(m)
+    j = np.arange(n)
+    if hemisphere:
+        cos_theta = 1 - j / n
+    else:
+        cos_theta = 2 * j / n - 1
+    theta = np.arccos(np.clip(cos_theta, -1, 1))
+    phi = 2 * np.pi * np.mod(j * g / n, 1)
+    return theta, phi, np.full(n, 1 / n)
+
+
+def repulsion_grid(
+    n: int, hemisphere: bool = False, n_iter: int = 200, step: float = 0.1
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns a REPULSION grid of n orientations, obtained by relaxing a spiral
+    set of points on the sphere under mutual 1/r repulsion (Bak and Nielsen,
+    J. Magn. Reson. 125, 132 (1997)). All the points are given the same weight.
+
+    Parameters
+    ----------
+    n : positive int
+        Number of points.
+    hemisphere : bool
+        When True, the points repel their antipodes as well and are finally
+        folded onto the upper hemisphere (z >= 0).
+        Default is False.
+    n_iter : int
+        Number of relaxation steps.
+        Default is 200.
+    step : float
+        Size of the relaxation step, relative to the mean spacing of the points.
+        Default is 0.1.
+
+    Returns
+    -------
+    [0], [1] : numpy.ndarray
+        Polar and azimuthal angles of the points (in radians).
+    [2] : numpy.ndarray
+        Weights of the points (summing to 1).
+    """
+    # Start from the golden spiral, which is already close to the optimum.
+    j = np.arange(n) + 0.5
+    z = (1 - j / n) if hemisphere else (1 - 2 * j / n)
+    azimuth = np.pi * (1 + np.sqrt(5)) * j
+    r = np.sqrt(1 - z ** 2)
+    points = np.stack([r * np.cos(azimuth), r * np.sin(azimuth), z], axis=1)
+
+    spacing = np.sqrt((2 if hemisphere else 4) * np.pi / n)
+    for _ in range(n_iter):
+        sources = np.concatenate([points, -points]) if hemisphere else points
+        diff = points[:, None, :] - sources[None, :, :]
+        dist = np.linalg.norm(diff, axis=-1)
+        dist[dist < 1e-12] = np.inf
+        force = np.sum(diff / dist[..., None] ** 3, axis=1)
+        # Keep only the tangential component and cap the displacement.
+        force -= np.sum(force * points, axis=1)[:, None] * points
+        norm = np.max(np.linalg.norm(force, axis=1))
+        if norm == 0:
+            break
+        points += step * spacing * force / norm
+        points /= np.linalg.norm(points, axis=1)[:, None]
+
+    if hemisphere:
+        points[points[:, 2] < 0] *= -1
+    theta = np.arccos(np.clip(points[:, 2], -1, 1))
+    phi = np.mod(np.arctan2(points[:, 1], points[:, 0]), 2 * np.pi)
+    return theta, phi, np.full(n, 1 / n)
+
+
+def lebedev_grid(n: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the Lebedev quadrature grid with n points, which integrates exactly
+    the spherical harmonics up to degree 3, 5, 7 and 9 for n = 6, 14, 26 and 38
+    respectively.
+
+    Parameters
+    ----------
+    n : int
+        Number of points: 6, 14, 26 or 38.
+
+    Returns
+    -------
+    [0], [1] : numpy.ndarray
+        Polar and azimuthal angles of the points (in radians).
+    [2] : numpy.ndarray
+        Weights of the points (summing to 1).
+
+    Raises
+    ------
+    ValueError, when n is not one of the supported sizes.
+    """
+    if n not in _LEBEDEV_SETS:
+        raise ValueError(f"Lebedev grids are available with {sorted(_LEBEDEV_SETS)} points. Given: {n}")
+    points, weights = [], []
+    for generator, weight in _LEBEDEV_SETS[n]:
+        orbit = set()
+        for perm in [(0, 1, 2), (0, 2, 1), (1, 0, 2), (1, 2, 0), (2, 0, 1), (2, 1, 0)]:
+            for signs in np.ndindex(2, 2, 2):
+                orbit.add(tuple(round((-1) ** s * generator[p], 15) + 0. for s, p in zip(signs, perm)))
+        points += sorted(orbit)
+        weights += [weight] * len(orbit)
+    points = np.array(points)
+    points /= np.linalg.norm(points, axis=1)[:, None]
+    theta = np.arccos(np.clip(points[:, 2], -1, 1))
+    phi = np.mod(np.arctan2(points[:, 1], points[:, 0]), 2 * np.pi)
+    return theta, phi, np.array(weights)
+
+
+def powder_grid(method: str, n: int, **kwargs) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns a grid of crystallite orientations for powder averages.
+
+    Parameters
+    ----------
+    method : str
+        Either 'zcw', 'repulsion' or 'lebedev'.
+    n : int
+        Index of the ZCW grid, or number of points of the REPULSION and
+        Lebedev grids.
+    **kwargs
+        Passed to the function building the grid (zcw_grid, repulsion_grid or
+        lebedev_grid).
+
+    Returns
+    -------
+    [0], [1] : numpy.ndarray
+        Polar and azimuthal angles of the points (in radians).
+    [2] : numpy.ndarray
+        Weights of the points (summing to 1).
+    """
+    grids = {"zcw": zcw_grid, "repulsion": repulsion_grid, "lebedev": lebedev_grid}
+    if method not in grids:
+        raise ValueError(f"Invalid powder grid: {method}. Must be one of {sorted(grids)}.")
+    return grids[method](n, **kwargs)
+
+
+def _oriented_parameters(par, orientation_keys, theta, phi):
+    if par is None:
+        raise ValueError("The parameters of the interaction to be rotated over the powder must be given.")
+    theta_key, phi_key = orientation_keys
+    if isinstance(par, list):
+        return [{**p, theta_key: theta, phi_key: phi} for p in par]
+    return {**par, theta_key: theta, phi_key: phi}
+
+
+def _powder_chunk(task):
+    """
+    Returns the weighted sum of the FIDs of a chunk of orientations. Defined at
+    module level so that it can be sent to the worker processes.
+    """
+    (spin_par, quad_par, zeem_par, orientation, thetas, phis, weights,
+     mode, acquisition_time, setup_kwargs, evolve_kwargs, fid_kwargs) = task
+    times, total = None, 0
+    for theta, phi, weight in zip(thetas, phis, weights):
+        if orientation == "field":
+            zeem = _oriented_parameters(zeem_par, ("theta_z", "phi_z"), theta, phi)
+            quad = quad_par
+        else:
+            quad = _oriented_parameters(quad_par, ("beta_q", "alpha_q"), theta, phi)
+            zeem = zeem_par
+        spin, h_unperturbed, dm = nuclear_system_setup(spin_par, quad, zeem, **setup_kwargs)
+        if mode is not None:
+            dm = evolve(spin, h_unperturbed, dm, mode=mode, **evolve_kwargs)
+        times, fid = FID_signal(spin, h_unperturbed, dm, acquisition_time, **fid_kwargs)
+        total = total + weight * fid
+    return times, total
+
+
+def powder_FID_signal(
+    spin_par: dict | list[dict],
+    quad_par: dict | list[dict] | None,
+    zeem_par: dict | None,
+    acquisition_time: float,
+    grid: str | tuple = "zcw",
+    n: int = 8,
+    orientation: str = "field",
+    mode: Pulses | None = None,
+    setup_kwargs: dict | None = None,
+    evolve_kwargs: dict | None = None,
+    fid_kwargs: dict | None = None,
+    n_workers: int | None = None,
+    chunksize: int = 16,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Simulates the FID signal of a powder, i.e. the weighted average of the FID
+    signals of the crystallites over a grid of orientations.
+
+    For each orientation, the system is set up with nuclear_system_setup, the
+    pulse `mode` (if any) is applied with evolve and the FID is computed with
+    FID_signal. The orientations are split into chunks evaluated in a pool of
+    processes, and the weighted FIDs are accumulated as the chunks complete,
+    so that the memory does not depend on the number of orientations.
+
+    Parameters
+    ----------
+    spin_par, quad_par, zeem_par : dict or list of dict
+        Parameters of the spin system, as in nuclear_system_setup.
+    acquisition_time : float
+        Duration of the acquisition of the signal (in microseconds).
+    grid : str or tuple
+        Either the name of the grid ('zcw', 'repulsion' or 'lebedev', see
+        powder_grid) or a tuple (theta, phi, weights) of arrays.
+        Default is 'zcw'.
+    n : int
+        Size of the grid when grid is a name (see powder_grid).
+        Default is 8 (the ZCW grid of F(10) = 89 orientations, see zcw_grid).
+    orientation : str
+        Interaction whose orientation is averaged: 'field' sets 'theta_z' and
+        'phi_z' in zeem_par, 'efg' sets 'beta_q' and 'alpha_q' in (each of the
+        maps in) quad_par, leaving 'gamma_q' unchanged.
+        Default is 'field'.
+    mode : Pulses
+        Pulse applied before the acquisition, as in evolve.
+        Default is None (no pulse).
+    setup_kwargs, evolve_kwargs, fid_kwargs : dict
+        Further keyword arguments passed to nuclear_system_setup, evolve and
+        FID_signal respectively.
+        Default is None.
+    n_workers : int
+        Number of worker processes. When 1, the orientations are evaluated in
+        the current process.
+        Default is None (as many as the CPUs).
+    chunksize : int
+        Number of orientations evaluated by each task sent to the pool.
+        Default is 16.
+
+    Returns
+    -------
+    [0] : numpy.ndarray
+        Sampled instants of time (in microseconds), as in FID_signal.
+    [1] : numpy.ndarray
+        Powder-averaged FID signal.
+    """
+    if orientation not in ("field", "efg"):
+        raise ValueError("The argument 'orientation' must be either 'field' or 'efg'.")
+    if isinstance(grid, str):
+        thetas, phis, weights = powder_grid(grid, n)
+    else:
+        thetas, phis, weights = (np.asarray(x, dtype=float) for x in grid)
+    weights = weights / np.sum(weights)
+
+    tasks = (
+        (spin_par, quad_par, zeem_par, orientation,
+         thetas[i:i + chunksize], phis[i:i + chunksize], weights[i:i + chunksize],
+         mode, acquisition_time, setup_kwargs or {}, evolve_kwargs or {}, fid_kwargs or {})
+        for i in range(0, len(weights), chunksize)
+    )
+
+    times, fid = None, 0
+    if n_workers == 1:
+        for task in tasks:
+            times, partial = _powder_chunk(task)
+            fid = fid + partial
+        return times, fid
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        # Bound the number of chunks in flight, so that pending results do not
+        # pile up in memory.
+        max_pending = 2 * n_workers
+        pending = set()
+        for task in tasks:
+            pending.add(executor.submit(_powder_chunk, task))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    times, partial = future.result()
+                    fid = fid + partial
+        for future in pending:
+            times, partial = future.result()
+            fid = fid + partial
+    return times, fid
@@ -0,0 +1,246 @@
+import functools
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from qutip import MESolver, Qobj, QobjEvo, mesolve, qzero
+
+# Profilers currently active (innermost last) and records of the calls
+# currently being profiled (innermost last).
+_profilers = []
+_open_records = []
+
+
+class Profiler:
+    """
+    Opt-in instrumentation of the simulation functions. While a Profiler is
+    active (inside a `with` block), every call to evolve, FID_signal,
+    ed_evolve and magnus appends a record with
+
+    - 'function': the name of the function;
+    - 'wall_time': the total duration of the call (in seconds);
+    - 'stages': for each stage of the call (e.g. 'hamiltonian', 'solve',
+      'picture_change', 'post_processing'), its wall time and number of calls;
+    - 'rhs_evaluations': the number of evaluations of the right-hand side of
+      the ODE by QuTiP's solvers (None unless count_rhs is True and an ODE is
+      integrated);
+    - 'solver_steps': the number of steps of the solvers which take explicit
+      steps, e.g. the time points of magnus (None otherwise);
+    - 'solver_stats': the public statistics (result.stats) of each run of
+      QuTiP's solvers, e.g. the integration method and the run time (None
+      when no ODE is integrated);
+    - 'peak_memory': the peak memory allocated during the call (in bytes,
+      None if track_memory is False);
+    - 'calls': the records of the profiled functions called inside this one
+      (e.g. magnus within evolve).
+
+    Outside a Profiler the instrumentation only costs a few attribute
+    lookups per stage.
+
+    Example
+    -------
+    with Profiler() as prof:
+        evolve(spin, h_unperturbed, dm_initial, mode=mode)
+    prof.to_json('profile.json')
+
+    Parameters
+    ----------
+    track_memory : bool
+        Whether to trace the memory allocations with tracemalloc, which slows
+        down the execution.
+        Default is True.
+    count_rhs : bool
+        Whether to count the evaluations of the right-hand side of the ODE,
+        through a null term of the Hamiltonian whose coefficient is a Python
+        counter. QuTiP then calls back into Python at each evaluation, which
+        slows down the integration being measured.
+        Default is False.
+    """
+
+    def __init__(self, track_memory: bool = True, count_rhs: bool = False):
+        self.track_memory = track_memory
+        self.count_rhs = count_rhs
+        self.records = []
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        _profilers.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _profilers.remove(self)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    def __repr__(self):
+        return (f'Profiler(records: {len(self.records)}, track_memory: {self.track_memory}, '
+                f'count_rhs: {self.count_rhs})')
+
+    def to_dict(self) -> dict:
+        """
+        Returns the recorded data as a dictionary, with the list of records
+        under 'records' and the wall time and number of calls summed over all
+        the records under 'totals', for each function and each stage.
+        """
+        totals = {}
+
+        def accumulate(record):
+            entry = totals.setdefault(record['function'], {'calls': 0, 'wall_time': 0., 'stages': {}})
+            entry['calls'] += 1
+            entry['wall_time'] += record['wall_time']
+            for name, data in record['stages'].items():
+                st = entry['stages'].setdefault(name, {'calls': 0, 'wall_time': 0.})
+                st['calls'] += data['calls']
+                st['wall_time'] += data['wall_time']
+            for child in record['calls']:
+                accumulate(child)
+
+        for record in self.records:
+            accumulate(record)
+        return {'records': [_public(record) for record in self.records], 'totals': totals}
+
+    def to_json(self, path: str | None = None, indent: int = 2) -> str:
+        """
+        Returns the data of to_dict serialized as JSON and, if `path` is given,
+        also writes it to that file.
+        """
+        text = json.dumps(self.to_dict(), indent=indent)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+
+def _public(record: dict) -> dict:
+    out = {key: value for key, value in record.items() if not key.startswith('_')}
+    out['calls'] = [_public(child) for child in record['calls']]
+    return out
+
+
+def active_profiler() -> Profiler | None:
+    """
+    Returns the innermost active Profiler, or None.
+    """
+    return _profilers[-1] if _profilers else None
+
+
+def current_record() -> dict | None:
+    """
+    Returns the record of the innermost profiled call, or None when no
+    Profiler is active.
+    """
+    return _open_records[-1] if (_profilers and _open_records) else None
+
+
+def profiled(name: str):
+    """
+    Decorator which records the calls to the decorated function in the active
+    Profiler, if any, under the given name.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = active_profiler()
+            if profiler is None:
+                return func(*args, **kwargs)
+
+            parent = _open_records[-1] if _open_records else None
+            record = {'function': name, 'wall_time': 0., 'stages': {}, 'rhs_evaluations': None,
+                      'solver_steps': None, 'solver_stats': None, 'peak_memory': None, 'calls': []}
+            tracing = profiler.track_memory and tracemalloc.is_tracing()
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                if parent is not None:
+                    # Resetting the peak below would hide the parent's one.
+                    parent['_peak'] = max(parent.get('_peak', 0), peak)
+                tracemalloc.reset_peak()
+                record['_start_memory'] = current
+            (parent['calls'] if parent is not None else profiler.records).append(record)
+
+            _open_records.append(record)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record['wall_time'] = time.perf_counter() - start
+                _open_records.pop()
+                if tracing:
+                    peak = max(record.get('_peak', 0), tracemalloc.get_traced_memory()[1])
+                    record['peak_memory'] = peak - record['_start_memory']
+                    if parent is not None:
+                        parent['_peak'] = max(parent.get('_peak', 0), peak)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Context manager which adds the wall time of its block to the stage `name`
+    of the innermost profiled call. Does nothing when no Profiler is active.
+    """
+    record = current_record()
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        data = record['stages'].setdefault(name, {'calls': 0, 'wall_time': 0.})
+        data['calls'] += 1
+        data['wall_time'] += time.perf_counter() - start
+
+
+def add_solver_steps(n_steps: int):
+    """
+    Adds n_steps to the count of solver steps of the innermost profiled call,
+    for solvers which take explicit steps (e.g. the time points of magnus).
+    """
+    record = current_record()
+    if record is not None:
+        record['solver_steps'] = (record['solver_steps'] or 0) + int(n_steps)
+
+
+def profiled_mesolve(h, rho0: Qobj, times, **kwargs):
+    """
+    Same as qutip.mesolve. When a Profiler is active, the public statistics of
+    the run (result.stats) are added to the innermost profiled call. When the
+    Profiler also has count_rhs set, the number of evaluations of the
+    right-hand side is counted through a null term of the Hamiltonian whose
+    coefficient is a counter (QuTiP evaluates all the coefficients at each
+    evaluation).
+    """
+    record = current_record()
+    if record is None:
+        return mesolve(h, rho0, times, **kwargs)
+
+    if not active_profiler().count_rhs:
+        result = mesolve(h, rho0, times, **kwargs)
+    else:
+        counter = {'n': 0}
+
+        def count(t, args):
+            counter['n'] += 1
+            return 0.
+
+        h_evo = QobjEvo(h) + QobjEvo([qzero(rho0.dims[0]), count])
+        options = dict(kwargs.get('options') or {})
+        progress_bar = kwargs.get('progress_bar')
+        if progress_bar:
+            options['progress_bar'] = 'text' if progress_bar is True else progress_bar
+        solver = MESolver(h_evo, c_ops=kwargs.get('c_ops'), options=options)
+        result = solver.run(rho0, times, e_ops=kwargs.get('e_ops'), args=kwargs.get('args'))
+        record['rhs_evaluations'] = (record['rhs_evaluations'] or 0) + counter['n']
+
+    record['solver_stats'] = (record['solver_stats'] or []) + [dict(result.stats)]
+    return result
@@ -0,0 +1,786 @@
+from collections import OrderedDict
+from fractions import Fraction
+from math import lcm
+
+import numpy as np
+from numpy.typing import NDArray
+from qutip import Options, Qobj, liouvillian, operator_to_vector, propagator, vector_to_operator
+from scipy.linalg import schur
+
+from .hamiltonians import (carrier_frequency, h_multiple_mode_pulse, multiply_by_2pi, rwa_hamiltonians,
+                           picture_change_hamiltonians, picture_change_terms, rotation_sense)
+from .nuclear_spin import ManySpins, NuclearSpin
+from .operators import static_hamiltonian
+from .profiling import add_solver_steps
+from .pulses import Pulses
+
+
+class PropagatorCache:
+    """
+    Least-recently-used cache of propagators. Each entry maps a key built from
+    the Hamiltonian, the pulse and the duration of the evolution to the
+    corresponding unitary (or superoperator), so that repeating the same pulse
+    costs a single matrix product.
+
+    Attributes
+    ----------
+    maxsize : int
+        Maximum number of propagators kept in memory. When it is exceeded,
+        the least recently used entry is discarded.
+    hits, misses : int
+        Number of lookups which found/did not find the requested propagator.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        if maxsize < 1:
+            raise ValueError("The size of the cache must be a positive integer.")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __repr__(self):
+        return f'PropagatorCache(size: {len(self)}, maxsize: {self.maxsize}, hits: {self.hits}, misses: {self.misses})'
+
+    def get(self, key):
+        """
+        Returns the propagator stored under `key`, or None if there is none.
+        """
+        if key is None or key not in self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, value):
+        """
+        Stores `value` under `key`, evicting the least recently used entry
+        if the cache is full. A None key is not stored.
+        """
+        if key is None:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Empties the cache and resets its statistics.
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Cache shared by all the calls to evolve(solver='propagator').
+default_propagator_cache = PropagatorCache()
+
+
+def hamiltonian_key(hamiltonian: Qobj | list) -> tuple | None:
+    """
+    Returns a hashable key identifying a time-independent Hamiltonian.
+
+    Parameters
+    ----------
+    hamiltonian : Qobj or List[Qobj]
+
+    Returns
+    -------
+    A tuple made of the dims and of the matrix elements of each term, or
+    None when some term is time-dependent (such Hamiltonians are not cached).
+    """
+    if isinstance(hamiltonian, Qobj):
+        hamiltonian = [hamiltonian]
+    key = []
+    for h in hamiltonian:
+        if not isinstance(h, Qobj):
+            return None
+        key.append((str(h.dims), h.full().tobytes()))
+    return tuple(key)
+
+
+def pulses_key(mode: Pulses) -> tuple:
+    """
+    Returns a hashable key identifying the parameters of a Pulses object.
+    """
+    fields = (mode.frequencies, mode.amplitudes, mode.phases, mode.theta_p, mode.phi_p, mode.pulse_times)
+    shape_par = tuple(sorted((k, tuple(np.ravel(v).tolist())) for k, v in mode.shape_par.items()))
+    return tuple(tuple(np.atleast_1d(np.asarray(f, dtype=float)).tolist()) for f in fields) + (mode.shape, shape_par)
+
+
+def spin_key(spin: NuclearSpin | ManySpins) -> tuple:
+    """
+    Returns a hashable key identifying a spin or spin system, i.e. the dims
+    of its Hilbert space and the gyromagnetic ratio of each constituent spin,
+    on which the operators of the pulse depend.
+    """
+    spins = spin.spins if isinstance(spin, ManySpins) else [spin]
+    return str(spin.dims), tuple(float(s.gyro_ratio_over_2pi) for s in spins)
+
+
+def _options_key(opts) -> tuple | None:
+    if opts is None:
+        return ()
+    try:
+        return tuple(sorted((k, repr(v)) for k, v in dict(opts).items()))
+    except (TypeError, ValueError):
+        return None
+
+
+def pulse_propagator(
+        spin: NuclearSpin | ManySpins,
+        h_unperturbed: list[Qobj],
+        mode: Pulses,
+        duration: float,
+        opts: dict | None = None,
+        cache: PropagatorCache | None = default_propagator_cache,
+        c_ops: list[Qobj] | None = None,
+) -> Qobj:
+    """
+    Returns the propagator over the interval [0, duration] of the Hamiltonian
+    h_unperturbed + h_multiple_mode_pulse(spin, mode), computing it with
+    QuTiP's propagator only the first time a given (Hamiltonian, pulse,
+    duration, collapse operators) combination is requested.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Unperturbed Hamiltonian of the system (in MHz).
+    mode : Pulses
+        Parameters of the electromagnetic modes of the pulse, as in evolve.
+        Note that evolve has already added pi to the phases (for positive
+        gyromagnetic ratios) when it calls this function.
+    duration : float
+        Duration of the evolution (in microseconds).
+    opts : dict
+        Options passed to QuTiP's propagator.
+        Default value is None (tolerances of 1e-14, as in evolve).
+    cache : PropagatorCache or None
+        Cache where the propagator is looked up and stored. When None, the
+        propagator is always recomputed.
+        Default is the module-level cache `default_propagator_cache`.
+    c_ops : List[Qobj]
+        Lindblad operators describing the relaxation of the system (see
+        relaxation.relaxation_operators). When given, the propagator is a
+        superoperator.
+        Default is None.
+
+    Returns
+    -------
+    A Qobj representing the unitary propagator (in the Schroedinger picture),
+    or the propagator superoperator if c_ops are given.
+    """
+    if opts is None:
+        opts = Options(atol=1e-14, rtol=1e-14)
+    c_ops = list(c_ops or [])
+
+    key = None
+    if cache is not None:
+        h_key = hamiltonian_key(h_unperturbed)
+        o_key = _options_key(opts)
+        if h_key is not None and o_key is not None:
+            key = (spin_key(spin), h_key, pulses_key(mode), float(duration), o_key)
+            if c_ops:
+                key += (hamiltonian_key(c_ops),)
+        u = cache.get(key)
+        if u is not None:
+            return u
+
+    h_perturbation = h_multiple_mode_pulse(spin, mode, t=0, factor_t_dependence=True)
+    h_scaled = multiply_by_2pi(list(h_unperturbed) + h_perturbation)
+    u = propagator(h_scaled, duration, c_ops=c_ops or None, options=opts)
+
+    if cache is not None:
+        cache.put(key, u)
+    return u
+
+
+def apply_propagator(u: Qobj, rho: Qobj) -> Qobj:
+    """
+    Applies a propagator to a density matrix.
+
+    Parameters
+    ----------
+    u : Qobj
+        Either a unitary operator or a superoperator.
+    rho : Qobj
+        Density matrix to be propagated.
+
+    Returns
+    -------
+    U * rho * U_dagger if u is an operator, or the density matrix
+    corresponding to u * vec(rho) if u is a superoperator.
+    """
+    if u.issuper:
+        return vector_to_operator(u * operator_to_vector(rho))
+    return u * rho * u.dag()
+
+
+def free_propagator(
+        h_unperturbed: list[Qobj],
+        duration: float,
+        cache: PropagatorCache | None = default_propagator_cache,
+) -> Qobj:
+    """
+    Returns the propagator exp(-i 2 pi H duration) of a free evolution under
+    the time-independent Hamiltonian h_unperturbed, in closed form through
+    its eigendecomposition (no ODE is integrated).
+
+    Parameters
+    ----------
+    h_unperturbed : List[Qobj]
+        Time-independent Hamiltonian of the system (in MHz).
+    duration : float
+        Duration of the evolution (in microseconds).
+    cache : PropagatorCache or None
+        Cache where the propagator is looked up and stored. When None, it is
+        always recomputed.
+        Default is the module-level cache `default_propagator_cache`.
+
+    Returns
+    -------
+    A Qobj representing the unitary propagator.
+
+    Raises
+    ------
+    ValueError, when h_unperturbed is time-dependent.
+    """
+    h_key = hamiltonian_key(h_unperturbed)
+    if h_key is None:
+        raise ValueError("The free propagator requires a time-independent h_unperturbed.")
+    key = ("free", h_key, float(duration))
+    if cache is not None:
+        u = cache.get(key)
+        if u is not None:
+            return u
+    h0 = static_hamiltonian(h_unperturbed)
+    energies, eigvects = h0.eigh()
+    u = Qobj((eigvects * np.exp(-2j * np.pi * energies * duration)) @ eigvects.conj().T, dims=h0.dims)
+    if cache is not None:
+        cache.put(key, u)
+    return u
+
+
+def lindblad_liouvillian(
+        h_unperturbed: list[Qobj],
+        c_ops: list[Qobj],
+        cache: PropagatorCache | None = default_propagator_cache,
+) -> Qobj:
+    """
+    Returns the Liouvillian superoperator of the Lindblad master equation with
+    the time-independent Hamiltonian h_unperturbed (in MHz, the 2 pi factor
+    is included) and the collapse operators c_ops, building it only the first
+    time a given (Hamiltonian, collapse operators) pair is requested.
+
+    Parameters
+    ----------
+    h_unperturbed : List[Qobj]
+        Time-independent Hamiltonian of the system (in MHz).
+    c_ops : List[Qobj]
+        Lindblad operators (in units of microseconds^(-1/2)).
+    cache : PropagatorCache or None
+        Cache where the Liouvillian is looked up and stored. When None, it
+        is always rebuilt.
+        Default is the module-level cache `default_propagator_cache`.
+
+    Returns
+    -------
+    A Qobj superoperator (in 1/microseconds).
+
+    Raises
+    ------
+    ValueError, when h_unperturbed is time-dependent.
+    """
+    h_key = hamiltonian_key(h_unperturbed)
+    if h_key is None:
+        raise ValueError("The cached Liouvillian requires a time-independent h_unperturbed.")
+    key = ("liouvillian", h_key, hamiltonian_key(list(c_ops)))
+    if cache is not None:
+        superop = cache.get(key)
+        if superop is not None:
+            return superop
+    superop = liouvillian(2 * np.pi * Qobj(sum(h_unperturbed)), list(c_ops))
+    if cache is not None:
+        cache.put(key, superop)
+    return superop
+
+
+def lindblad_propagator(
+        h_unperturbed: list[Qobj],
+        c_ops: list[Qobj],
+        duration: float,
+        cache: PropagatorCache | None = default_propagator_cache,
+) -> Qobj:
+    """
+    Returns the propagator superoperator over an interval of length duration
+    of the Lindblad master equation with the time-independent Hamiltonian
+    h_unperturbed and the collapse operators c_ops, i.e. the exponential of
+    the (cached) Liouvillian times the duration. No ODE is integrated, and
+    repeated free evolutions of the same length cost a single product.
+
+    Parameters
+    ----------
+    h_unperturbed : List[Qobj]
+        Time-independent Hamiltonian of the system (in MHz).
+    c_ops : List[Qobj]
+        Lindblad operators (in units of microseconds^(-1/2)).
+    duration : float
+        Duration of the evolution (in microseconds).
+    cache : PropagatorCache or None
+        Cache where the Liouvillian and the propagator are looked up and
+        stored. When None, they are always recomputed.
+        Default is the module-level cache `default_propagator_cache`.
+
+    Returns
+    -------
+    A Qobj superoperator, to be applied with apply_propagator.
+    """
+    superop = lindblad_liouvillian(h_unperturbed, c_ops, cache)
+    key = ("lindblad", hamiltonian_key(h_unperturbed), hamiltonian_key(list(c_ops)), float(duration))
+    if cache is not None:
+        u = cache.get(key)
+        if u is not None:
+            return u
+    u = (superop * duration).expm()
+    if cache is not None:
+        cache.put(key, u)
+    return u
+
+
+def _segment_edges(mode: Pulses, duration: float) -> NDArray:
+    """
+    Returns the edges of the intervals of [0, duration] between two successive
+    switch-off times of the modes, where the pulse Hamiltonian is smooth
+    (or, for the 'sampled' shape, constant).
+    """
+    pulse_times = np.atleast_1d(np.asarray(mode.pulse_times, dtype=float))
+    if mode.shape == "sampled":
+        pulse_times = np.concatenate([pulse_times, np.asarray(mode.shape_par["times"], dtype=float)])
+    return np.unique(np.concatenate([[0.0, duration], pulse_times[(pulse_times > 0) & (pulse_times < duration)]]))
+
+
+def rwa_propagator(
+        spin: NuclearSpin | ManySpins,
+        h_unperturbed: list[Qobj],
+        mode: Pulses,
+        duration: float,
+        cache: PropagatorCache | None = default_propagator_cache,
+) -> Qobj:
+    """
+    Returns the propagator over the interval [0, duration] of the Hamiltonian
+    h_unperturbed + h_multiple_mode_pulse(spin, mode) within the rotating-wave
+    approximation.
+
+    In the frame rotating about z at the carrier frequency of the pulse, in
+    the sense of the Larmor precession, the secular Hamiltonian returned by
+    h_rotating_frame is constant between two successive switch-off times of
+    the modes. The propagator is then the product of the exponentials of these
+    piecewise constant Hamiltonians, followed by the rotation which brings the
+    state back to the LAB frame at t=duration. No ODE is integrated, so the
+    cost does not depend on the Larmor frequency. Shaped pulses are sliced
+    as in Pulses.slice_edges, each slice costing the same as a segment of a
+    square pulse.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Time-independent unperturbed Hamiltonian of the system (in MHz).
+    mode : Pulses
+        Parameters of the electromagnetic modes of the pulse, as in evolve.
+        All the modes with non-zero amplitude must share the same frequency.
+    duration : float
+        Duration of the evolution (in microseconds).
+    cache : PropagatorCache or None
+        Cache where the propagator is looked up and stored. When None, the
+        propagator is always recomputed.
+        Default is the module-level cache `default_propagator_cache`.
+
+    Returns
+    -------
+    A Qobj representing the unitary propagator in the LAB frame (in the
+    Schroedinger picture).
+
+    Raises
+    ------
+    ValueError, when h_unperturbed is time-dependent or when the modes have
+    different frequencies.
+    """
+    h_key = hamiltonian_key(h_unperturbed)
+    if h_key is None:
+        raise ValueError("The rotating-wave approximation solver requires a time-independent h_unperturbed.")
+    key = ("rwa", spin_key(spin), h_key, pulses_key(mode), float(duration))
+    if cache is not None:
+        u = cache.get(key)
+        if u is not None:
+            return u
+
+    u = Qobj(rwa_propagators(spin, h_unperturbed, [mode], [duration])[0], dims=spin.dims)
+
+    if cache is not None:
+        cache.put(key, u)
+    return u
+
+
+def rwa_propagators(
+        spin: NuclearSpin | ManySpins,
+        h_unperturbed: list[Qobj],
+        modes: list[Pulses],
+        durations: NDArray,
+) -> NDArray:
+    """
+    Returns the propagators of rwa_propagator for several pulses at once,
+    e.g. the variants of a pulse in a sweep of its parameters (see
+    sweeps.sweep_evolve). The piecewise constant rotating-frame Hamiltonians
+    of all the pulses are built by hamiltonians.rwa_hamiltonians and
+    exponentiated as a single stack of arrays.
+
+    Parameters
+    ----------
+    spin, h_unperturbed :
+        same meaning as the corresponding arguments of rwa_propagator.
+    modes : List[Pulses]
+        Pulses, with the same number of modes, whose propagators are computed.
+    durations : array_like
+        Duration of the evolution under each pulse (in microseconds).
+
+    Returns
+    -------
+    A numpy.ndarray of shape (len(modes), d, d) with the unitary propagators
+    in the LAB frame (in the Schroedinger picture).
+    """
+    h0 = Qobj(sum(h_unperturbed), dims=spin.dims)
+    sense = rotation_sense(spin, h0)
+    durations = np.asarray(durations, dtype=float)
+
+    # The rotating-frame Hamiltonian only changes when a mode is switched off
+    # (or, for shaped pulses, from one slice to the next). Shorter lists of
+    # edges are padded with zero-length segments.
+    edges = [mode.slice_edges(duration) for mode, duration in zip(modes, durations)]
+    n_segments = max(len(e) for e in edges) - 1
+    edges = np.array([np.pad(e, (0, n_segments + 1 - len(e)), mode="edge") for e in edges])
+    midpoints = (edges[:, 1:] + edges[:, :-1]) / 2
+    h_rot = rwa_hamiltonians(spin, h0, [mode for mode in modes for _ in range(n_segments)], midpoints.ravel(), sense)
+    h_rot = h_rot.reshape(len(modes), n_segments, spin.d, spin.d)
+    u_segments = _exp_hermitian(h_rot * np.diff(edges, axis=1)[:, :, np.newaxis, np.newaxis])
+
+    u_rot = np.broadcast_to(np.identity(spin.d, dtype=complex), (len(modes), spin.d, spin.d))
+    for j in range(n_segments):
+        u_rot = u_segments[:, j] @ u_rot
+
+    # Back to the LAB frame: the rotating frame is exp(-i sense omega t Iz).
+    m = np.real(spin.I["z"].diag())
+    omegas = np.array([carrier_frequency(mode) for mode in modes])
+    return np.exp(-1j * sense * (omegas * durations)[:, np.newaxis] * m)[:, :, np.newaxis] * u_rot
+
+
+# Nodes of the 2-point Gauss-Legendre quadrature on [0, 1].
+_GL4_NODES = 0.5 + np.array([-1, 1]) * np.sqrt(3) / 6
+
+
+def _exp_hermitian(k: NDArray) -> NDArray:
+    # exp(-i 2 pi k) for a (stack of) Hermitian matrices k.
+    energies, eigvects = np.linalg.eigh(k)
+    return (eigvects * np.exp(-2j * np.pi * energies)[..., np.newaxis, :]) @ eigvects.conj().swapaxes(-1, -2)
+
+
+# Relative length of the interval below which the steps of the adaptive
+# Magnus integrator are considered stalled.
+MAGNUS_MIN_STEP = 1e-10
+# Floor of the local error allowed per step, at the level of round-off.
+_ROUND_OFF_ERROR = 8 * np.finfo(float).eps
+
+
+def _adaptive_magnus(terms: tuple, mode: Pulses, t_start: float, t_end: float, tol: float, total: float,
+                     max_step: float | None) -> tuple[NDArray, int]:
+    """
+    Propagator over [t_start, t_end] of the Hamiltonian described by `terms`
+    (see hamiltonians.picture_change_terms), in the eigenbasis of the
+    generator of the picture, together with the number of accepted steps.
+
+    Each step applies the 4th order Magnus expansion with Gauss-Legendre
+    nodes. The local error is estimated by step doubling and kept below
+    tol * step / total, so that the error on the whole interval of length
+    total stays below tol. This allowance is floored at a few machine
+    epsilons, below which the estimate is dominated by round-off, so that
+    a tol too small to be attained does not make the steps shrink forever.
+
+    Raises
+    ------
+    RuntimeError, when the step nonetheless falls below MAGNUS_MIN_STEP
+    times the length of the interval.
+    """
+    eigvals, _, h_static, h_modes = terms
+    u = np.identity(len(eigvals), dtype=complex)
+    length = t_end - t_start
+    step = length if max_step is None else min(max_step, length)
+    t = t_start
+    n_steps = 0
+    while t_end - t > 1e-12 * length:
+        step = min(step, t_end - t)
+        # Nodes of the whole step and of its two halves.
+        times = np.concatenate([t + step * _GL4_NODES, t + step / 2 * _GL4_NODES,
+                                t + step / 2 * (1 + _GL4_NODES)])
+        h = picture_change_hamiltonians(eigvals, h_static, h_modes, mode, times)
+        h_1, h_2 = h[0::2], h[1::2]
+        steps = np.array([step, step / 2, step / 2])[:, np.newaxis, np.newaxis]
+        # 4th order Magnus expansion: exp(-i 2 pi k) with k Hermitian.
+        k = steps / 2 * (h_1 + h_2) - 1j * np.pi * np.sqrt(3) / 6 * steps ** 2 * (h_2 @ h_1 - h_1 @ h_2)
+        u_full, u_first, u_second = _exp_hermitian(k)
+        u_halves = u_second @ u_first
+        # Richardson estimate of the local error of the composition of the halves.
+        error = np.max(np.abs(u_halves - u_full)) / 15
+        allowed = max(tol * step / total, _ROUND_OFF_ERROR)
+        if error <= allowed:
+            u = u_halves @ u
+            t += step
+            n_steps += 1
+        step *= min(4., max(0.2, 0.9 * (allowed / max(error, 1e-300)) ** 0.25))
+        if max_step is not None:
+            step = min(step, max_step)
+        if step < MAGNUS_MIN_STEP * length and t_end - t > step:
+            raise RuntimeError(f"The adaptive Magnus step fell below {MAGNUS_MIN_STEP} times the length of the "
+                               f"interval without attaining the tolerance {tol}. Use a larger magnus_tol.")
+    return u, n_steps
+
+
+def adaptive_magnus_propagator(
+        spin: NuclearSpin | ManySpins,
+        h_unperturbed: list[Qobj],
+        mode: Pulses,
+        duration: float,
+        h_change_of_picture: Qobj | None = None,
+        tol: float = 1e-8,
+        max_step: float | None = None,
+        cache: PropagatorCache | None = default_propagator_cache,
+) -> Qobj:
+    """
+    Returns the propagator over the interval [0, duration] of the Hamiltonian
+    h_unperturbed + h_multiple_mode_pulse(spin, mode), computed with a
+    piecewise Magnus integrator with adaptive steps.
+
+    The evolution is carried out in the picture generated by
+    h_change_of_picture (the interaction picture by default), where the
+    Hamiltonian varies slowly and long steps can be taken. Each step applies
+    the 4th order Magnus expansion with two Gauss-Legendre nodes, and its
+    length is adjusted so that the error estimated by step doubling stays
+    below tol. The cost is then linear in the duration and no grid of times
+    has to be chosen by hand. The interval is split at the switch-off times
+    of the modes, where the Hamiltonian is discontinuous.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Time-independent unperturbed Hamiltonian of the system (in MHz).
+    mode : Pulses
+        Parameters of the electromagnetic modes of the pulse, as in evolve.
+    duration : float
+        Duration of the evolution (in microseconds).
+    h_change_of_picture : Qobj or StaticHamiltonian
+        Operator which generates the picture of the integration (in MHz).
+        Default is None, which selects the interaction picture
+        (h_change_of_picture = h_unperturbed).
+    tol : float
+        Bound on the error of the elements of the propagator.
+        Default is 1e-8.
+    max_step : float
+        Maximum length of a step (in microseconds).
+        Default is None (no limit).
+    cache : PropagatorCache or None
+        Cache where the propagator is looked up and stored. When None, the
+        propagator is always recomputed.
+        Default is the module-level cache `default_propagator_cache`.
+
+    Returns
+    -------
+    A Qobj representing the unitary propagator in the LAB frame (in the
+    Schroedinger picture).
+
+    Raises
+    ------
+    ValueError, when h_unperturbed is time-dependent.
+    """
+    h_key = hamiltonian_key(h_unperturbed)
+    if h_key is None:
+        raise ValueError("The adaptive Magnus solver requires a time-independent h_unperturbed.")
+    h0 = Qobj(sum(h_unperturbed), dims=spin.dims)
+    if h_change_of_picture is None:
+        h_change_of_picture = static_hamiltonian(h_unperturbed)
+    key = ("adaptive_magnus", spin_key(spin), h_key, pulses_key(mode), float(duration), hamiltonian_key(h_change_of_picture),
+           float(tol), max_step)
+    if cache is not None:
+        u = cache.get(key)
+        if u is not None:
+            return u
+
+    terms = picture_change_terms(spin, mode, h0, h_change_of_picture)
+    eigvals, eigvecs = terms[0], terms[1]
+    u_picture = np.identity(spin.d, dtype=complex)
+    n_steps = 0
+    edges = _segment_edges(mode, duration)
+    for t_start, t_end in zip(edges[:-1], edges[1:]):
+        u_seg, n = _adaptive_magnus(terms, mode, t_start, t_end, tol, duration, max_step)
+        u_picture = u_seg @ u_picture
+        n_steps += n
+    add_solver_steps(n_steps)
+
+    # Back to the Schroedinger picture at t=duration.
+    u_eig = np.exp(-2j * np.pi * eigvals * duration)[:, np.newaxis] * u_picture
+    u = Qobj(eigvecs @ u_eig @ eigvecs.conj().T, dims=h0.dims)
+
+    if cache is not None:
+        cache.put(key, u)
+    return u
+
+
+def common_period(frequencies: NDArray, max_denominator: int = 1000) -> float:
+    """
+    Returns the common period of monochromatic waves with the given angular
+    frequencies, i.e. the period of any superposition of them.
+
+    Parameters
+    ----------
+    frequencies : numpy.ndarray
+        Angular frequencies of the waves (in rad/microsecond). Null
+        frequencies are ignored.
+    max_denominator : int
+        Maximum denominator of the ratios between the frequencies which are
+        considered commensurate.
+        Default is 1000.
+
+    Returns
+    -------
+    The period (in microseconds), or infinity when all the frequencies are null.
+
+    Raises
+    ------
+    ValueError, when the frequencies are not commensurate.
+    """
+    frequencies = np.abs(np.atleast_1d(np.asarray(frequencies, dtype=float)))
+    frequencies = frequencies[frequencies > 0]
+    if len(frequencies) == 0:
+        return np.inf
+    base = np.min(frequencies)
+    denominator = 1
+    for ratio in frequencies / base:
+        fraction = Fraction(ratio).limit_denominator(max_denominator)
+        if not np.isclose(float(fraction), ratio, rtol=1e-9, atol=0):
+            raise ValueError("The frequencies of the modes are not commensurate: the pulse is not periodic.")
+        denominator = lcm(denominator, fraction.denominator)
+    return 2 * np.pi * denominator / base
+
+
+def floquet_magnus_propagator(
+        spin: NuclearSpin | ManySpins,
+        h_unperturbed: list[Qobj],
+        mode: Pulses,
+        duration: float,
+        tol: float = 1e-8,
+        cache: PropagatorCache | None = default_propagator_cache,
+) -> Qobj:
+    """
+    Returns the propagator over the interval [0, duration] of the Hamiltonian
+    h_unperturbed + h_multiple_mode_pulse(spin, mode) for a periodic pulse,
+    exploiting Floquet's theorem.
+
+    Between two successive switch-off times of the modes, the Hamiltonian is
+    periodic with the common period T of the active modes (see
+    common_period). The propagator over one period is computed with the
+    adaptive Magnus integrator of adaptive_magnus_propagator (in the LAB
+    frame), and its n-th power, which gives the evolution over n periods, is
+    taken through its eigendecomposition. Only the remainder of the interval
+    shorter than T is integrated explicitly, so that the cost does not grow
+    with the number of periods.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Time-independent unperturbed Hamiltonian of the system (in MHz).
+    mode : Pulses
+        Parameters of the electromagnetic modes of the pulse, as in evolve.
+        The frequencies of the modes must be commensurate.
+    duration : float
+        Duration of the evolution (in microseconds).
+    tol : float
+        Bound on the error of the elements of the propagator.
+        Default is 1e-8.
+    cache : PropagatorCache or None
+        Cache where the propagator is looked up and stored. When None, the
+        propagator is always recomputed.
+        Default is the module-level cache `default_propagator_cache`.
+
+    Returns
+    -------
+    A Qobj representing the unitary propagator in the LAB frame (in the
+    Schroedinger picture).
+
+    Raises
+    ------
+    ValueError, when h_unperturbed is time-dependent, when the frequencies
+    of the modes are not commensurate or when the pulse is shaped (and hence
+    not periodic).
+    """
+    if mode.shape != "square":
+        raise ValueError("The floquet_magnus solver requires a periodic (square) pulse. Given shape: "
+                         f"{mode.shape}")
+    h_key = hamiltonian_key(h_unperturbed)
+    if h_key is None:
+        raise ValueError("The Floquet-Magnus solver requires a time-independent h_unperturbed.")
+    key = ("floquet_magnus", spin_key(spin), h_key, pulses_key(mode), float(duration), float(tol))
+    if cache is not None:
+        u = cache.get(key)
+        if u is not None:
+            return u
+
+    h0 = Qobj(sum(h_unperturbed), dims=spin.dims)
+    # In the LAB frame, the generator of the picture is null.
+    terms = picture_change_terms(spin, mode, h0, 0 * h0)
+    frequencies = np.atleast_1d(np.asarray(mode.frequencies, dtype=float))
+    amplitudes = np.atleast_1d(np.asarray(mode.amplitudes, dtype=float))
+    pulse_times = np.atleast_1d(np.asarray(mode.pulse_times, dtype=float))
+
+    u_lab = np.identity(spin.d, dtype=complex)
+    n_steps = 0
+    edges = _segment_edges(mode, duration)
+    for t_start, t_end in zip(edges[:-1], edges[1:]):
+        active = (pulse_times >= t_end) & (amplitudes != 0)
+        period = common_period(frequencies[active])
+        if period == np.inf:
+            # Constant Hamiltonian
+            h = picture_change_hamiltonians(terms[0], terms[2], terms[3], mode, [(t_start + t_end) / 2])[0]
+            u_lab = _exp_hermitian(h * (t_end - t_start)) @ u_lab
+            continue
+
+        n_periods = int(np.floor((t_end - t_start) / period * (1 + 1e-12)))
+        if n_periods > 0:
+            u_period, n = _adaptive_magnus(terms, mode, t_start, t_start + period, tol, duration, None)
+            n_steps += n
+            # u_period is unitary, hence normal: its Schur form is diagonal.
+            form, vectors = schur(u_period, output='complex')
+            u_lab = (vectors * np.diag(form) ** n_periods) @ vectors.conj().T @ u_lab
+        t_rest = t_start + n_periods * period
+        if t_end - t_rest > 1e-12 * (t_end - t_start):
+            u_rest, n = _adaptive_magnus(terms, mode, t_rest, t_end, tol, duration, None)
+            n_steps += n
+            u_lab = u_rest @ u_lab
+    add_solver_steps(n_steps)
+
+    u = Qobj(u_lab, dims=h0.dims)
+    if cache is not None:
+        cache.put(key, u)
+    return u
@@ -5,10 +5,24 @@
 #        |  1  |  omega_1  |    B_1    | phase_1 | theta_1 | phi_1 |   tau_1    |
 #        | ... |    ...    |    ...    |   ...   |   ...   |  ...  |    ...     |
 #        |  N  |  omega_N  |    B_N    | phase_N | theta_N | phi_N |   tau_N    |
+#
+# Besides 'square', the envelope of the modes can be shaped (see Pulses.envelope):
+#
+#        |      shape          |  shape_par (default)                                  |
+#        |---------------------|-------------------------------------------------------|
+#        | 'gaussian'          | 'sigma' (pulse_time / 6)                              |
+#        | 'sinc'              | 'lobes' (3)                                           |
+#        | 'hyperbolic_secant' | 'beta' (10.6 / pulse_time), 'mu' (5)                  |
+#        | 'sampled'           | 'times', 'amplitudes', 'phases' (0)                   |
+#
+# and, for every shape but 'sampled', 'n_slices' (100): the number of piecewise
+# constant slices of each mode in the piecewise solvers.
 import copy
 import numpy as np
 from dataclasses import dataclass, field
 
+PULSE_SHAPES = ("square", "gaussian", "sinc", "hyperbolic_secant", "sampled")
+
 @dataclass
 class Pulses:
     frequencies: list[float] = field(default_factory=lambda: [0.0])
@@ -18,9 +32,14 @@ class Pulses:
     phi_p: list[float] = field(default_factory=lambda: [0.0])
     pulse_times: list[float] = field(default_factory=lambda: [0.0])
     shape: str = "square"
+    shape_par: dict = field(default_factory=dict)
 
     def __post_init__(self):
         self.size=len(self.frequencies)
+        if self.shape not in PULSE_SHAPES:
+            raise ValueError(f"The shape of the pulse must be one of {PULSE_SHAPES}. Given: {self.shape}")
+        if self.shape == "sampled" and not {"times", "amplitudes"} <= set(self.shape_par):
+            raise ValueError("A sampled pulse requires the 'times' and 'amplitudes' of its samples in shape_par.")
 
     def copy(self):
         return copy.deepcopy(self)
@@ -32,4 +51,87 @@ class Pulses:
         self.phi_p = np.array(self.phi_p)
         self.pulse_times = np.array(self.pulse_times)
     def phase_add_pi(self):
-        self.phases = np.add(self.phases, np.pi) 
\ No newline at end of file
+        self.phases = np.add(self.phases, np.pi) 
+    def envelope(self, tlist) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluates the envelope of every mode at the given times: the field of
+        mode m is amplitude_m * a_m(t) * cos(frequency_m * t - phase_m - phi_m(t))
+        for t <= pulse_time_m, and 0 afterwards.
+
+        With t' = t - pulse_time / 2, the shapes are
+        - 'square': a = 1;
+        - 'gaussian': a = exp(-t'^2 / (2 sigma^2));
+        - 'sinc': a = sinc(2 lobes t' / pulse_time), with `lobes` zero
+          crossings on each side of the peak;
+        - 'hyperbolic_secant': a = sech(beta t') and phi = mu ln(sech(beta t')),
+          the adiabatic pulse whose frequency sweeps by +-mu beta;
+        - 'sampled': the samples a_k = amplitudes[k] and phi_k = phases[k] are
+          held from times[k] (in microseconds from the start of the pulse) to
+          the next sample time (or to the end of the pulse).
+        In all cases phi = 0 unless stated otherwise.
+
+        Parameters
+        ----------
+        tlist : numpy.ndarray
+            Times of evaluation (in microseconds).
+
+        Returns
+        -------
+        A tuple (a, phi) of numpy.ndarray of shape (size, len(tlist)), with
+        the relative amplitude and the phase (in radians) of each mode.
+        """
+        tlist = np.atleast_1d(np.asarray(tlist, dtype=float))
+        pulse_times = np.atleast_1d(np.asarray(self.pulse_times, dtype=float))[:, np.newaxis]
+        t_centered = tlist - pulse_times / 2
+        a = np.ones((self.size, len(tlist)))
+        phi = np.zeros((self.size, len(tlist)))
+        par = self.shape_par
+        if self.shape == "gaussian":
+            sigma = par.get("sigma", pulse_times / 6)
+            a = np.exp(-t_centered ** 2 / (2 * sigma ** 2))
+        elif self.shape == "sinc":
+            a = np.sinc(2 * par.get("lobes", 3) * t_centered / pulse_times)
+        elif self.shape == "hyperbolic_secant":
+            beta = par.get("beta", 10.6 / pulse_times)
+            a = 1 / np.cosh(beta * t_centered)
+            phi = par.get("mu", 5) * np.log(a)
+        elif self.shape == "sampled":
+            times = np.asarray(par["times"], dtype=float)
+            index = np.searchsorted(times, tlist, side="right") - 1
+            started = index >= 0
+            index = np.clip(index, 0, len(times) - 1)
+            a = np.where(started, np.asarray(par["amplitudes"], dtype=float)[index], 0.)
+            phi = np.where(started, np.asarray(par.get("phases", np.zeros(len(times))), dtype=float)[index], 0.)
+        a = np.broadcast_to(a, (self.size, len(tlist))) * (tlist <= pulse_times)
+        return a, np.broadcast_to(phi, (self.size, len(tlist)))
+
+    def instantaneous(self, t: float) -> "Pulses":
+        """
+        Returns the square pulse with the amplitudes and phases of the modes
+        at time t (in microseconds), i.e. the pulse of a piecewise constant
+        slice around t. Negative envelopes are turned into a phase shift of pi.
+        """
+        a, phi = self.envelope([t])
+        amplitudes = np.asarray(self.amplitudes, dtype=float) * a[:, 0]
+        square = self.copy()
+        square.shape, square.shape_par = "square", {}
+        square.amplitudes = np.abs(amplitudes)
+        square.phases = np.asarray(self.phases, dtype=float) + phi[:, 0] + np.pi * (amplitudes < 0)
+        return square
+
+    def slice_edges(self, duration: float) -> np.ndarray:
+        """
+        Returns the edges of the intervals of [0, duration] where the pulse is
+        treated as constant by the piecewise solvers: the switch-off times of
+        the modes and, for shaped pulses, the sample times or 'n_slices'
+        uniform slices of each mode.
+        """
+        pulse_times = np.atleast_1d(np.asarray(self.pulse_times, dtype=float))
+        edges = [[0.0, duration], pulse_times]
+        if self.shape == "sampled":
+            edges.append(np.asarray(self.shape_par["times"], dtype=float))
+        elif self.shape != "square":
+            n_slices = self.shape_par.get("n_slices", 100)
+            edges.extend(np.linspace(0, tau, n_slices + 1) for tau in pulse_times)
+        edges = np.concatenate(edges)
+        return np.unique(edges[(edges >= 0) & (edges <= duration)])
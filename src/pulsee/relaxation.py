@@ -0,0 +1,142 @@
+import numpy as np
+from qutip import Qobj
+from scipy.constants import Boltzmann, Planck
+
+from .nuclear_spin import ManySpins, NuclearSpin
+
+
+def _per_spin(value, n_spins: int, name: str) -> list:
+    if value is None or np.isscalar(value):
+        return [value] * n_spins
+    value = list(value)
+    if len(value) != n_spins:
+        raise ValueError(f"{name} must be a number or a list with one value per spin. Given {len(value)} values "
+                         f"for {n_spins} spins.")
+    return value
+
+
+def relaxation_operators(
+    spin: NuclearSpin | ManySpins,
+    T1: float | list[float] | None = None,
+    T2: float | list[float] | None = None,
+    h_unperturbed: list[Qobj] | None = None,
+    temperature: float | None = None,
+) -> list[Qobj]:
+    """
+    Returns the Lindblad (collapse) operators which describe the longitudinal
+    (T1) and transverse (T2) relaxation of each spin of the system, to be
+    passed to evolve and FID_signal as c_ops.
+
+    Longitudinal relaxation is described by the raising and lowering
+    operators I+ and I- of each spin. For a spin 1/2, the z component of the
+    magnetization relaxes with rate 1/T1 towards its equilibrium value and
+    the coherences decay with rate 1/(2 T1). Pure dephasing is described by
+    Iz, with the rate which brings the total decay rate of the single-quantum
+    coherences to 1/T2.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    T1 : float or list of float
+        Longitudinal relaxation time of the spins (in microseconds), either
+        the same for all of them or one per spin. None (or infinity) means no
+        longitudinal relaxation.
+        Default is None.
+    T2 : float or list of float
+        Transverse relaxation time of the spins (in microseconds), either the
+        same for all of them or one per spin. It must not exceed 2 T1. None
+        (or infinity) means no relaxation beyond the one due to T1.
+        Default is None.
+    h_unperturbed : List[Qobj]
+        Unperturbed Hamiltonian of the system (in MHz), which sets the
+        direction of the Larmor precession of each spin and thus which of I+
+        and I- lowers the energy. Required when temperature is given.
+        Default is None.
+    temperature : float
+        Temperature of the lattice (in kelvin), which sets the equilibrium
+        populations with the same convention as canonical_density_matrix.
+        Default is None (infinite temperature: the spins relax towards the
+        identity).
+
+    Returns
+    -------
+    A list of Qobj, with the collapse operators (in units of
+    microseconds^(-1/2)).
+
+    Raises
+    ------
+    ValueError, when T2 > 2 T1 or when temperature is given without
+    h_unperturbed.
+    """
+    if temperature is not None and h_unperturbed is None:
+        raise ValueError("The equilibrium at finite temperature requires h_unperturbed.")
+    spins = spin.spins if isinstance(spin, ManySpins) else [spin]
+    t1s = _per_spin(T1, len(spins), "T1")
+    t2s = _per_spin(T2, len(spins), "T2")
+    if h_unperturbed is not None:
+        h0 = Qobj(sum(h_unperturbed), dims=spin.dims)
+
+    c_ops = []
+    for n, (s, t1, t2) in enumerate(zip(spins, t1s, t2s)):
+        def embed(op):
+            return spin.embed(op, n) if isinstance(spin, ManySpins) else op
+
+        rate_1 = 0. if t1 is None else 1 / t1
+        # Without T2, the coherences decay only through T1.
+        rate_2 = rate_1 / 2 if t2 is None or np.isinf(t2) else 1 / t2
+        dephasing = rate_2 - rate_1 / 2
+        if dephasing < -1e-12 * max(rate_1, rate_2):
+            raise ValueError(f"T2 cannot exceed 2 T1. Given T1 = {t1}, T2 = {t2}.")
+
+        if rate_1 > 0:
+            # Fraction of the transitions which raise the energy: 1/2 at
+            # infinite temperature.
+            up_fraction, lowering = 0.5, s.I["+"]
+            if h_unperturbed is not None:
+                i_z = embed(s.I["z"])
+                larmor = np.real((h0 * i_z).tr()) / np.real((i_z * i_z).tr())
+                # The energy larmor * m grows with m for a positive larmor.
+                lowering = s.I["-"] if larmor > 0 else s.I["+"]
+                if temperature is not None:
+                    boltzmann = np.exp(-(Planck / Boltzmann) * abs(larmor) * 2 * np.pi * 1e6 / temperature)
+                    up_fraction = boltzmann / (1 + boltzmann)
+            raising = lowering.dag()
+            c_ops.append(embed(np.sqrt(rate_1 * (1 - up_fraction)) * lowering))
+            if up_fraction > 0:
+                c_ops.append(embed(np.sqrt(rate_1 * up_fraction) * raising))
+        if dephasing > 0:
+            c_ops.append(embed(np.sqrt(2 * dephasing) * s.I["z"]))
+    return [Qobj(op) for op in c_ops]
+
+
+def collapse_operators(
+    spin: NuclearSpin | ManySpins, c_ops: list[Qobj] | dict | None, h_unperturbed: list[Qobj] | None = None
+) -> list[Qobj]:
+    """
+    Normalizes the relaxation argument of evolve and FID_signal into a list
+    of collapse operators.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    c_ops : List[Qobj], dict or None
+        Either a list of Lindblad operators (in units of
+        microseconds^(-1/2)), or a dictionary of keyword arguments of
+        relaxation_operators (e.g. {'T1': 100, 'T2': 50}), or None.
+    h_unperturbed : List[Qobj]
+        Unperturbed Hamiltonian of the system (in MHz), passed to
+        relaxation_operators when c_ops is a dictionary.
+
+    Returns
+    -------
+    A (possibly empty) list of Qobj.
+    """
+    if c_ops is None:
+        return []
+    if isinstance(c_ops, dict):
+        return relaxation_operators(spin, h_unperturbed=h_unperturbed, **c_ops)
+    if isinstance(c_ops, Qobj):
+        return [c_ops]
+    return list(c_ops)
@@ -0,0 +1,523 @@
+from dataclasses import dataclass, field
+from math import lcm
+from typing import Callable
+
+import numpy as np
+from qutip import Options, Qobj
+
+from .hamiltonians import rotation_sense
+from .nuclear_spin import ManySpins, NuclearSpin
+from .profiling import profiled, stage
+from .propagators import (adaptive_magnus_propagator, apply_propagator, default_propagator_cache,
+                          floquet_magnus_propagator, free_propagator, lindblad_propagator, pulse_propagator,
+                          rwa_propagator, PropagatorCache)
+from .pulses import Pulses
+from .relaxation import collapse_operators
+from .simulation import FID_signal
+
+# Solvers which can compute the propagator of a pulse of a sequence.
+SEQUENCE_SOLVERS = ("propagator", "rwa", "adaptive_magnus", "floquet_magnus")
+
+
+@dataclass
+class Pulse:
+    """
+    Pulse of a PulseSequence.
+
+    Attributes
+    ----------
+    mode : Pulses
+        The pulse, as in evolve. Its duration is the longest of its pulse
+        times.
+    phase_cycle : list of float
+        Phases (in radians) added to all the modes of the pulse at the
+        successive steps of the phase cycle, repeated periodically.
+        Default is None (no cycling).
+    solver : str
+        Solver of this pulse (one of SEQUENCE_SOLVERS), overriding the one of
+        the sequence. Default is None.
+    label : str
+        Optional name of the element.
+    """
+    mode: Pulses
+    phase_cycle: list[float] | None = None
+    solver: str | None = None
+    label: str | None = None
+
+    @property
+    def duration(self) -> float:
+        return float(np.max(self.mode.pulse_times))
+
+
+@dataclass
+class Delay:
+    """
+    Free evolution of a PulseSequence.
+
+    Attributes
+    ----------
+    duration : float
+        Duration of the delay (in microseconds).
+    label : str
+        Optional name of the element.
+    """
+    duration: float
+    label: str | None = None
+
+
+@dataclass
+class Acquisition:
+    """
+    Acquisition window of a PulseSequence: a free evolution during which the
+    FID signal is recorded, with the arguments of FID_signal.
+
+    Attributes
+    ----------
+    duration : float
+        Duration of the acquisition (in microseconds).
+    n_points : int
+        Number of samples of the signal. Default is 1000.
+    T2 : float, function or list
+        Decay envelope of the signal, as in FID_signal. Default is 100.
+    theta, phi : float
+        Angles of the normal to the plane of detection (in radians).
+        Default is 0.
+    ref_freq : float
+        Frequency of the measurement apparatus (in MHz). Default is 0.
+    label : str
+        Optional name of the element.
+    """
+    duration: float
+    n_points: int = 1000
+    T2: float | list[float] | Callable[[float], float] | list[Callable[[float], float]] = 100
+    theta: float = 0.
+    phi: float = 0.
+    ref_freq: float = 0.
+    label: str | None = None
+
+
+@dataclass
+class PulseSequence:
+    """
+    Sequence of pulses, delays and acquisition windows, together with its
+    phase cycle, to be evaluated in a single call by evolve_sequence (one
+    step of the cycle) or phase_cycle (all the steps).
+
+    The sequence can be built element by element:
+
+        sequence = PulseSequence().pulse(pi_half).delay(tau).pulse(pi).acquire(100)
+
+    Attributes
+    ----------
+    elements : list of Pulse, Delay and Acquisition
+        Elements of the sequence, in chronological order.
+    receiver_cycle : list of float
+        Phases (in radians) of the receiver at the successive steps of the
+        phase cycle, repeated periodically. The signal of step k is
+        multiplied by exp(-i receiver_phase(k)), so that the signals of all
+        the steps are simply added up. Default is None (no cycling).
+    """
+    elements: list = field(default_factory=list)
+    receiver_cycle: list[float] | None = None
+
+    def pulse(self, mode: Pulses, phase_cycle: list[float] | None = None, solver: str | None = None,
+              label: str | None = None) -> "PulseSequence":
+        """
+        Appends a pulse to the sequence and returns the sequence.
+        """
+        self.elements.append(Pulse(mode, phase_cycle, solver, label))
+        return self
+
+    def delay(self, duration: float, label: str | None = None) -> "PulseSequence":
+        """
+        Appends a free evolution to the sequence and returns the sequence.
+        """
+        self.elements.append(Delay(duration, label))
+        return self
+
+    def acquire(self, duration: float, **kwargs) -> "PulseSequence":
+        """
+        Appends an acquisition window (see Acquisition for the keyword
+        arguments) to the sequence and returns the sequence.
+        """
+        self.elements.append(Acquisition(duration, **kwargs))
+        return self
+
+    @property
+    def duration(self) -> float:
+        return float(sum(element.duration for element in self.elements))
+
+    @property
+    def n_cycle_steps(self) -> int:
+        """
+        Number of steps of the phase cycle: the least common multiple of the
+        lengths of the cycles of the pulses and of the receiver.
+        """
+        cycles = [e.phase_cycle for e in self.elements if isinstance(e, Pulse)] + [self.receiver_cycle]
+        return lcm(*(len(cycle) for cycle in cycles if cycle))
+
+    def receiver_phase(self, step: int) -> float:
+        """
+        Returns the phase of the receiver (in radians) at the given step of
+        the phase cycle.
+        """
+        if not self.receiver_cycle:
+            return 0.
+        return self.receiver_cycle[step % len(self.receiver_cycle)]
+
+
+@dataclass
+class SequenceResult:
+    """
+    Result of evolve_sequence.
+
+    Attributes
+    ----------
+    state : Qobj
+        Density matrix at the end of the sequence.
+    states : list of Qobj or None
+        Density matrices at the end of each element of the sequence, when
+        requested with return_allstates.
+    signals : list of tuple(numpy.ndarray, numpy.ndarray)
+        Times (measured from the start of the window) and signal of each
+        acquisition window, including the phase of the receiver.
+    step : int
+        Step of the phase cycle which was evaluated.
+    """
+    state: Qobj
+    states: list[Qobj] | None
+    signals: list[tuple[np.ndarray, np.ndarray]]
+    step: int
+
+
+def cycled_mode(spin: NuclearSpin | ManySpins, pulse: Pulse, step: int) -> Pulses:
+    """
+    Returns the pulse of the given step of the phase cycle, with the phase
+    convention of evolve (pi is added to the phases for positive gamma).
+    """
+    mode = pulse.mode.copy()
+    mode.numpify()
+    if pulse.phase_cycle:
+        mode.phases = mode.phases + pulse.phase_cycle[step % len(pulse.phase_cycle)]
+    if spin.gyro_ratio_over_2pi > 0:
+        mode.phase_add_pi()
+    return mode
+
+
+def _pulse_propagator(spin, h_unperturbed, mode, duration, solver, c_ops, opts, magnus_tol, cache):
+    if solver not in SEQUENCE_SOLVERS:
+        raise ValueError(f"The solver of a pulse of a sequence must be one of {SEQUENCE_SOLVERS}. Given: {solver}")
+    if c_ops and solver != "propagator":
+        raise NotImplementedError(f"Relaxation (c_ops) is not implemented with the {solver} solver. "
+                                  "Use propagator instead.")
+    if solver == "propagator":
+        return pulse_propagator(spin, h_unperturbed, mode, duration, opts=opts, cache=cache, c_ops=c_ops)
+    if solver == "rwa":
+        return rwa_propagator(spin, h_unperturbed, mode, duration, cache=cache)
+    if solver == "adaptive_magnus":
+        return adaptive_magnus_propagator(spin, h_unperturbed, mode, duration, tol=magnus_tol, cache=cache)
+    return floquet_magnus_propagator(spin, h_unperturbed, mode, duration, tol=magnus_tol, cache=cache)
+
+
+def compile_sequence(
+    spin: NuclearSpin | ManySpins,
+    h_unperturbed: list[Qobj],
+    sequence: PulseSequence,
+    solver: str = "propagator",
+    c_ops: list[Qobj] | dict | None = None,
+    step: int = 0,
+    opts: dict | None = None,
+    magnus_tol: float = 1e-8,
+    cache: PropagatorCache | None = default_propagator_cache,
+) -> list[Qobj]:
+    """
+    Returns the propagators of the elements of a pulse sequence at the given
+    step of its phase cycle.
+
+    Delays and acquisition windows are propagated in closed form, with the
+    exponential of the time-independent h_unperturbed (or of its Liouvillian,
+    with relaxation), and pulses with the propagator of the chosen solver.
+    All of them are stored in the propagator cache, so that repeated delays
+    and pulses, and later evaluations of the same sequence, cost no
+    integration.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Time-independent unperturbed Hamiltonian of the system (in MHz).
+    sequence : PulseSequence
+        Sequence to be compiled.
+    solver : str
+        Solver of the pulses, one of SEQUENCE_SOLVERS (see evolve), unless
+        overridden by the pulse itself.
+        Default is 'propagator'.
+    c_ops : List[Qobj] or dict
+        Relaxation of the system, as in evolve. Only supported by the
+        'propagator' solver, the propagators are then superoperators.
+        Default is None.
+    step : int
+        Step of the phase cycle.
+        Default is 0.
+    opts : dict
+        Options of QuTiP's propagator (solver 'propagator').
+        Default is None (atol=rtol=1e-14, as in evolve).
+    magnus_tol : float
+        Tolerance of the adaptive_magnus and floquet_magnus solvers.
+        Default is 1e-8.
+    cache : PropagatorCache or None
+        Cache of the propagators.
+        Default is the module-level cache `default_propagator_cache`.
+
+    Returns
+    -------
+    A list of Qobj, one propagator per element of the sequence, to be
+    applied with apply_propagator.
+    """
+    c_ops = collapse_operators(spin, c_ops, h_unperturbed)
+    if opts is None:
+        opts = Options(atol=1e-14, rtol=1e-14)
+
+    propagators = []
+    for element in sequence.elements:
+        if isinstance(element, Pulse):
+            mode = cycled_mode(spin, element, step)
+            u = _pulse_propagator(spin, h_unperturbed, mode, element.duration, element.solver or solver, c_ops,
+                                  opts, magnus_tol, cache)
+        elif c_ops:
+            u = lindblad_propagator(h_unperturbed, c_ops, element.duration, cache=cache)
+        else:
+            u = free_propagator(h_unperturbed, element.duration, cache=cache)
+        propagators.append(u)
+    return propagators
+
+
+@profiled("evolve_sequence")
+def evolve_sequence(
+    spin: NuclearSpin | ManySpins,
+    h_unperturbed: list[Qobj],
+    dm_initial: Qobj,
+    sequence: PulseSequence,
+    solver: str = "propagator",
+    c_ops: list[Qobj] | dict | None = None,
+    step: int = 0,
+    return_allstates: bool = False,
+    opts: dict | None = None,
+    magnus_tol: float = 1e-8,
+) -> SequenceResult:
+    """
+    Evolves a density matrix through a whole pulse sequence in one call,
+    recording the signal of its acquisition windows.
+
+    The sequence is first compiled into one propagator per element (see
+    compile_sequence), which are then applied in turn. Each pulse follows the
+    conventions of evolve with the same solver, and the signal of each
+    acquisition window is the one of FID_signal, multiplied by
+    exp(-i receiver_phase(step)).
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Time-independent unperturbed Hamiltonian of the system (in MHz).
+    dm_initial : Qobj
+        Density matrix of the system at the start of the sequence.
+    sequence : PulseSequence
+        Sequence to be evaluated.
+    solver : str
+        Solver of the pulses, one of SEQUENCE_SOLVERS.
+        Default is 'propagator'.
+    c_ops : List[Qobj] or dict
+        Relaxation of the system, as in evolve.
+        Default is None.
+    step : int
+        Step of the phase cycle.
+        Default is 0.
+    return_allstates : bool
+        Whether to return the state at the end of every element.
+        Default is False.
+    opts : dict
+        Options of QuTiP's propagator (solver 'propagator').
+        Default is None.
+    magnus_tol : float
+        Tolerance of the adaptive_magnus and floquet_magnus solvers.
+        Default is 1e-8.
+
+    Returns
+    -------
+    A SequenceResult.
+    """
+    c_ops = collapse_operators(spin, c_ops, h_unperturbed)
+    with stage("compilation"):
+        propagators = compile_sequence(spin, h_unperturbed, sequence, solver, c_ops, step, opts, magnus_tol)
+
+    receiver = np.exp(-1j * sequence.receiver_phase(step))
+    state = Qobj(dm_initial)
+    states = [] if return_allstates else None
+    signals = []
+    for element, u in zip(sequence.elements, propagators):
+        if isinstance(element, Acquisition):
+            with stage("acquisition"):
+                times, fid = FID_signal(spin, h_unperturbed, state, element.duration, T2=element.T2,
+                                        theta=element.theta, phi=element.phi, ref_freq=element.ref_freq,
+                                        n_points=element.n_points, c_ops=c_ops)
+            signals.append((times, fid * receiver))
+        with stage("solve"):
+            state = apply_propagator(u, state)
+        if return_allstates:
+            states.append(state)
+    return SequenceResult(state=state, states=states, signals=signals, step=step)
+
+
+@dataclass
+class PhaseCycleResult:
+    """
+    Result of phase_cycle.
+
+    Attributes
+    ----------
+    states : numpy.ndarray
+        Array of shape (n_steps, d, d) of the density matrices at the end of
+        the sequence, one per step of the phase cycle.
+    signals : list of tuple(numpy.ndarray, numpy.ndarray)
+        Times (measured from the start of the window) and co-added signal of
+        each acquisition window: the sum over the steps of the signals
+        weighted by exp(-i receiver_phase(step)).
+    weights : numpy.ndarray
+        The weights exp(-i receiver_phase(step)) of the steps.
+    dims : list
+        Dimensions of the density matrices (as in Qobj.dims).
+    """
+    states: np.ndarray
+    signals: list[tuple[np.ndarray, np.ndarray]]
+    weights: np.ndarray
+    dims: list
+
+    def state(self, step: int) -> Qobj:
+        """
+        Returns the density matrix at the end of the given step as a Qobj.
+        """
+        return Qobj(self.states[step], dims=self.dims)
+
+
+@profiled("phase_cycle")
+def phase_cycle(
+    spin: NuclearSpin | ManySpins,
+    h_unperturbed: list[Qobj],
+    dm_initial: Qobj,
+    sequence: PulseSequence,
+    solver: str = "rwa",
+    c_ops: list[Qobj] | dict | None = None,
+    opts: dict | None = None,
+    magnus_tol: float = 1e-8,
+) -> PhaseCycleResult:
+    """
+    Evaluates all the steps of the phase cycle of a pulse sequence in one
+    batched pass, and returns the signals co-added by the receiver.
+
+    Since the signal is linear in the density matrix, the states of all the
+    steps at the start of an acquisition window are first summed with the
+    weights of the receiver, and a single FID is computed from their sum.
+
+    Within the rotating-wave approximation (solver 'rwa'), shifting the phase
+    of a pulse by delta amounts to conjugating its propagator by the rotation
+    exp(i sense delta Iz) about z, which is diagonal. The propagator of each
+    pulse is then computed once, and those of all the steps are obtained by
+    multiplying its elements by phase factors. With the other solvers each
+    distinct phase of a pulse takes one (cached) propagator. In both cases
+    the states of all the steps are propagated together as a stack of
+    matrices.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Time-independent unperturbed Hamiltonian of the system (in MHz).
+    dm_initial : Qobj
+        Density matrix of the system at the start of the sequence.
+    sequence : PulseSequence
+        Sequence, with the phase cycles of its pulses and of its receiver.
+    solver : str
+        Solver of the pulses, one of SEQUENCE_SOLVERS.
+        Default is 'rwa'.
+    c_ops : List[Qobj] or dict
+        Relaxation of the system, as in evolve (solver 'propagator' only).
+        Default is None.
+    opts : dict
+        Options of QuTiP's propagator (solver 'propagator').
+        Default is None.
+    magnus_tol : float
+        Tolerance of the adaptive_magnus and floquet_magnus solvers.
+        Default is 1e-8.
+
+    Returns
+    -------
+    A PhaseCycleResult.
+    """
+    c_ops = collapse_operators(spin, c_ops, h_unperturbed)
+    if opts is None:
+        opts = Options(atol=1e-14, rtol=1e-14)
+    n_steps = sequence.n_cycle_steps
+    steps = np.arange(n_steps)
+    weights = np.exp(-1j * np.array([sequence.receiver_phase(k) for k in steps]))
+    rho0 = Qobj(dm_initial)
+    d = rho0.shape[0]
+
+    sense = rotation_sense(spin, Qobj(sum(h_unperturbed), dims=spin.dims))
+    m = np.real(spin.I["z"].diag())
+
+    with stage("compilation"):
+        propagators = []
+        for element in sequence.elements:
+            if not isinstance(element, Pulse):
+                if c_ops:
+                    u = lindblad_propagator(h_unperturbed, c_ops, element.duration)
+                else:
+                    u = free_propagator(h_unperturbed, element.duration)
+                propagators.append(u.full())
+                continue
+            pulse_solver = element.solver or solver
+            if pulse_solver == "rwa" and element.phase_cycle:
+                u = _pulse_propagator(spin, h_unperturbed, cycled_mode(spin, element, 0), element.duration,
+                                      pulse_solver, c_ops, opts, magnus_tol, default_propagator_cache).full()
+                cycle = np.asarray(element.phase_cycle, dtype=float)
+                increments = cycle[steps % len(cycle)] - cycle[0]
+                rotations = np.exp(1j * sense * increments[:, np.newaxis] * m[np.newaxis, :])
+                propagators.append(rotations[:, :, np.newaxis] * u * rotations.conj()[:, np.newaxis, :])
+            elif element.phase_cycle:
+                propagators.append(np.array([
+                    _pulse_propagator(spin, h_unperturbed, cycled_mode(spin, element, k), element.duration,
+                                      pulse_solver, c_ops, opts, magnus_tol, default_propagator_cache).full()
+                    for k in steps]))
+            else:
+                propagators.append(_pulse_propagator(spin, h_unperturbed, cycled_mode(spin, element, 0),
+                                                     element.duration, pulse_solver, c_ops, opts, magnus_tol,
+                                                     default_propagator_cache).full())
+
+    # The states of all the steps, as matrices (n_steps, d, d) or, with
+    # relaxation, as column-stacked vectors (n_steps, d^2).
+    if c_ops:
+        states = np.tile(rho0.full().flatten(order="F"), (n_steps, 1))
+    else:
+        states = np.tile(rho0.full(), (n_steps, 1, 1))
+
+    def as_matrices(vectors):
+        return vectors if not c_ops else vectors.reshape(n_steps, d, d).transpose(0, 2, 1)
+
+    signals = []
+    for element, u in zip(sequence.elements, propagators):
+        if isinstance(element, Acquisition):
+            with stage("acquisition"):
+                coadded = Qobj(np.tensordot(weights, as_matrices(states), axes=1), dims=rho0.dims)
+                signals.append(FID_signal(spin, h_unperturbed, coadded, element.duration, T2=element.T2,
+                                          theta=element.theta, phi=element.phi, ref_freq=element.ref_freq,
+                                          n_points=element.n_points, c_ops=c_ops))
+        with stage("solve"):
+            if c_ops:
+                states = np.einsum("...ij,...j->...i", u, states)
+            else:
+                states = u @ states @ np.conj(np.swapaxes(u, -1, -2))
+    return PhaseCycleResult(states=as_matrices(states), signals=signals, weights=weights, dims=rho0.dims)
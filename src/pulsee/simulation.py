@@ -1,6 +1,7 @@
 """ "Main" file of the PULSEE package. """
 
 # Standard library imports
+import os
 import sys
 from typing import Callable
 
@@ -8,17 +9,24 @@ from typing import Callable
 import numpy as np
 import pandas as pd
 from numpy.typing import NDArray
-from qutip import Options, Qobj, expect, mesolve, qeye, tensor
+from qutip import Options, Qobj, expect, mesolve
 from qutip.ipynbtools import parallel_map as ipynb_parallel_map
 from qutip.solver.parallel import parallel_map
 from scipy.fft import fft, fftfreq, fftshift
-from tqdm import tqdm, trange
+from scipy.signal import fftconvolve
+from scipy.special import voigt_profile
 
 
 from .hamiltonians import h_multiple_mode_pulse, magnus, make_h_unperturbed, multiply_by_2pi
 from .nuclear_spin import ManySpins, NuclearSpin
 # Local imports
-from .operators import (apply_exp_op, canonical_density_matrix, changed_picture, exp_diagonalize)
+from .operators import (StaticHamiltonian, apply_exp_op, canonical_density_matrix, changed_picture,
+                        diagonalize_hamiltonian, eigenbasis_evolve, eigenbasis_expect, exp_diagonalize,
+                        krylov_propagate, static_hamiltonian, use_krylov)
+from .profiling import add_solver_steps, profiled, profiled_mesolve, stage
+from .propagators import (adaptive_magnus_propagator, apply_propagator, floquet_magnus_propagator,
+                          lindblad_propagator, pulse_propagator, rwa_propagator)
+from .relaxation import collapse_operators
 from .spin_squeezing import coherent_spin_state
 from .pulses import Pulses
 
@@ -37,6 +45,7 @@ def nuclear_system_setup(
         h_user: np.ndarray =None,
         initial_state: str | np.ndarray | dict ="canonical",
         temperature: float =1e-4,
+        sparse: bool =False,
 ) -> NuclearSpin | ManySpins | Qobj | list[Qobj]:
     """
     Sets up the nuclear system under study, returning the objects representing
@@ -212,6 +221,11 @@ def nuclear_system_setup(
         Qobj representing the state of thermal equilibrium at the
         temperature specified by the same-named argument.
 
+        If the keyword high_temperature is passed, the state of thermal
+        equilibrium is linearized in the inverse temperature (see
+        operators.canonical_density_matrix), which is suitable for
+        room-temperature NMR and needs no diagonalization.
+
         If a dictionary {'theta' : rad, 'phi' : rad} is passed, a spin coherent
         state is created. Can pass a list of dictionaries for a ManySpins system
         to create a tensor product state.
@@ -225,14 +239,25 @@ def nuclear_system_setup(
         Temperature of the system (in kelvin).
         Default value is 1e-4.
 
+    sparse : bool
+        When True and spin_par describes more than one spin, the operators of
+        the ManySpins system and the terms of the unperturbed Hamiltonian are
+        built and stored in CSR format (see ManySpins). The initial state is
+        not affected: initial_state='canonical' still diagonalizes the total
+        Hamiltonian as a dense d x d matrix and returns a dense density
+        matrix. Only 'high_temperature' (and the coherent states) avoid the
+        dense O(d^3) diagonalization.
+        Default value is False.
+
     Returns
     -------
     [0]: NuclearSpin / ManySpins
         The single spin/spin system subject to the NMR/NQR experiment.
 
-    [1]: List[Qobj]
+    [1]: StaticHamiltonian
         The unperturbed Hamiltonian, consisting of the Zeeman, quadrupolar
-        and J-coupling terms (expressed in MHz).
+        and J-coupling terms (expressed in MHz), as a list of Qobj which
+        memoizes its eigendecomposition (see operators.StaticHamiltonian).
 
     [2]: Qobj
         The density matrix representing the state of the system at time t=0,
@@ -252,10 +277,10 @@ def nuclear_system_setup(
         spin_system = NuclearSpin(spin_par[0]["quantum number"], spin_par[0]["gamma/2pi"])
     else:
         spins = [NuclearSpin(par["quantum number"], par["gamma/2pi"]) for par in spin_par]
-        spin_system = ManySpins(spins)
+        spin_system = ManySpins(spins, sparse=sparse)
 
     # Very ugly to have this many arguments, so might make a "InitialParams" class
-    h_unperturbed = make_h_unperturbed(
+    h_unperturbed = StaticHamiltonian(make_h_unperturbed(
         spin_system,
         spin_par,
         quad_par,
@@ -268,7 +293,7 @@ def nuclear_system_setup(
         h_tensor_inter,
         j_sec_param,
         h_user,
-    )
+    ))
 
     dm_initial = make_dm_initial(initial_state, spin_system, h_unperturbed, temperature)
 
@@ -280,7 +305,10 @@ def make_dm_initial(initial_state, spin_system, h_unperturbed, temperature) -> Q
     Helper for 'nuclear_system_setup' in simulation.py
     """
     if isinstance(initial_state, str) and initial_state == "canonical":
-        dm_initial = canonical_density_matrix(Qobj(sum(h_unperturbed)), temperature)
+        dm_initial = canonical_density_matrix(static_hamiltonian(h_unperturbed), temperature)
+
+    elif isinstance(initial_state, str) and initial_state == "high_temperature":
+        dm_initial = canonical_density_matrix(static_hamiltonian(h_unperturbed), temperature, high_temperature=True)
 
     elif isinstance(initial_state, dict):
         dm_initial = coherent_spin_state(spin_system, [initial_state])
@@ -296,8 +324,12 @@ def make_dm_initial(initial_state, spin_system, h_unperturbed, temperature) -> Q
     return dm_initial
 
 
-def power_absorption_spectrum(spin: NuclearSpin | ManySpins, h_unperturbed: list[Qobj], 
-                              normalized: bool =True, dm_initial: Qobj | None =None) -> list:
+def power_absorption_spectrum(spin: NuclearSpin | ManySpins, h_unperturbed: Qobj | list[Qobj],
+                              normalized: bool =True, dm_initial: Qobj | None =None,
+                              threshold: float | None =None,
+                              frequency_window: tuple[float, float] | None =None,
+                              sort: bool =False, merge_tolerance: float | None =None
+                              ) -> tuple[np.ndarray, np.ndarray]:
     """
     Computes the spectrum of power absorption of the system due to x-polarized
     monochromatic pulses.
@@ -307,8 +339,9 @@ def power_absorption_spectrum(spin: NuclearSpin | ManySpins, h_unperturbed: list
     spin : NuclearSpin / ManySpins
         Single spin/spin system under study.
 
-    h_unperturbed : Operator
-        Unperturbed Hamiltonian of the system (in MHz).
+    h_unperturbed : Qobj or list of Qobj
+        Unperturbed Hamiltonian of the system (in MHz), or the list of its
+        terms.
 
     normalized : bool
         Specifies whether the difference between the states' populations are
@@ -325,6 +358,29 @@ def power_absorption_spectrum(spin: NuclearSpin | ManySpins, h_unperturbed: list
         The default value is None, and it should be left so only when
         normalized=True, since the initial density matrix is not needed.
 
+    threshold : float or None
+        When given, the lines whose intensity is lower than this fraction of
+        the intensity of the strongest line are discarded.
+        Default value is None (all the lines are kept).
+
+    frequency_window : tuple of two floats or None
+        When given, only the lines whose frequency lies in the closed
+        interval [frequency_window[0], frequency_window[1]] (in MHz) are
+        kept.
+        Default value is None.
+
+    sort : bool
+        Whether to sort the lines by increasing frequency.
+        Default value is False, in which case the lines are listed in the
+        order of the pairs (i, j) of eigenstates with i < j.
+
+    merge_tolerance : float or None
+        When given, the lines are sorted and those whose frequencies differ
+        from the previous one by no more than merge_tolerance (in MHz) are
+        merged into a single line, whose intensity is the sum of the merged
+        intensities and whose frequency is their intensity-weighted mean.
+        Default value is None.
+
     Action
     ------
     Diagonalises h_unperturbed and computes the frequencies of transitions
@@ -335,58 +391,61 @@ def power_absorption_spectrum(spin: NuclearSpin | ManySpins, h_unperturbed: list
     or not taking into account the states' populations, according to the value
     of normalized).
 
+    All the d(d-1)/2 transitions are computed at once from the matrix of
+    energy differences and the squared moduli of the matrix elements of the
+    magnetic moment in the basis of the eigenstates, without any loop over
+    the pairs of levels.
+
     Returns
     -------
-    [0]: The list of the frequencies of transition between the eigenstates of
+    [0]: The array of the frequencies of transition between the eigenstates of
          h_unperturbed (in MHz);
 
-    [1]: The list of the corresponding intensities (in arbitrary units).
+    [1]: The array of the corresponding intensities (in arbitrary units).
     """
     if not normalized and dm_initial is None:
-        raise ValueError("argument `dm_initial` cannot be None if `normalized` is set to True!")
-    # dims = [s.d for s in spin.spin]
-    dims = h_unperturbed[0].dims
-    shape = h_unperturbed[0].shape
-    h_unperturbed_sum = Qobj(sum(h_unperturbed), dims=dims)
-    energies, o_change_of_basis = h_unperturbed_sum.eigenstates()
-    transition_frequency = []
-    transition_intensity = []
-
-    # assume that this Hamiltonian is a rank-1 tensor
-    d = sum(h_unperturbed_sum.dims[0])
-    print(f"PRINTING OUT DIMS[0]: {h_unperturbed_sum.dims[0]}")
+        raise ValueError("argument `dm_initial` cannot be None if `normalized` is set to False!")
+    energies, change_of_basis = diagonalize_hamiltonian(static_hamiltonian(h_unperturbed))
+
     # Operator of the magnetic moment of the spin system
     if isinstance(spin, ManySpins):
-        magnetic_moment = Qobj(np.zeros(shape), dims=dims)
-        for i in range(spin.n_spins):
-            mm_i = spin.spins[i].gyro_ratio_over_2pi * spin.spins[i].I["x"]
-            for j in range(i):
-                mm_i = tensor(Qobj(qeye(spin.spins[j].d)), mm_i)
-            for k in range(spin.n_spins)[i + 1 :]:
-                mm_i = tensor(mm_i, Qobj(qeye(spin.spins[k].d)))
-            magnetic_moment += mm_i
+        magnetic_moment = sum(spin.embed(s.gyro_ratio_over_2pi * s.I['x'], i).full()
+                              for i, s in enumerate(spin.spins))
     else:
-        magnetic_moment = spin.gyro_ratio_over_2pi * spin.I["x"]
-
-    mm_in_basis_of_eigenstates = magnetic_moment.transform(o_change_of_basis)
-
-    for i in range(d):
-        for j in range(d):
-            if i < j:
-                nu = np.absolute(energies[j] - energies[i])
-                transition_frequency.append(nu)
-                intensity_nu = nu * np.absolute(mm_in_basis_of_eigenstates[j, i]) ** 2
-                if not normalized:
-                    assert isinstance(dm_initial, Qobj), "`dm_initial` must have type Qobj!"
-                    p_i = dm_initial[i, i]
-                    p_j = dm_initial[j, j]
-                    intensity_nu = np.absolute(p_i - p_j) * intensity_nu
-                transition_intensity.append(intensity_nu)
-            else:
-                pass
+        magnetic_moment = spin.gyro_ratio_over_2pi * spin.I['x'].full()
+    mm_in_basis_of_eigenstates = change_of_basis.conj().T @ magnetic_moment @ change_of_basis
+
+    i, j = np.triu_indices(len(energies), k=1)
+    transition_frequency = np.absolute(np.subtract.outer(energies, energies)[j, i])
+    transition_intensity = transition_frequency * np.absolute(mm_in_basis_of_eigenstates[j, i]) ** 2
+    if not normalized:
+        assert isinstance(dm_initial, Qobj), "`dm_initial` must have type Qobj!"
+        # Populations of the eigenstates of h_unperturbed
+        populations = np.real(np.einsum('ki,kl,li->i', change_of_basis.conj(), dm_initial.full(), change_of_basis))
+        transition_intensity = np.absolute(populations[i] - populations[j]) * transition_intensity
+
+    keep = np.ones(len(transition_frequency), dtype=bool)
+    if threshold is not None and len(transition_intensity) > 0:
+        keep &= transition_intensity >= threshold * transition_intensity.max()
+    if frequency_window is not None:
+        keep &= (transition_frequency >= frequency_window[0]) & (transition_frequency <= frequency_window[1])
+    transition_frequency, transition_intensity = transition_frequency[keep], transition_intensity[keep]
+
+    if sort or merge_tolerance is not None:
+        order = np.argsort(transition_frequency, kind='stable')
+        transition_frequency, transition_intensity = transition_frequency[order], transition_intensity[order]
+    if merge_tolerance is not None and len(transition_frequency) > 0:
+        starts = np.flatnonzero(np.diff(transition_frequency, prepend=-np.inf) > merge_tolerance)
+        merged_intensity = np.add.reduceat(transition_intensity, starts)
+        weighted_frequency = np.add.reduceat(transition_frequency * transition_intensity, starts)
+        mean_frequency = np.add.reduceat(transition_frequency, starts) / np.diff(starts, append=len(transition_frequency))
+        transition_frequency = np.divide(weighted_frequency, merged_intensity, out=mean_frequency,
+                                         where=merged_intensity > 0)
+        transition_intensity = merged_intensity
     return transition_frequency, transition_intensity
 
 
+@profiled("evolve")
 def evolve(
         spin: NuclearSpin,
         h_unperturbed: list[Qobj] | list,
@@ -402,6 +461,9 @@ def evolve(
         opts=None,
         return_allstates=False,
         display_progress=True,
+        backend="auto",
+        magnus_tol=1e-8,
+        c_ops=None,
 ):
     """
     Simulates the evolution of the density matrix of a nuclear spin under the
@@ -423,7 +485,37 @@ def evolve(
              OR
              string
         Solution method to be used when calculating time evolution of
-        state. If string, must be either `mesolve` or `magnus.`
+        state. If string, must be either `mesolve`, `magnus`, `propagator`,
+        `rwa`, `adaptive_magnus` or `floquet_magnus`.
+
+        `propagator` computes the unitary propagator of the whole evolution
+        with QuTiP and stores it in an LRU cache (see
+        pulsee.propagators.default_propagator_cache), so that later calls
+        with the same h_unperturbed, mode and duration only cost a matrix
+        product. Only the final state is returned.
+
+        `rwa` moves to the frame rotating at the carrier frequency of the
+        pulse and applies the rotating-wave approximation, so that the
+        Hamiltonian is constant between switch-offs of the modes and is
+        exponentiated exactly instead of integrating the Larmor oscillations
+        (see pulsee.propagators.rwa_propagator). Requires a time-independent
+        h_unperturbed and a common frequency for all the modes. The final
+        state is returned in the LAB frame.
+
+        `adaptive_magnus` composes 4th order Magnus steps in the picture set
+        by `picture`, with lengths adjusted to keep the error below
+        magnus_tol (see pulsee.propagators.adaptive_magnus_propagator).
+        Unlike `magnus`, it needs no grid of times, so it suits long pulses.
+
+        `floquet_magnus` is meant for periodic pulses (modes with
+        commensurate frequencies): the propagator over one period is raised
+        to the number of periods in the pulse, so that the cost does not
+        grow with its duration (see
+        pulsee.propagators.floquet_magnus_propagator).
+
+        `propagator`, `rwa`, `adaptive_magnus` and `floquet_magnus` store
+        their propagators in the same LRU cache and only return the final
+        state.
 
     mode : pandas.DataFrame
         Table of the parameters of each electromagnetic mode in the pulse.
@@ -516,6 +608,30 @@ def evolve(
         True: display progress bar for the mesolve method
         None: don't display progress bar
 
+    backend : str
+        How the `magnus` solver applies exponentials of operators:
+        'dense' forms them with expm, 'krylov' applies them to the columns
+        of the operators with scipy's expm_multiply (never forming the full
+        propagator), 'auto' uses 'krylov' when the dimension of the Hilbert
+        space exceeds operators.KRYLOV_DIMENSION_THRESHOLD.
+        Default is 'auto'.
+
+    magnus_tol : float
+        Bound on the error of the elements of the propagator computed by the
+        `adaptive_magnus` and `floquet_magnus` solvers.
+        Default is 1e-8.
+
+    c_ops : List[Qobj] or dict
+        Relaxation of the system during the evolution: either a list of
+        Lindblad operators (in units of microseconds^(-1/2)) or a dictionary
+        of keyword arguments of relaxation.relaxation_operators, e.g.
+        {'T1': 100, 'T2': 50}. Supported by the `mesolve` and `propagator`
+        solvers and by custom solvers (which receive it as the keyword
+        argument c_ops). For a free evolution (no pulse) under a
+        time-independent Hamiltonian, the state is propagated with the
+        cached exponential of the Liouvillian whatever the solver.
+        Default is None (unitary evolution).
+
     Action
     ------
     If
@@ -536,7 +652,7 @@ def evolve(
 
     Magnus works best if each pulse is evaluated individually because it is dependent on the
     time array. Advised  not use evolution_time with magnus,  rather call another instance
-    of the evolve function.
+    of the evolve function, or use `adaptive_magnus`, which chooses its own steps.
 
     Returns
     -------
@@ -560,9 +676,25 @@ def evolve(
 
     pulse_time = max(np.max(mode.pulse_times), evolution_time)
    
-    if (pulse_time == 0.0) or np.allclose(dm_initial.full(), np.identity(spin.d)):
+    c_ops = collapse_operators(spin, c_ops, h_unperturbed)
+    if (pulse_time == 0.0) or (not c_ops and np.allclose(dm_initial.full(), np.identity(spin.d))):
         return dm_initial
 
+    if c_ops:
+        if (not return_allstates and np.allclose(mode.amplitudes, 0)
+                and all(isinstance(h, Qobj) for h in h_unperturbed)):
+            # Free relaxation: exponentiate the (cached) Liouvillian once.
+            with stage("solve"):
+                u = lindblad_propagator(h_unperturbed, c_ops, pulse_time)
+            with stage("post_processing"):
+                return apply_propagator(u, Qobj(dm_initial))
+        if isinstance(solver, str) and solver not in ("mesolve", "propagator"):
+            raise NotImplementedError(f"Relaxation (c_ops) is not implemented with the {solver} solver. "
+                                      "Use mesolve or propagator instead.")
+        if solver == magnus:
+            raise NotImplementedError("Relaxation (c_ops) is not implemented with Magnus. "
+                                      "Use mesolve or propagator instead.")
+
     if order is None and (solver == magnus or solver == "magnus"):
         order = 1
 
@@ -573,38 +705,81 @@ def evolve(
     if times is None:
         times = np.linspace(0, pulse_time, num=max(3, int(n_points)))
 
-    if solver == magnus or solver == "magnus":
-        if picture == "IP":
-            o_change_of_picture = Qobj(sum(h_unperturbed), dims=dims)
-        elif picture == "RRF":
-            if RRF_par is None:
-                RRF_par = {"nu_RRF": 0, "theta_RRF": 0, "phi_RRF": 0}
-            o_change_of_picture = RRF_operator(spin, RRF_par)
-        else:
-            raise ValueError("This value of argument 'picture' is not supported." "Must be either 'IF' or 'RRF'.")
-        h_total = Qobj(sum(h_unperturbed), dims=dims)
-        result = magnus(h_total, Qobj(dm_initial), times, order, spin, mode, o_change_of_picture)
+    if solver in ("magnus", "adaptive_magnus") or solver == magnus:
+        with stage("hamiltonian"):
+            if picture == "IP":
+                # The eigendecomposition of h_unperturbed, if already known, generates the picture.
+                o_change_of_picture = static_hamiltonian(h_unperturbed)
+            elif picture == "RRF":
+                if RRF_par is None:
+                    RRF_par = {"nu_RRF": 0, "theta_RRF": 0, "phi_RRF": 0}
+                o_change_of_picture = RRF_operator(spin, RRF_par)
+            else:
+                raise ValueError("This value of argument 'picture' is not supported." "Must be either 'IF' or 'RRF'.")
+            h_total = Qobj(sum(h_unperturbed), dims=dims)
+        if solver == "adaptive_magnus":
+            if return_allstates:
+                raise NotImplementedError("Return all states not implemented with the adaptive_magnus solver. "
+                                          "Use mesolve instead.")
+            with stage("solve"):
+                u = adaptive_magnus_propagator(spin, h_unperturbed, mode, pulse_time, o_change_of_picture,
+                                               tol=magnus_tol)
+            with stage("post_processing"):
+                return apply_propagator(u, Qobj(dm_initial))
+        with stage("solve"):
+            result = magnus(h_total, Qobj(dm_initial), times, order, spin, mode, o_change_of_picture, backend=backend)
         if return_allstates:
             raise NotImplementedError("Return all states not implemented with Magnus. " "Use mesolve instead.")
         else:
-            dm_evolved = changed_picture(result, o_change_of_picture, pulse_time, invert=True)
-            # TODO: Problem of the conj
-            # return dm_evolved.conj()
+            with stage("picture_change"):
+                # magnus works in the picture where the state is exp(i 2 pi A t) rho exp(-i 2 pi A t).
+                dm_evolved = changed_picture(result, o_change_of_picture, pulse_time, backend=backend)
         return dm_evolved
 
-    # Split into operator and time-dependent coefficient as per QuTiP scheme.
-    h_perturbation = h_multiple_mode_pulse(spin, mode, t=0, factor_t_dependence=True)
-
-    # Given that H = H0 + H1*f1(t) + H2*f1(t) + ...,
-    # h_unscaled is of the form [H0, [H1, f1(t)], [H2, f2(t)], ...]
-    # (refer to QuTiP's mesolve documentation for further detail)
-    h_unscaled = h_unperturbed + h_perturbation
+    if solver == "propagator":
+        if return_allstates:
+            raise NotImplementedError("Return all states not implemented with the propagator solver. "
+                                      "Use mesolve instead.")
+        with stage("solve"):
+            u = pulse_propagator(spin, h_unperturbed, mode, pulse_time, opts=opts, c_ops=c_ops)
+        with stage("post_processing"):
+            return apply_propagator(u, Qobj(dm_initial))
+
+    if solver == "rwa":
+        if return_allstates:
+            raise NotImplementedError("Return all states not implemented with the rwa solver. "
+                                      "Use mesolve instead.")
+        with stage("solve"):
+            u = rwa_propagator(spin, h_unperturbed, mode, pulse_time)
+        with stage("post_processing"):
+            return apply_propagator(u, Qobj(dm_initial))
+
+    if solver == "floquet_magnus":
+        if return_allstates:
+            raise NotImplementedError("Return all states not implemented with the floquet_magnus solver. "
+                                      "Use mesolve instead.")
+        with stage("solve"):
+            u = floquet_magnus_propagator(spin, h_unperturbed, mode, pulse_time, tol=magnus_tol)
+        with stage("post_processing"):
+            return apply_propagator(u, Qobj(dm_initial))
+
+    with stage("hamiltonian"):
+        # Split into operator and time-dependent coefficient as per QuTiP scheme.
+        h_perturbation = h_multiple_mode_pulse(spin, mode, t=0, factor_t_dependence=True)
+
+        # Given that H = H0 + H1*f1(t) + H2*f1(t) + ...,
+        # h_unscaled is of the form [H0, [H1, f1(t)], [H2, f2(t)], ...]
+        # (refer to QuTiP's mesolve documentation for further detail)
+        h_unscaled = h_unperturbed + h_perturbation
 
     if solver == mesolve or solver == "mesolve":
         # Magnus expansion solver includes 2 pi factor in exponentiations;
         # scale Hamiltonians by this factor for `mesolve` for consistency.
-        h_scaled = multiply_by_2pi(h_unscaled)
-        result = mesolve(h_scaled, Qobj(dm_initial), times, options=opts, progress_bar=display_progress)
+        with stage("hamiltonian"):
+            h_scaled = multiply_by_2pi(h_unscaled)
+        with stage("solve"):
+            result = profiled_mesolve(h_scaled, Qobj(dm_initial), times, c_ops=c_ops, options=opts,
+                                      progress_bar=display_progress)
 
         if return_allstates:
             return result.states
@@ -615,7 +790,11 @@ def evolve(
         raise ValueError(f"Invalid solver: {solver}")
 
     else:
-        result = solver(h_unscaled, Qobj(dm_initial), times, options=opts)
+        with stage("solve"):
+            if c_ops:
+                result = solver(h_unscaled, Qobj(dm_initial), times, c_ops=c_ops, options=opts)
+            else:
+                result = solver(h_unscaled, Qobj(dm_initial), times, options=opts)
         final_state = result.states[-1]
         # return last time step of density matrix evolution.
         return final_state
@@ -665,6 +844,7 @@ def RRF_operator(spin, RRF_par):
     return Qobj(RRF_o)
 
 
+@profiled("FID_signal")
 def FID_signal(
     spin,
     h_unperturbed,
@@ -678,6 +858,7 @@ def FID_signal(
     pulse_mode=None,
     opts=None,
     display_progress=None,
+    c_ops=None,
 ):
     """
     Simulates the free induction decay signal (FID) measured after the shut-off
@@ -738,6 +919,13 @@ def FID_signal(
         True will display a progress bar for the mesolve function.
         False will not display a progress bar.
 
+    c_ops : List[Qobj] or dict
+        Relaxation of the system during the acquisition, as in evolve: either
+        a list of Lindblad operators or a dictionary of keyword arguments of
+        relaxation.relaxation_operators. The envelope given by T2 is still
+        applied on top of it, pass T2=np.inf to disable it.
+        Default is None.
+
     Action
     ------
     Samples the time interval [0, acquisition_time] with n_points points per
@@ -747,6 +935,16 @@ def FID_signal(
     to the time-dependent component of the magnetization on the plane specified
     by (theta, phi) of the LAB system.
 
+    When no pulse_mode is given and h_unperturbed is time-independent, the
+    Hamiltonian is diagonalized once and the signal is computed over the whole
+    time grid from its eigenfrequencies, without any ODE integration (opts and
+    display_progress are then unused). With c_ops and no pulse_mode, the
+    state is stepped through the time grid with the exponential of the
+    Liouvillian over one time step, computed once. Otherwise the evolution is
+    carried out with QuTiP's mesolve. For very long acquisitions, see
+    stream_FID_signal and write_FID_signal, which never hold the whole
+    signal in memory.
+
     Returns
     -------
     [0] : numpy.ndarray
@@ -760,42 +958,229 @@ def FID_signal(
     """
     times = np.linspace(start=0, stop=acquisition_time, num=n_points)
 
+    with stage("post_processing"):
+        decay_functions = make_decay_functions(T2)
+        decay_array = [decay_fun(times) for decay_fun in decay_functions]
+        # decay_array is now a 2D array with shape (len(decay_functions), len(times))
+        # Now, multiply all the decay functions together to make it into 1D array with same length as times
+        decay_t = np.prod(np.array(decay_array), axis=0)
+
+    with stage("picture_change"):
+        # Define the direction of measurement
+        Ix, Iy, Iz = spin.I["x"], spin.I["y"], spin.I["z"]
+        rot_y, rot_z = (-1j * theta * Iy), (-1j * phi * Iz)
+        Ix_rotated = apply_exp_op(apply_exp_op(Ix, rot_y), rot_z)
+
+    c_ops = collapse_operators(spin, c_ops, h_unperturbed)
+    if c_ops and pulse_mode is None and all(isinstance(h, Qobj) for h in h_unperturbed):
+        # Time-independent Hamiltonian with relaxation: every step of the grid
+        # is the same superoperator, so only products are left.
+        with stage("diagonalization"):
+            dt = times[1] - times[0] if n_points > 1 else 0.
+            step = lindblad_propagator(h_unperturbed, c_ops, dt).full()
+        with stage("solve"):
+            # Tr(A rho) = vec(A^T) . vec(rho), with the column-stacking vec of QuTiP.
+            observable = Ix_rotated.full().T.flatten(order="F")
+            state = Qobj(dm).full().flatten(order="F")
+            expect_t = np.empty(n_points, dtype=complex)
+            for k in range(n_points):
+                expect_t[k] = observable @ state
+                state = step @ state
+            if Ix_rotated.isherm and Qobj(dm).isherm:
+                expect_t = expect_t.real
+    elif pulse_mode is None and all(isinstance(h, Qobj) for h in h_unperturbed):
+        # Time-independent Hamiltonian: diagonalize it once and sum the
+        # eigen-frequency phases over the whole time grid, no ODE needed.
+        with stage("diagonalization"):
+            energies, eigvects = diagonalize_hamiltonian(h_unperturbed)
+        with stage("solve"):
+            expect_t = eigenbasis_expect(energies, eigvects, dm, [Ix_rotated], times)[0]
+            if Ix_rotated.isherm and Qobj(dm).isherm:
+                expect_t = expect_t.real
+    else:
+        with stage("hamiltonian"):
+            if pulse_mode is not None:
+                # copying the method from function 'evolve()' above
+                h_perturbation = h_multiple_mode_pulse(spin, pulse_mode, t=0, factor_t_dependence=True)
+                hamiltonian = h_unperturbed + h_perturbation
+            else:
+                hamiltonian = h_unperturbed
+
+            h_scaled = multiply_by_2pi(hamiltonian)
+
+        # Measuring the expectation value of Ix rotated:
+        if opts is None:
+            opts = Options(atol=1e-14, rtol=1e-14, nsteps=20000)
+        if not display_progress:
+            display_progress = None  # qutip takes in a None instead of False for some reason (bad type check)
+
+        with stage("solve"):
+            result = profiled_mesolve(h_scaled, dm, times, c_ops=c_ops, e_ops=[Ix_rotated],
+                                      progress_bar=display_progress, options=opts)
+            expect_t = np.array(result.expect)[0]
+
+    with stage("post_processing"):
+        measurement_direction = np.exp(-1j * 2 * np.pi * ref_freq)
+        fid = expect_t * decay_t * measurement_direction
+    if np.max(fid) < 0.09:
+        import warnings
+
+        warnings.warn("Unreliable FID: Weak signal, check simulation!", stacklevel=0)
+
+    return times, fid
+
+
+def stream_FID_signal(
+    spin,
+    h_unperturbed,
+    dm,
+    acquisition_time,
+    T2: float | list[float] | Callable[[float], float] | list[Callable[[float], float]] = 100,
+    theta=0,
+    phi=0,
+    ref_freq=0,
+    n_points=1000,
+    pulse_mode=None,
+    opts=None,
+    c_ops=None,
+    chunk_size=2**16,
+):
+    """
+    Simulates the same free induction decay signal as FID_signal, but yields
+    it in consecutive blocks of at most chunk_size samples, so that the
+    memory taken by very long acquisitions is bounded by the size of a block.
+
+    The parameters have the same meaning as in FID_signal. For each block,
+    - without pulse_mode and c_ops (time-independent Hamiltonian), the
+      signal is evaluated from the eigenfrequencies of the Hamiltonian,
+      diagonalized once;
+    - with c_ops and without pulse_mode, the state is stepped with the
+      exponential of the Liouvillian over one time step, computed once;
+    - otherwise QuTiP's mesolve integrates the block, starting from the
+      final state of the previous one.
+
+    Parameters
+    ----------
+    chunk_size : int
+        Maximum number of samples per block.
+        Default is 2**16.
+
+    Yields
+    ------
+    Tuples (times, fid) of numpy.ndarray, the consecutive blocks of the
+    outputs of FID_signal (in microseconds and arbitrary units).
+    """
+    if chunk_size < 1:
+        raise ValueError(f"The size of the blocks must be positive. Given: {chunk_size}")
+    dt = acquisition_time / (n_points - 1) if n_points > 1 else 0.
     decay_functions = make_decay_functions(T2)
-    decay_array = [decay_fun(times) for decay_fun in decay_functions]
-    # decay_array is now a 2D array with shape (len(decay_functions), len(times))
-    # Now, multiply all the decay functions together to make it into 1D array with same length as times
-    decay_t = np.prod(np.array(decay_array), axis=0)
+    measurement_direction = np.exp(-1j * 2 * np.pi * ref_freq)
 
-    # Define the direction of measurement
     Ix, Iy, Iz = spin.I["x"], spin.I["y"], spin.I["z"]
-    rot_y, rot_z = (-1j * theta * Iy), (-1j * phi * Iz)
-    Ix_rotated = apply_exp_op(apply_exp_op(Ix, rot_y), rot_z)
-
-    if pulse_mode is not None:
-        # copying the method from function 'evolve()' above
-        h_perturbation = h_multiple_mode_pulse(spin, pulse_mode, t=0, factor_t_dependence=True)
-        hamiltonian = h_unperturbed + h_perturbation
+    Ix_rotated = apply_exp_op(apply_exp_op(Ix, (-1j * theta * Iy)), (-1j * phi * Iz))
+    real_signal = Ix_rotated.isherm and Qobj(dm).isherm
+
+    c_ops = collapse_operators(spin, c_ops, h_unperturbed)
+    static = pulse_mode is None and all(isinstance(h, Qobj) for h in h_unperturbed)
+    if static and not c_ops:
+        energies, eigvects = diagonalize_hamiltonian(h_unperturbed)
+    elif static:
+        step = lindblad_propagator(h_unperturbed, c_ops, dt).full()
+        observable = Ix_rotated.full().T.flatten(order="F")
+        state = Qobj(dm).full().flatten(order="F")
     else:
         hamiltonian = h_unperturbed
+        if pulse_mode is not None:
+            hamiltonian = h_unperturbed + h_multiple_mode_pulse(spin, pulse_mode, t=0, factor_t_dependence=True)
+        h_scaled = multiply_by_2pi(hamiltonian)
+        opts = dict(opts or Options(atol=1e-14, rtol=1e-14, nsteps=20000))
+        opts["store_final_state"] = True
+        state, previous_time = Qobj(dm), None
+
+    for start in range(0, n_points, chunk_size):
+        stop = min(start + chunk_size, n_points)
+        times = np.arange(start, stop) * dt
+        if stop == n_points and n_points > 1:
+            times[-1] = acquisition_time
+
+        if static and not c_ops:
+            expect_t = eigenbasis_expect(energies, eigvects, dm, [Ix_rotated], times)[0]
+        elif static:
+            expect_t = np.empty(len(times), dtype=complex)
+            for k in range(len(times)):
+                expect_t[k] = observable @ state
+                state = step @ state
+        else:
+            # Each block starts from the last instant of the previous one.
+            tlist = times if previous_time is None else np.concatenate([[previous_time], times])
+            result = profiled_mesolve(h_scaled, state, tlist, c_ops=c_ops, e_ops=[Ix_rotated], options=opts)
+            expect_t = np.array(result.expect[0])[len(tlist) - len(times):]
+            state, previous_time = result.final_state, times[-1]
+        if real_signal:
+            expect_t = expect_t.real
 
-    h_scaled = multiply_by_2pi(hamiltonian)
+        decay_t = np.ones(len(times))
+        for decay_fun in decay_functions:
+            decay_t = decay_t * decay_fun(times)
+        yield times, expect_t * decay_t * measurement_direction
 
-    # Measuring the expectation value of Ix rotated:
-    if opts is None:
-        opts = Options(atol=1e-14, rtol=1e-14, nsteps=20000)
-    if not display_progress:
-        display_progress = None  # qutip takes in a None instead of False for some reason (bad type check)
 
-    result = mesolve(h_scaled, dm, times, e_ops=[Ix_rotated], progress_bar=display_progress, options=opts)
+def write_FID_signal(path: str, spin, h_unperturbed, dm, acquisition_time, n_points=1000, **kwargs) -> str:
+    """
+    Simulates the FID signal block by block with stream_FID_signal and writes
+    each block straight to a file, so that the whole signal is never held in
+    memory.
 
-    measurement_direction = np.exp(-1j * 2 * np.pi * ref_freq)
-    fid = np.array(result.expect)[0] * decay_t * measurement_direction
-    if np.max(fid) < 0.09:
-        import warnings
+    Parameters
+    ----------
+    path : str
+        Path of the output file. With the extension '.npy', the file is a
+        memory-mapped NumPy array of n_points records with the fields 'time'
+        and 'fid' (read it back with np.load(path, mmap_mode='r')). With the
+        extension '.h5' or '.hdf5', the file is an HDF5 file with the datasets
+        'times' and 'fid' (this requires the h5py package).
+    spin, h_unperturbed, dm, acquisition_time, n_points :
+        Same meaning as in FID_signal.
+    **kwargs :
+        Further keyword arguments of stream_FID_signal (e.g. T2, chunk_size).
 
-        warnings.warn("Unreliable FID: Weak signal, check simulation!", stacklevel=0)
+    Returns
+    -------
+    The path of the file.
 
-    return result.times, fid
+    Raises
+    ------
+    ValueError, when the extension is not supported.
+    ImportError, when an HDF5 file is requested and h5py is not installed.
+    """
+    blocks = stream_FID_signal(spin, h_unperturbed, dm, acquisition_time, n_points=n_points, **kwargs)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        output = np.lib.format.open_memmap(path, mode="w+", dtype=[("time", float), ("fid", complex)],
+                                           shape=(n_points,))
+        start = 0
+        for times, fid in blocks:
+            output["time"][start:start + len(times)] = times
+            output["fid"][start:start + len(times)] = fid
+            start += len(times)
+        output.flush()
+        del output
+    elif extension in (".h5", ".hdf5"):
+        try:
+            import h5py
+        except ImportError as error:
+            raise ImportError("Writing the FID signal to an HDF5 file requires the h5py package.") from error
+        with h5py.File(path, "w") as output:
+            times_set = output.create_dataset("times", shape=(n_points,), dtype=float)
+            fid_set = output.create_dataset("fid", shape=(n_points,), dtype=complex)
+            start = 0
+            for times, fid in blocks:
+                times_set[start:start + len(times)] = times
+                fid_set[start:start + len(times)] = fid
+                start += len(times)
+    else:
+        raise ValueError(f"The FID signal can be written to '.npy', '.h5' or '.hdf5' files. Given: {path}")
+    return path
 
 
 def make_decay_functions(t2: float | Callable | list[float] | list[Callable]) -> list[Callable]:
@@ -954,6 +1339,94 @@ def fourier_phase_shift(frequencies, fourier, fourier_neg=None, peak_frequency=0
     return phase
 
 
+LINESHAPES = ("lorentzian", "gaussian", "voigt")
+
+
+def broadened_spectrum(frequencies: NDArray, intensities: NDArray, width: float | tuple[float, float],
+                       lineshape: str = "lorentzian", frequency_range: tuple[float, float] | None = None,
+                       n_points: int = 4096) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Synthesizes a continuous spectrum from a list of lines (e.g. the output
+    of power_absorption_spectrum) by broadening each of them with the given
+    lineshape, without any evolution in the time domain.
+
+    Parameters
+    ----------
+    frequencies : array-like
+        Frequencies of the lines (in MHz).
+
+    intensities : array-like
+        Intensities of the lines (in a.u.), i.e. the areas under the
+        broadened lines.
+
+    width : float or tuple of two floats
+        Full width at half maximum of the lines (in MHz). For the Voigt
+        lineshape, the pair (FWHM of the Gaussian, FWHM of the Lorentzian).
+        A Lorentzian of FWHM 1 / (pi T2) is the lineshape of the Fourier
+        transform of an FID decaying as exp(-t / T2).
+
+    lineshape : string
+        One of 'lorentzian', 'gaussian' and 'voigt'.
+        Default value is 'lorentzian'.
+
+    frequency_range : tuple of two floats or None
+        Lower and upper limits of the grid of frequencies (in MHz).
+        Default value is None, in which case the grid extends five
+        (Gaussian/Voigt) or fifty (Lorentzian) widths beyond the outermost
+        lines.
+
+    n_points : int
+        Number of points of the uniform grid of frequencies.
+        Default value is 4096.
+
+    Action
+    ------
+    The lines are binned on the grid by linear interpolation between the two
+    nearest points, which preserves both their intensity and their
+    position, and the resulting histogram is convolved through FFT with the
+    lineshape sampled on the grid spacing. The cost is
+    O(N_lines + n_points log n_points) regardless of the number of lines.
+    Lines falling outside the grid are discarded.
+
+    Returns
+    -------
+    [0]: The grid of frequencies (in MHz);
+
+    [1]: The spectrum sampled on the grid (in a.u. / MHz).
+    """
+    if lineshape not in LINESHAPES:
+        raise ValueError(f"lineshape must be one of {LINESHAPES}, not {lineshape!r}")
+    if lineshape == "voigt":
+        gaussian_width, lorentzian_width = width
+    elif lineshape == "gaussian":
+        gaussian_width, lorentzian_width = width, 0.
+    else:
+        gaussian_width, lorentzian_width = 0., width
+    frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float))
+    intensities = np.atleast_1d(np.asarray(intensities, dtype=float))
+
+    if frequency_range is None:
+        margin = 5 * gaussian_width + 50 * lorentzian_width
+        frequency_range = (frequencies.min() - margin, frequencies.max() + margin)
+    grid = np.linspace(frequency_range[0], frequency_range[1], n_points)
+    step = grid[1] - grid[0]
+
+    # Linear binning: each line is split between the two grid points around it.
+    position = (frequencies - grid[0]) / step
+    inside = (position >= 0) & (position <= n_points - 1)
+    position, intensities = position[inside], intensities[inside]
+    lower = np.minimum(np.floor(position).astype(int), n_points - 2)
+    fraction = position - lower
+    histogram = np.bincount(lower, intensities * (1 - fraction), minlength=n_points) \
+        + np.bincount(lower + 1, intensities * fraction, minlength=n_points)
+
+    offsets = step * np.arange(-(n_points - 1), n_points)
+    sigma = gaussian_width / (2 * np.sqrt(2 * np.log(2)))
+    gamma = lorentzian_width / 2
+    kernel = voigt_profile(offsets, sigma, gamma)
+    return grid, fftconvolve(histogram, kernel, mode="valid")
+
+
 def _ed_evolve_solve_t(t, h, rho0, e_ops):
     """
     Helper function for `ed_evolve`; uses exact diagonalization to evolve
@@ -989,6 +1462,7 @@ def _ed_evolve_solve_t(t, h, rho0, e_ops):
     return rho_t, exp
 
 
+@profiled("ed_evolve")
 def ed_evolve(
     h,
     rho0,
@@ -1000,11 +1474,19 @@ def ed_evolve(
     parallel=False,
     all_t=False,
     T2: float | list[float] | Callable[[float], float] | list[Callable[[float], float]] = 100,
+    backend="auto",
 ):
     """
     Evolve the given density matrix with the interactions given by the provided
     Hamiltonian using exact diagonalization.
 
+    The Hamiltonian is diagonalized once; the states and the expectation values
+    at all the times in `tlist` are then obtained as broadcasted phase
+    multiplications in its eigenbasis. With the Krylov backend the state is
+    instead stepped from each time to the next with scipy's expm_multiply,
+    which only needs products of the (sparse) Hamiltonian with vectors and
+    never forms the eigenvectors or the propagator. With `parallel=True` each time is
+    instead solved independently through QuTiP's `parallel_map`, and
     ipyparallel must be present for Jupyter notebooks.
 
     Params
@@ -1025,7 +1507,7 @@ def ed_evolve(
         Whether to return the free induction decay (FID) signal as
         an expectation value. If True, appends FID signal to the end of
         the `e_ops` expectation value list.
-    par : Bool
+    parallel : Bool
         Whether to use QuTiP's parallel computing implementation `parallel_map`
         to evolve the system.
     all_t : Bool
@@ -1046,6 +1528,12 @@ def ed_evolve(
         If iterable, total decay envelope will be product of decays in list.
 
         Default value is 100 (microseconds).
+    backend : str
+        Either 'dense' (exact diagonalization), 'krylov' (expm_multiply) or
+        'auto', which selects 'krylov' when the dimension of the Hilbert
+        space exceeds operators.KRYLOV_DIMENSION_THRESHOLD. Ignored when
+        `parallel` is True.
+        Default is 'auto'.
 
     Returns
     ------
@@ -1072,7 +1560,41 @@ def ed_evolve(
     rho_t = []
     e_ops_t = []
 
-    if parallel:
+    if not parallel and use_krylov(backend, h.shape[0]):
+        tlist = np.asarray(tlist, dtype=float)
+        rho0 = Qobj(rho0)
+        e_ops_sparse = [Qobj(op).to("csr").data_as("csr_matrix") for op in e_ops]
+        e_ops_t = np.empty((len(e_ops), len(tlist)), dtype=complex)
+        with stage("solve"):
+            for k, rho in enumerate(krylov_propagate(rho0, h, -tlist)):
+                for i, op in enumerate(e_ops_sparse):
+                    if rho0.isket:
+                        e_ops_t[i, k] = np.vdot(rho, op @ rho)
+                    else:
+                        # Tr(O rho) without forming the product
+                        e_ops_t[i, k] = op.multiply(rho.T).sum()
+                if state and (all_t or k == len(tlist) - 1):
+                    rho_t.append(Qobj(rho, dims=rho0.dims))
+        add_solver_steps(len(tlist))
+        if (rho0.isket or rho0.isherm) and all(op.isherm for op in e_ops):
+            e_ops_t = e_ops_t.real
+
+    elif not parallel:
+        # Diagonalize once; rho(t) = exp(i 2 pi H t) rho0 exp(-i 2 pi H t) for
+        # every t is then a phase multiplication in the eigenbasis.
+        tlist = np.asarray(tlist, dtype=float)
+        with stage("diagonalization"):
+            energies, eigvects = diagonalize_hamiltonian(h)
+        with stage("solve"):
+            if e_ops:
+                e_ops_t = eigenbasis_expect(energies, eigvects, rho0, e_ops, -tlist)
+                if Qobj(rho0).isherm and all(op.isherm for op in e_ops):
+                    e_ops_t = e_ops_t.real
+            if state:
+                times = -tlist if all_t else -tlist[-1:]
+                rho_t = [Qobj(rho, dims=h.dims) for rho in eigenbasis_evolve(energies, eigvects, rho0, times)]
+
+    else:
         # Check if Jupyter notebook to use QuTiP's Jupyter-optimized parallelization
         # Better method than calling 'get_ipython()' since this requires calling un un-imported function
         if "ipykernel" in sys.modules:
@@ -1093,31 +1615,11 @@ def ed_evolve(
 
         e_ops_t = np.concatenate(e_ops_t, axis=1)
 
-    elif not e_ops:
-        for t in tlist:
-            rho_t.append(_ed_evolve_solve_t(t, h, rho0, None))
-        e_ops_t = []
-
-    else:
-        e_ops_t = [[] for _ in range(len(e_ops))]
-        for t in tqdm(tlist):
-            rho, exp = _ed_evolve_solve_t(t, h, rho0, e_ops)
-            e_ops_t = np.concatenate([e_ops_t, exp], axis=1)
-            rho_t.append(rho)
-
     if fid:
-        fid_exp = []
-        fids = e_ops_t[-1]
-        for i in trange(len(fids)):
-            # Obtain total decay envelope at that time.
-            envelope = 1
-            for decay in decay_functions:
-                # Different name to avoid bizarre variable scope bug
-                envelope *= decay(tlist[i])
-                # (can't have same name as iteration var in line 1117.)
-            fid_exp.append(fids[i] * envelope)
-
-        e_ops_t[-1] = fid_exp
+        with stage("post_processing"):
+            # Total decay envelope: product of all the decay functions over tlist.
+            envelope = np.prod([decay(np.asarray(tlist, dtype=float)) for decay in decay_functions], axis=0)
+            e_ops_t[-1] = e_ops_t[-1] * envelope
 
     if not state:
         return e_ops_t
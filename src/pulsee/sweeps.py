@@ -0,0 +1,264 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from qutip import Qobj
+
+from .nuclear_spin import ManySpins, NuclearSpin
+from .propagators import rwa_propagators
+from .pulses import Pulses
+from .simulation import evolve
+
+# Names of the axes of a sweep and the fields of Pulses they set.
+SWEEP_FIELDS = {
+    "amplitude": "amplitudes",
+    "pulse_time": "pulse_times",
+    "phase": "phases",
+    "frequency": "frequencies",
+}
+
+
+@dataclass
+class SweepResult:
+    """
+    Final states and expectation values of a sweep of evolve over the
+    parameters of a pulse (see sweep_evolve), stored as arrays whose leading
+    axes run over the swept values.
+
+    Attributes
+    ----------
+    axes : dict
+        Maps the name of each swept parameter ('amplitude', 'pulse_time',
+        'phase' or 'frequency') to the array of its values, in the order of
+        the leading axes of the arrays below.
+    states : numpy.ndarray or None
+        Array of shape (*shape, d, d) of the final density matrices, or None
+        when they were not stored.
+    expectations : numpy.ndarray or None
+        Array of shape (*shape, len(e_ops)) of the expectation values of the
+        observables on the final states, or None when no e_ops were given.
+    dims : list
+        Dimensions of the density matrices (as in Qobj.dims).
+    """
+    axes: dict
+    states: np.ndarray | None
+    expectations: np.ndarray | None
+    dims: list
+
+    @property
+    def shape(self) -> tuple:
+        return tuple(len(values) for values in self.axes.values())
+
+    def state(self, *index) -> Qobj:
+        """
+        Returns the final density matrix of the variant at the given index
+        (one integer per axis) as a Qobj.
+        """
+        if self.states is None:
+            raise ValueError("The states were not stored: call sweep_evolve with store_states=True.")
+        return Qobj(self.states[tuple(index)], dims=self.dims)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Returns the expectation values as a pandas.DataFrame with one row per
+        variant, indexed by the swept values, and one column per observable.
+        """
+        if self.expectations is None:
+            raise ValueError("No expectation values were computed: call sweep_evolve with e_ops.")
+        index = pd.MultiIndex.from_product(list(self.axes.values()), names=list(self.axes))
+        return pd.DataFrame(self.expectations.reshape(-1, self.expectations.shape[-1]), index=index)
+
+
+def sweep_pulses(mode: Pulses, **values) -> tuple[dict, list[Pulses]]:
+    """
+    Returns the variants of a pulse obtained by setting some of its parameters
+    to every combination of the given values.
+
+    Parameters
+    ----------
+    mode : Pulses
+        Template of the pulse.
+    **values : array_like
+        Values of the parameters to be swept, with the names of SWEEP_FIELDS
+        as keywords ('amplitude', 'pulse_time', 'phase', 'frequency'). Each
+        value is set on all the modes of the template.
+
+    Returns
+    -------
+    [0] : dict
+        The swept values as arrays, by name, in the order of the arguments.
+    [1] : list of Pulses
+        The variants, in C order over the axes (the last one varies fastest).
+    """
+    axes = {}
+    for name, vals in values.items():
+        if name not in SWEEP_FIELDS:
+            raise ValueError(f"Unknown sweep parameter '{name}'. Must be one of {list(SWEEP_FIELDS)}.")
+        if vals is not None:
+            axes[name] = np.atleast_1d(np.asarray(vals, dtype=float))
+    variants = []
+    for combination in itertools.product(*axes.values()):
+        variant = mode.copy()
+        for name, value in zip(axes, combination):
+            setattr(variant, SWEEP_FIELDS[name], [value] * mode.size)
+        variant.numpify()
+        variants.append(variant)
+    return axes, variants
+
+
+def _rwa_sweep_propagators(
+    spin: NuclearSpin | ManySpins, h_unperturbed: list[Qobj], variants: list[Pulses], evolution_time: float
+) -> np.ndarray:
+    """
+    Returns the (len(variants), d, d) array of the LAB frame propagators of
+    the variants within the rotating-wave approximation, as computed by
+    evolve(solver='rwa'), evaluating all the variants at once with
+    propagators.rwa_propagators.
+    """
+    lab_variants = []
+    for variant in variants:
+        # Same convention as evolve: flip the pulse for positive gamma.
+        if spin.gyro_ratio_over_2pi > 0:
+            variant = variant.copy()
+            variant.phase_add_pi()
+        lab_variants.append(variant)
+    durations = [max(np.max(variant.pulse_times), evolution_time) for variant in variants]
+    return rwa_propagators(spin, h_unperturbed, lab_variants, durations)
+
+
+def _evolve_variants(task):
+    """
+    Evolves dm_initial under each of a chunk of variants and returns the final
+    states and expectation values as arrays. Defined at module level so that
+    it can be sent to the worker processes.
+    """
+    spin, h_unperturbed, dm_initial, solver, variants, e_ops, store_states, evolve_kwargs = task
+    states, expectations = [], []
+    for variant in variants:
+        dm = evolve(spin, h_unperturbed, dm_initial, solver, mode=variant, **evolve_kwargs)
+        if store_states:
+            states.append(dm.full())
+        expectations.append([(dm * op).tr() for op in e_ops])
+    return states, expectations
+
+
+def sweep_evolve(
+    spin: NuclearSpin | ManySpins,
+    h_unperturbed: list[Qobj],
+    dm_initial: Qobj,
+    mode: Pulses,
+    amplitudes=None,
+    pulse_times=None,
+    phases=None,
+    frequencies=None,
+    solver="rwa",
+    e_ops: list[Qobj] | None = None,
+    store_states: bool = True,
+    evolution_time: float = 0.0,
+    n_workers: int | None = 1,
+    chunksize: int = 16,
+    **evolve_kwargs,
+) -> SweepResult:
+    """
+    Evolves dm_initial under all the variants of a pulse obtained by sweeping
+    some of its parameters (e.g. the amplitude or the duration for a
+    nutation curve), over the grid of all the combinations of the given
+    values.
+
+    With solver='rwa' (the default), all the variants are evaluated at once
+    by propagators.rwa_propagators: the operators shared by the variants are
+    built once, and the rotating-frame Hamiltonians of all the variants are
+    exponentiated as stacks of NumPy arrays, with the same results as
+    evolve(solver='rwa'). The batched path takes no further arguments of
+    evolve: with any of them (e.g. c_ops), or with any other solver, each
+    variant is evolved by evolve, optionally in a pool of processes, so
+    that evolve honours or rejects them exactly as it does on its own.
+
+    Parameters
+    ----------
+    spin : NuclearSpin or ManySpins
+        Spin or spin system under study.
+    h_unperturbed : List[Qobj]
+        Unperturbed Hamiltonian of the system (in MHz).
+    dm_initial : Qobj
+        Density matrix of the system at time t=0.
+    mode : Pulses
+        Template of the pulse, as in evolve.
+    amplitudes, pulse_times, phases, frequencies : array_like
+        Values of the corresponding parameter to be swept, set on all the
+        modes of the template. Parameters left to None keep the values of
+        the template.
+        Default is None.
+    solver : str or function
+        Solver of evolve.
+        Default is 'rwa'.
+    e_ops : List[Qobj]
+        Observables whose expectation values on the final states are computed.
+        Default is None.
+    store_states : bool
+        Whether to store the final density matrices.
+        Default is True.
+    evolution_time : float
+        Minimum duration of the evolution, as in evolve.
+        Default is 0.
+    n_workers : int
+        Number of worker processes for the solvers other than 'rwa'. When 1,
+        the variants are evolved in the current process; when None, as many
+        processes as the CPUs are used.
+        Default is 1.
+    chunksize : int
+        Number of variants evolved by each task sent to the pool.
+        Default is 16.
+    **evolve_kwargs :
+        Further keyword arguments passed to evolve, except return_allstates.
+
+    Returns
+    -------
+    A SweepResult, whose arrays have one leading axis per swept parameter,
+    in the order of the arguments above.
+    """
+    axes, variants = sweep_pulses(mode, amplitude=amplitudes, pulse_time=pulse_times, phase=phases,
+                                  frequency=frequencies)
+    shape = tuple(len(values) for values in axes.values())
+    e_ops = list(e_ops) if e_ops is not None else []
+    d = spin.d
+    if evolve_kwargs.get("return_allstates"):
+        raise NotImplementedError("Return all states not implemented with sweep_evolve. "
+                                  "Use evolve on each variant instead.")
+
+    if solver == "rwa" and not evolve_kwargs:
+        u = _rwa_sweep_propagators(spin, h_unperturbed, variants, evolution_time)
+        ops = np.array([op.full() for op in e_ops]).reshape(-1, d, d)
+        if store_states:
+            states = u @ dm_initial.full() @ u.conj().swapaxes(-1, -2)
+            expectations = np.einsum("vij,kji->vk", states, ops)
+        else:
+            # Tr(u rho u^dagger O) without forming the final states.
+            states = None
+            expectations = np.einsum("vij,jk,vlk,mli->vm", u, dm_initial.full(), u.conj(), ops, optimize=True)
+    else:
+        evolve_kwargs.setdefault("display_progress", None)
+        evolve_kwargs["evolution_time"] = evolution_time
+        tasks = [(spin, h_unperturbed, dm_initial, solver, variants[i:i + chunksize], e_ops, store_states,
+                  evolve_kwargs) for i in range(0, len(variants), chunksize)]
+        if n_workers == 1:
+            results = [_evolve_variants(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers or os.cpu_count() or 1) as executor:
+                results = list(executor.map(_evolve_variants, tasks))
+        states = np.array([s for chunk_states, _ in results for s in chunk_states]).reshape(-1, d, d) \
+            if store_states else None
+        expectations = np.array([e for _, chunk_exp in results for e in chunk_exp])
+        expectations = expectations.reshape(len(variants), len(e_ops))
+
+    if all(op.isherm for op in e_ops):
+        expectations = np.real(expectations)
+    return SweepResult(
+        axes=axes,
+        states=states.reshape(shape + (d, d)) if states is not None else None,
+        expectations=expectations.reshape(shape + (len(e_ops),)) if e_ops else None,
+        dims=dm_initial.dims,
+    )
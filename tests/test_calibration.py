@@ -0,0 +1,84 @@
+import numpy as np
+
+from qutip import Qobj
+
+from pulsee.calibration import NutationModel, calibrate_pulse
+
+from pulsee.nuclear_spin import ManySpins, NuclearSpin
+
+from pulsee.operators import diagonalize_hamiltonian
+
+from pulsee.pulses import Pulses
+
+from pulsee.simulation import nuclear_system_setup, evolve
+
+
+def _quadrupolar_setup():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 5.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    quad_par = {'coupling constant' : 0.6,
+                'asymmetry parameter' : 0.,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+
+    return nuclear_system_setup(spin_par, quad_par, zeem_par, initial_state=np.diag([0.4, 0.3, 0.2, 0.1]))
+
+
+def test_nutation_model_derivatives_match_finite_differences():
+    spin, h_unperturbed, dm_0 = _quadrupolar_setup()
+    mode = Pulses(frequencies=[2 * np.pi * 5], amplitudes=[0.01], phases=[0.3],
+                  theta_p=[np.pi/2], phi_p=[0.], pulse_times=[1.])
+
+    for parameter, x in (('pulse_time', 0.7), ('amplitude', 0.013)):
+        model = NutationModel(spin, h_unperturbed, dm_0, mode, parameter)
+        u, du = model.propagator(x)
+        u_plus, _ = model.propagator(x * (1 + 1e-6))
+        u_minus, _ = model.propagator(x * (1 - 1e-6))
+        assert np.all(np.isclose(du, (u_plus - u_minus) / (2e-6 * x), atol=1e-5 * np.max(np.abs(du))))
+
+        variant = mode.copy()
+        setattr(variant, 'pulse_times' if parameter == 'pulse_time' else 'amplitudes', [x])
+        dm = evolve(spin, h_unperturbed, dm_0, 'rwa', mode=variant)
+        assert np.all(np.isclose(u @ dm_0.full() @ u.conj().T, dm.full(), atol=1e-12))
+
+
+def test_pi_and_pi_half_pulses_of_the_central_transition():
+    spin, h_unperturbed, dm_0 = _quadrupolar_setup()
+    energies, eigvects = diagonalize_hamiltonian(h_unperturbed)
+    mode = Pulses(frequencies=[2 * np.pi * (energies[2] - energies[1])], amplitudes=[0.01], phases=[0.],
+                  theta_p=[np.pi/2], phi_p=[0.], pulse_times=[1.])
+
+    def population_difference(dm):
+        return np.real(eigvects[:, 1].conj() @ dm.full() @ eigvects[:, 1]
+                       - eigvects[:, 2].conj() @ dm.full() @ eigvects[:, 2])
+
+    # The central transition of a spin 3/2 nutates twice as fast as a spin 1/2.
+    pi_pulse = calibrate_pulse(spin, h_unperturbed, dm_0, mode, (1, 2))
+    assert np.isclose(pi_pulse.value, 1 / (4 * 0.01), rtol=1e-2)
+    assert pi_pulse.evaluations < 30
+    dm = evolve(spin, h_unperturbed, dm_0, 'rwa', mode=pi_pulse.mode)
+    assert np.isclose(population_difference(dm), -population_difference(dm_0), rtol=1e-2)
+
+    half_pulse = calibrate_pulse(spin, h_unperturbed, dm_0, mode, (1, 2), flip_angle=np.pi/2)
+    dm = evolve(spin, h_unperturbed, dm_0, 'rwa', mode=half_pulse.mode)
+    assert np.isclose(population_difference(dm), 0, atol=1e-10)
+
+
+def test_calibration_of_a_transition_of_many_spins():
+    spins = ManySpins([NuclearSpin(1/2, 1.), NuclearSpin(1/2, 3.)])
+    h_unperturbed = [Qobj(-5 * (spins.embed(spins.spins[0].I['z'], 0).full()
+                                + 3 * spins.embed(spins.spins[1].I['z'], 1).full()), dims=spins.dims)]
+    dm_0 = Qobj(np.diag([1., 0., 0., 0.]), dims=spins.dims)
+    mode = Pulses(frequencies=[2 * np.pi * 5], amplitudes=[0.02], phases=[0.],
+                  theta_p=[np.pi/2], phi_p=[0.], pulse_times=[1.])
+
+    # The pulse is resonant with the first spin only.
+    calibration = calibrate_pulse(spins, h_unperturbed, dm_0, mode, (0, 1))
+    assert np.isclose(calibration.value, 1 / (2 * 0.02), rtol=1e-3)
@@ -6,13 +6,14 @@ from hypothesis import given, note
 
 from qutip import Qobj
 
-from pulsee import ptrace_subspace
+from pulsee.many_body import ptrace_subspace
 
 from pulsee.nuclear_spin import NuclearSpin, ManySpins
 
 from pulsee.hamiltonians import h_zeeman, h_quadrupole, \
                          v0_EFG, v1_EFG, v2_EFG, \
                          h_single_mode_pulse, \
+                         cosine_wrapper, pulse_coefficient, \
                          h_multiple_mode_pulse, \
                          h_changed_picture, \
                          h_j_coupling, h_tensor_coupling
@@ -64,6 +65,14 @@ def test_periodicity_pulse_hamiltonian(n):
     note("h_single_mode_pulse(t2) = %r" % (h_p2))
     assert np.all(np.isclose(h_p1.full(), h_p2.full(), rtol=1e-10))
 
+# Checks that the compiled coefficient of a pulse reproduces the Python closure, including the
+# switch-off at the end of the pulse
+@given(t = st.floats(min_value=0, max_value=20))
+def test_pulse_coefficient_matches_cosine_wrapper(t):
+    wrapper = cosine_wrapper(5., 0.3, 10.)
+    compiled = pulse_coefficient(5., 0.3, 10.)
+    assert np.isclose(compiled(t), wrapper(t, []), atol=1e-12)
+
 # Checks that the superposition of two orthogonal pulses with the same frequency and a phase difference
 # of pi/2 is equivalent to the time-reversed superposition of the two same pulses with one of them
 # changed by sign
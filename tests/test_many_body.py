@@ -3,11 +3,11 @@ import numpy as np
 import hypothesis.strategies as st
 from hypothesis import given, settings, note
 
-from qutip import tensor, rand_dm
+from qutip import Qobj, tensor, rand_dm
 
-from pulsee import random_operator, random_observable
+from pulsee.operators import random_operator
 
-from pulsee import ptrace_subspace
+from pulsee.many_body import ptrace_subspace
 
 @given(d = st.integers(min_value=2, max_value=8))
 @settings(deadline = None)
@@ -44,3 +44,17 @@ def test_ptrace_subspace_is_inverse_tensor_product(d):
     
     assert np.all(np.isclose(p_t.full(), BC.full(), rtol=1e-10))
 
+
+
+def test_ptrace_subspace_over_several_subspaces_and_batched_states():
+    A, B, C = rand_dm(2), rand_dm(3), rand_dm(4)
+    ABC = tensor(A, B, C)
+
+    assert np.allclose(ptrace_subspace(ABC, [2, 3, 4], [0, 2]).full(), B.full())
+    assert np.allclose(ptrace_subspace(ABC, [2, 3, 4], [1]).full(), tensor(A, C).full())
+
+    states = np.array([tensor(rand_dm(2), rand_dm(3), rand_dm(4)).full() for _ in range(5)])
+    traced = ptrace_subspace(states, [2, 3, 4], 1)
+    assert traced.shape == (5, 8, 8)
+    for state, state_traced in zip(states, traced):
+        assert np.allclose(state_traced, ptrace_subspace(Qobj(state), [2, 3, 4], 1).full())
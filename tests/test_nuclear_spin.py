@@ -77,3 +77,15 @@ def test_angular_momentum_sum_rules():
     
     assert np.all(np.isclose(eig, expected_eig, rtol=1e-10))
     
+
+
+def test_sparse_many_spins_operators_match_dense_ones():
+    spins = [NuclearSpin(1/2), NuclearSpin(1), NuclearSpin(3/2)]
+
+    dense_system = ManySpins(spins)
+    sparse_system = ManySpins(spins, sparse=True)
+
+    for key in ['-', '+', 'x', 'y', 'z']:
+        assert sparse_system.I[key].dtype.__name__ == 'CSR'
+        assert sparse_system.I[key].dims == dense_system.I[key].dims
+        assert np.all(np.isclose(sparse_system.I[key].full(), dense_system.I[key].full(), rtol=1e-10))
@@ -10,10 +10,16 @@ from qutip import Qobj, expect, rand_dm
 import hypothesis.strategies as st
 from hypothesis import given, settings, note, assume
 
-from pulsee import random_operator, random_observable, \
-    magnus_expansion_1st_term, magnus_expansion_2nd_term, \
-    magnus_expansion_3rd_term, canonical_density_matrix, changed_picture, \
-    evolve_by_hamiltonian, positivity, unit_trace
+from pulsee.operators import random_operator, canonical_density_matrix, changed_picture, \
+    evolve_by_hamiltonian, krylov_propagate, positivity, unit_trace
+
+
+# pulsee.operators only provides random_operator: the random observables of the
+# tests below are the Hermitian part of a random operator
+def random_observable(d):
+    o = random_operator(d)
+    return (o + o.dag()) / 2
+
 
 @given(d = st.integers(min_value=1, max_value=16))
 @settings(deadline = None)
@@ -197,6 +203,21 @@ def test_linearity_evolution(d):
     note("Evolved dm1 + evolved dm2 = %r" % (right_hand_side))
     assert np.all(np.isclose(left_hand_side, right_hand_side, rtol=1e-10))
 
+# Checks that the Krylov backend, which never forms the propagator, agrees with the dense one
+@given(d = st.integers(min_value=2, max_value=16))
+@settings(deadline = None)
+def test_krylov_evolution_agrees_with_dense_evolution(d):
+    dm = rand_dm(d)
+    a = np.random.rand(d, d) + 1j * np.random.rand(d, d)
+    h = Qobj(a + a.conj().T)
+    dense = evolve_by_hamiltonian(dm, h, 0.7, backend='dense')
+    krylov = evolve_by_hamiltonian(dm, h, 0.7, backend='krylov')
+    assert np.all(np.isclose(dense.full(), krylov.full(), atol=1e-10))
+
+    # Stepping through a time grid reaches the same state as a single step
+    rho_t = list(krylov_propagate(dm, h, [0.2, 0.5, -0.7]))
+    assert np.all(np.isclose(rho_t[-1], dense.full(), atol=1e-10))
+
     
 # Checks the well-known relation
 # <(O-<O>)^2> = <O^2> - <O>^2
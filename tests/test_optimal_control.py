@@ -0,0 +1,82 @@
+import numpy as np
+
+from qutip import Qobj
+
+from pulsee.hamiltonians import rotation_sense
+
+from pulsee.nuclear_spin import NuclearSpin, ManySpins
+
+from pulsee.optimal_control import (GrapeProblem, controls_to_pulses, grape, rotating_frame_drift,
+                                    transverse_controls)
+
+from pulsee.quantum_computing import cnot
+
+from pulsee.simulation import nuclear_system_setup, evolve
+
+
+def quadrupolar_setup():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    quad_par = {'coupling constant' : 0.2,
+                'asymmetry parameter' : 0.,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+
+    return nuclear_system_setup(spin_par, quad_par, zeem_par)
+
+
+def test_grape_gradient_matches_finite_differences():
+    spin, h_unperturbed, _ = quadrupolar_setup()
+    h_drift = rotating_frame_drift(spin, h_unperturbed, 2 * np.pi)
+    h_controls = transverse_controls(spin)
+    controls = np.random.default_rng(0).normal(size=(2, 10)) * 0.01
+
+    gate = Qobj(np.linalg.qr(np.random.default_rng(1).normal(size=(4, 4)))[0])
+    for problem in (GrapeProblem(h_drift, h_controls, 10., 10, gate),
+                    GrapeProblem(h_drift, h_controls, 10., 10, spin.I['x'], initial_state=spin.I['z'])):
+        _, gradient = problem.fidelity_and_gradient(controls)
+        eps = 1e-7
+        for k, j in [(0, 0), (1, 4), (0, 9)]:
+            shift = np.zeros_like(controls)
+            shift[k, j] = eps
+            numeric = (problem.fidelity(controls + shift) - problem.fidelity(controls - shift)) / (2 * eps)
+            assert np.isclose(gradient[k, j], numeric, atol=1e-7)
+
+
+def test_grape_finds_cnot_on_two_coupled_spins():
+    spin_1, spin_2 = NuclearSpin(1/2, 1.), NuclearSpin(1/2, 1.)
+    spins = ManySpins([spin_1, spin_2])
+    iz_1, iz_2 = spins.embed(spin_1.I['z'], 0), spins.embed(spin_2.I['z'], 1)
+    h_drift = Qobj(0.05 * (iz_1 - iz_2) + 0.02 * iz_1 * iz_2, dims=spins.dims)
+
+    result = grape(h_drift, transverse_controls(spins, per_spin=True), 60., 300, cnot, seed=1)
+
+    assert result.fidelity > 0.9999
+    assert result.controls.shape == (4, 300)
+
+
+def test_grape_controls_replayed_by_evolve():
+    spin, h_unperturbed, _ = quadrupolar_setup()
+    frequency = 2 * np.pi
+    duration = 20.25
+    h_drift = rotating_frame_drift(spin, h_unperturbed, frequency)
+    result = grape(h_drift, transverse_controls(spin), duration, 100, spin.I['x'], initial_state=spin.I['z'], seed=0)
+    assert result.fidelity > 0.9999
+
+    dm_0 = Qobj(np.eye(4) / 4 + 0.1 * spin.I['z'].full(), dims=spin.dims)
+    mode = controls_to_pulses(spin, h_unperturbed, result.controls, duration, frequency)
+    dm_evolved = evolve(spin, h_unperturbed, dm_0, 'rwa', mode=mode)
+
+    # Back from the rotating frame, where the evolution is the one of the controls.
+    m = np.real(spin.I['z'].diag())
+    sense = rotation_sense(spin, Qobj(sum(h_unperturbed)))
+    u = np.exp(-1j * sense * frequency * duration * m)[:, np.newaxis] * result.propagator.full()
+    expected = u @ dm_0.full() @ u.conj().T
+    assert np.allclose(dm_evolved.full(), expected, atol=1e-10)
@@ -0,0 +1,51 @@
+import numpy as np
+
+from pulsee.powder import powder_grid, powder_FID_signal
+
+
+def test_lebedev_grids_integrate_polynomials_of_their_degree_exactly():
+    for n, degree in [(6, 3), (14, 5), (26, 7), (38, 9)]:
+        theta, phi, weights = powder_grid('lebedev', n)
+        x = np.sin(theta) * np.cos(phi)
+        z = np.cos(theta)
+        assert np.isclose(np.sum(weights), 1)
+        assert np.isclose(np.sum(weights * x**2), 1/3)
+        if degree >= 5:
+            assert np.isclose(np.sum(weights * z**4), 1/5)
+        if degree >= 7:
+            assert np.isclose(np.sum(weights * x**2 * z**4), 1/35)
+
+
+def test_zcw_and_repulsion_grids_approximate_the_uniform_average():
+    for method, n in [('zcw', 8), ('repulsion', 50)]:
+        theta, phi, weights = powder_grid(method, n)
+        z = np.cos(theta)
+        assert np.isclose(np.sum(weights), 1)
+        assert np.isclose(np.sum(weights * z**2), 1/3, atol=1e-3)
+
+    # The default ZCW grid of powder_FID_signal has F(10) = 89 orientations
+    assert len(powder_grid('zcw', 8)[0]) == 89
+
+
+def test_parallel_powder_average_agrees_with_serial_one():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    quad_par = {'coupling constant' : 2.,
+                'asymmetry parameter' : 0.,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+
+    times_serial, fid_serial = powder_FID_signal(spin_par, quad_par, zeem_par, 20., grid='lebedev', n=14,
+                                                 orientation='efg', n_workers=1)
+    times_parallel, fid_parallel = powder_FID_signal(spin_par, quad_par, zeem_par, 20., grid='lebedev', n=14,
+                                                     orientation='efg', n_workers=2, chunksize=3)
+
+    assert np.all(np.isclose(times_serial, times_parallel))
+    assert np.all(np.isclose(fid_serial, fid_parallel, atol=1e-12))
@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+
+from pulsee.pulses import Pulses
+
+from pulsee.profiling import Profiler
+
+from pulsee.simulation import nuclear_system_setup, evolve, FID_signal
+
+
+def test_profiler_records_stages_of_evolve_and_FID_signal():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, None, zeem_par)
+
+    mode = Pulses(frequencies=[2 * np.pi], amplitudes=[0.1], phases=[0],
+                  theta_p=[np.pi/2], phi_p=[0], pulse_times=[0.5])
+
+    dm_plain = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=mode, display_progress=None)
+
+    with Profiler() as prof:
+        dm_profiled = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=mode, display_progress=None)
+        evolve(spin, h_unperturbed, dm_0, 'magnus', mode=mode, n_points=5)
+        FID_signal(spin, h_unperturbed, dm_profiled, 5)
+
+    # Profiling does not change the results.
+    assert np.all(np.isclose(dm_plain.full(), dm_profiled.full()))
+
+    mesolve_record, magnus_record, fid_record = prof.records
+    assert mesolve_record['function'] == 'evolve'
+    assert {'hamiltonian', 'solve'} <= set(mesolve_record['stages'])
+    # The right-hand side is counted only on request, since the counter slows down the integration.
+    assert mesolve_record['rhs_evaluations'] is None
+    assert len(mesolve_record['solver_stats']) == 1
+    assert 'method' in mesolve_record['solver_stats'][0]
+    assert mesolve_record['peak_memory'] > 0
+
+    assert [child['function'] for child in magnus_record['calls']] == ['magnus']
+    assert magnus_record['calls'][0]['solver_steps'] == 5
+
+    assert fid_record['function'] == 'FID_signal'
+    assert 'diagonalization' in fid_record['stages']
+
+    totals = json.loads(prof.to_json())['totals']
+    assert totals['evolve']['calls'] == 2
+    assert totals['magnus']['calls'] == 1
+
+
+def test_profiler_counts_rhs_evaluations_on_request():
+    spin_par = {'quantum number' : 1/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, None, zeem_par)
+
+    mode = Pulses(frequencies=[2 * np.pi], amplitudes=[0.1], phases=[0],
+                  theta_p=[np.pi/2], phi_p=[0], pulse_times=[0.5])
+
+    dm_plain = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=mode, display_progress=None)
+
+    with Profiler(track_memory=False, count_rhs=True) as prof:
+        dm_profiled = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=mode, display_progress=None)
+
+    assert np.all(np.isclose(dm_plain.full(), dm_profiled.full()))
+    record, = prof.records
+    assert record['rhs_evaluations'] > 0
+    assert record['peak_memory'] is None
+    json.loads(prof.to_json())
@@ -0,0 +1,205 @@
+import numpy as np
+import pytest
+
+from qutip import Qobj
+
+from pulsee.pulses import Pulses
+
+import pulsee.propagators
+
+from pulsee.propagators import PropagatorCache, adaptive_magnus_propagator, common_period, default_propagator_cache
+
+from pulsee.simulation import nuclear_system_setup, evolve
+
+
+def test_propagator_cache_evicts_least_recently_used_entry():
+    cache = PropagatorCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert 'a' in cache and 'c' in cache
+    assert 'b' not in cache
+    assert len(cache) == 2
+
+
+def test_cached_propagator_evolution_agrees_with_mesolve():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    quad_par = {'coupling constant' : 2.,
+                'asymmetry parameter' : 0.,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, quad_par, zeem_par)
+
+    mode = Pulses(frequencies=[2 * np.pi], amplitudes=[0.2], phases=[0],
+                  theta_p=[np.pi/2], phi_p=[0], pulse_times=[0.5])
+
+    default_propagator_cache.clear()
+    dm_propagator = evolve(spin, h_unperturbed, dm_0, 'propagator', mode=mode)
+    dm_mesolve = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=mode, display_progress=None)
+
+    assert np.all(np.isclose(dm_propagator.full(), dm_mesolve.full(), atol=1e-9))
+
+    # A second identical pulse is served from the cache.
+    evolve(spin, h_unperturbed, dm_propagator, 'propagator', mode=mode)
+    assert default_propagator_cache.hits == 1
+    assert len(default_propagator_cache) == 1
+
+
+
+def test_cached_propagators_of_spins_with_different_gamma_do_not_collide():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    quad_par = {'coupling constant' : 2.,
+                'asymmetry parameter' : 0.,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+
+    # Pure NQR: both spins share h_unperturbed, only the pulse depends on gamma.
+    spin_1, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, quad_par, None)
+    spin_3, _, _ = nuclear_system_setup(dict(spin_par, **{'gamma/2pi' : 3.}), quad_par, None)
+
+    mode = Pulses(frequencies=[1.], amplitudes=[0.2], phases=[0],
+                  theta_p=[np.pi/2], phi_p=[0], pulse_times=[0.5])
+
+    for solver in ('propagator', 'rwa', 'adaptive_magnus', 'floquet_magnus'):
+        default_propagator_cache.clear()
+        dm_3 = evolve(spin_3, h_unperturbed, dm_0, solver, mode=mode)
+        default_propagator_cache.clear()
+        evolve(spin_1, h_unperturbed, dm_0, solver, mode=mode)
+        dm_3_after_1 = evolve(spin_3, h_unperturbed, dm_0, solver, mode=mode)
+
+        assert np.allclose(dm_3_after_1.full(), dm_3.full(), atol=1e-12)
+
+
+def test_rwa_evolution_agrees_with_mesolve_at_high_field():
+    spin_par = {'quantum number' : 1/2,
+                'gamma/2pi' : 10.}
+
+    zeem_par = {'field magnitude' : 3.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, None, zeem_par,
+                                                     initial_state='canonical', temperature=1e-4)
+
+    # Resonant pulse, 300 times weaker than the Zeeman interaction.
+    mode = Pulses(frequencies=[2 * np.pi * 30.], amplitudes=[0.01], phases=[0.3],
+                  theta_p=[np.pi/2], phi_p=[0.2], pulse_times=[1.])
+
+    opts = {'atol' : 1e-10, 'rtol' : 1e-10, 'nsteps' : 10**7}
+    dm_rwa = evolve(spin, h_unperturbed, dm_0, 'rwa', mode=mode)
+    dm_mesolve = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=mode, opts=opts, display_progress=None)
+
+    # The rotating-wave approximation neglects terms of order B_1 / B_0.
+    assert np.all(np.isclose(dm_rwa.full(), dm_mesolve.full(), atol=5e-3))
+    assert not np.all(np.isclose(dm_rwa.full(), dm_0.full(), atol=5e-2))
+
+
+def test_adaptive_and_floquet_magnus_agree_with_mesolve_for_long_pulse():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0.3,
+                'phi_z' : 0}
+
+    quad_par = {'coupling constant' : 0.5,
+                'asymmetry parameter' : 0.,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, quad_par, zeem_par,
+                                                     initial_state='canonical', temperature=1e-4)
+
+    # Two commensurate modes, one of which is switched off before the other.
+    mode = Pulses(frequencies=[2 * np.pi, 4 * np.pi], amplitudes=[0.1, 0.05], phases=[0.2, 0.],
+                  theta_p=[np.pi/2, np.pi/2], phi_p=[0., 1.], pulse_times=[10., 4.3])
+
+    opts = {'atol' : 1e-12, 'rtol' : 1e-12, 'nsteps' : 10**6}
+    dm_mesolve = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=mode, opts=opts, display_progress=None)
+
+    for solver in ('adaptive_magnus', 'floquet_magnus'):
+        dm_magnus = evolve(spin, h_unperturbed, dm_0, solver, mode=mode, magnus_tol=1e-8)
+        assert np.all(np.isclose(dm_magnus.full(), dm_mesolve.full(), atol=1e-7))
+
+
+
+def test_adaptive_magnus_with_unattainable_tolerance_converges_or_raises(monkeypatch):
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 10.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, None, zeem_par)
+    mode = Pulses(frequencies=[2 * np.pi * 10.], amplitudes=[0.1], phases=[0],
+                  theta_p=[np.pi/2], phi_p=[0], pulse_times=[0.5])
+
+    # Below round-off, the per-step allowance is floored and the steps stop shrinking.
+    dm_tiny_tol = evolve(spin, h_unperturbed, dm_0, 'adaptive_magnus', mode=mode, magnus_tol=1e-16)
+    dm_mesolve = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=mode, display_progress=None)
+    assert np.allclose(dm_tiny_tol.full(), dm_mesolve.full(), atol=1e-9)
+
+    # A stalled step size raises instead of looping forever.
+    monkeypatch.setattr(pulsee.propagators, 'MAGNUS_MIN_STEP', 0.5)
+    with pytest.raises(RuntimeError, match='1e-16'):
+        adaptive_magnus_propagator(spin, h_unperturbed, mode, 0.5, tol=1e-16, cache=None)
+
+def test_common_period_of_commensurate_frequencies():
+    assert np.isclose(common_period([2., 3.]), 2 * np.pi)
+    assert np.isclose(common_period([0., 4 * np.pi]), 0.5)
+    assert common_period([0.]) == np.inf
+
+
+def test_shaped_pulses_agree_between_solvers():
+    spin_par = {'quantum number' : 1/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, None, zeem_par)
+
+    for shape, shape_par in [('gaussian', {}), ('hyperbolic_secant', {'mu' : 2}),
+                             ('sampled', {'times' : [0, 1, 2, 3], 'amplitudes' : [.5, 1, -1, .3],
+                                          'phases' : [0, .5, 1, 0]})]:
+        mode = Pulses(frequencies=[2 * np.pi], amplitudes=[0.2], phases=[0], theta_p=[np.pi/2],
+                      phi_p=[0], pulse_times=[4.], shape=shape, shape_par=shape_par)
+
+        dm_mesolve = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=mode, n_points=100, display_progress=None)
+        dm_adaptive = evolve(spin, h_unperturbed, dm_0, 'adaptive_magnus', mode=mode, magnus_tol=1e-10)
+
+        assert np.allclose(dm_mesolve.full(), dm_adaptive.full(), atol=1e-8)
+
+
+def test_sampled_envelope_holds_samples_until_switch_off():
+    mode = Pulses(amplitudes=[0.1], pulse_times=[3.], shape='sampled',
+                  shape_par={'times' : [0, 1, 2], 'amplitudes' : [1, -1, .5], 'phases' : [0, 1, 2]})
+    a, phi = mode.envelope([0.5, 1.5, 2.9, 3.1])
+
+    assert np.allclose(a, [[1, -1, .5, 0]])
+    assert np.allclose(phi, [[0, 1, 2, 2]])
+    assert np.allclose(mode.slice_edges(4.), [0, 1, 2, 3, 4])
+
+    square = mode.instantaneous(1.5)
+    assert square.shape == 'square'
+    assert np.isclose(square.amplitudes[0], 0.1)
+    assert np.isclose(square.phases[0], 1 + np.pi)
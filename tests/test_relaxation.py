@@ -0,0 +1,64 @@
+import numpy as np
+
+from qutip import Qobj
+
+from pulsee.operators import canonical_density_matrix
+
+from pulsee.pulses import Pulses
+
+from pulsee.relaxation import relaxation_operators
+
+from pulsee.simulation import nuclear_system_setup, evolve, FID_signal
+
+
+def spin_half_setup():
+    spin_par = {'quantum number' : 1/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    return nuclear_system_setup(spin_par, None, zeem_par)
+
+
+def test_free_relaxation_follows_T1_and_T2():
+    spin, h_unperturbed, _ = spin_half_setup()
+    T1, T2, t = 20., 8., 5.
+
+    # Fully polarized along x: <Iz> = 0, |<I+>| = 1/2.
+    dm_x = Qobj(0.5 * np.eye(2) + spin.I['x'].full(), dims=spin.dims)
+    dm_t = evolve(spin, h_unperturbed, dm_x, evolution_time=t, c_ops={'T1': T1, 'T2': T2})
+    assert np.isclose(abs((dm_t * spin.I['+']).tr()), 0.5 * np.exp(-t / T2))
+
+    # Fully polarized along z: <Iz> relaxes towards 0 at infinite temperature.
+    dm_z = Qobj(0.5 * np.eye(2) + spin.I['z'].full(), dims=spin.dims)
+    dm_t = evolve(spin, h_unperturbed, dm_z, evolution_time=t, c_ops={'T1': T1, 'T2': T2})
+    assert np.isclose((dm_t * spin.I['z']).tr().real, 0.5 * np.exp(-t / T1))
+
+    # The FID stepped with the exponential of the Liouvillian decays with T2.
+    times, fid = FID_signal(spin, h_unperturbed, dm_x, 10, T2=np.inf, n_points=101, c_ops={'T2': T2})
+    _, fid_unitary = FID_signal(spin, h_unperturbed, dm_x, 10, T2=np.inf, n_points=101)
+    assert np.allclose(fid, fid_unitary * np.exp(-times / T2), atol=1e-10)
+
+
+def test_thermal_state_is_stationary_at_finite_temperature():
+    spin, h_unperturbed, _ = spin_half_setup()
+    temperature = 1e-4
+    dm_eq = canonical_density_matrix(Qobj(sum(h_unperturbed)), temperature)
+    c_ops = relaxation_operators(spin, T1=10., h_unperturbed=h_unperturbed, temperature=temperature)
+
+    dm_t = evolve(spin, h_unperturbed, Qobj(np.eye(2) / 2, dims=spin.dims), evolution_time=200, c_ops=c_ops)
+    assert np.allclose(dm_t.full(), dm_eq.full(), atol=1e-8)
+
+
+def test_propagator_with_relaxation_agrees_with_mesolve():
+    spin, h_unperturbed, dm_0 = spin_half_setup()
+    mode = Pulses(frequencies=[1.], amplitudes=[0.1], phases=[0],
+                  theta_p=[np.pi/2], phi_p=[0], pulse_times=[2.])
+    c_ops = {'T1': 10., 'T2': 5.}
+
+    dm_mesolve = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=mode, c_ops=c_ops, display_progress=None)
+    dm_propagator = evolve(spin, h_unperturbed, dm_0, 'propagator', mode=mode, c_ops=c_ops)
+
+    assert np.allclose(dm_mesolve.full(), dm_propagator.full(), atol=1e-8)
@@ -0,0 +1,76 @@
+import numpy as np
+
+from pulsee.pulses import Pulses
+
+from pulsee.sequences import PulseSequence, evolve_sequence, phase_cycle
+
+from pulsee.simulation import nuclear_system_setup, evolve, FID_signal
+
+
+def test_sequence_agrees_with_successive_evolve_calls():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    quad_par = {'coupling constant' : 2.,
+                'asymmetry parameter' : 0.,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, quad_par, zeem_par)
+
+    pulse_1 = Pulses(frequencies=[1.], amplitudes=[0.05], phases=[0],
+                     theta_p=[np.pi/2], phi_p=[0], pulse_times=[2.])
+    pulse_2 = Pulses(frequencies=[1.], amplitudes=[0.05], phases=[np.pi/2],
+                     theta_p=[np.pi/2], phi_p=[0], pulse_times=[4.])
+
+    sequence = PulseSequence().pulse(pulse_1).delay(3.).pulse(pulse_2).acquire(5., n_points=11, T2=np.inf)
+    result = evolve_sequence(spin, h_unperturbed, dm_0, sequence, return_allstates=True)
+
+    dm = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=pulse_1, display_progress=None)
+    dm = evolve(spin, h_unperturbed, dm, 'mesolve', evolution_time=3., display_progress=None)
+    assert np.allclose(dm.full(), result.states[1].full(), atol=1e-9)
+
+    dm = evolve(spin, h_unperturbed, dm, 'mesolve', mode=pulse_2, display_progress=None)
+    _, fid = FID_signal(spin, h_unperturbed, dm, 5., T2=np.inf, n_points=11)
+    assert np.allclose(fid, result.signals[0][1], atol=1e-9)
+
+    assert len(result.states) == len(sequence.elements)
+    assert np.isclose(sequence.duration, 14.)
+
+
+def test_receiver_phase_and_number_of_cycle_steps():
+    sequence = PulseSequence(receiver_cycle=[0, np.pi]).pulse(Pulses(), phase_cycle=[0, np.pi/2, np.pi, 3*np.pi/2])
+    assert sequence.n_cycle_steps == 4
+    assert sequence.receiver_phase(3) == np.pi
+
+
+def test_batched_phase_cycle_agrees_with_step_by_step_evaluation():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, None, zeem_par)
+
+    pulse_1 = Pulses(frequencies=[1.], amplitudes=[0.05], phases=[0],
+                     theta_p=[np.pi/2], phi_p=[0], pulse_times=[2.])
+    pulse_2 = Pulses(frequencies=[1.], amplitudes=[0.05], phases=[0],
+                     theta_p=[np.pi/2], phi_p=[0], pulse_times=[4.])
+    cycle = [0, np.pi/2, np.pi, 3*np.pi/2]
+    sequence = PulseSequence(receiver_cycle=cycle).pulse(pulse_1, phase_cycle=cycle).delay(3.) \
+        .pulse(pulse_2, phase_cycle=[0, np.pi]).acquire(5., n_points=11, T2=np.inf)
+
+    for solver in ('rwa', 'propagator'):
+        result = phase_cycle(spin, h_unperturbed, dm_0, sequence, solver=solver)
+        steps = [evolve_sequence(spin, h_unperturbed, dm_0, sequence, solver=solver, step=k) for k in range(4)]
+
+        assert np.allclose(result.signals[0][1], sum(step.signals[0][1] for step in steps), atol=1e-12)
+        assert np.allclose(result.state(1).full(), steps[1].state.full(), atol=1e-12)
@@ -6,19 +6,25 @@ from qutip import mesolve, Qobj, rand_dm, tensor
 import hypothesis.strategies as st
 from hypothesis import given
 
-from pulsee import changed_picture
-
 from pulsee.nuclear_spin import NuclearSpin
 
-from pulsee.hamiltonians import h_j_coupling
+from pulsee.hamiltonians import h_j_coupling, magnus, multiply_by_2pi
+
+from pulsee.operators import apply_exp_op, canonical_density_matrix, changed_picture, StaticHamiltonian, \
+    KRYLOV_DIMENSION_THRESHOLD
 
-from pulsee import nuclear_system_setup, \
+from pulsee.simulation import nuclear_system_setup, \
                        power_absorption_spectrum, \
                        evolve, \
                        RRF_operator, \
                        FID_signal, \
                        fourier_transform_signal, \
-                       fourier_phase_shift, magnus
+                       fourier_phase_shift
+
+from pulsee.simulation import ed_evolve, stream_FID_signal, write_FID_signal, broadened_spectrum
+
+from pulsee.pulses import Pulses
+
 
 def test_null_zeeman_contribution_for_0_gyromagnetic_ratio():
     spin_par = {'quantum number' : 3/2,
@@ -67,6 +73,112 @@ def test_correct_number_lines_power_absorption_spectrum(s):
     assert len(f)==(spin.d)*(spin.d-1)/2
     
 
+def test_power_absorption_spectrum_filters_and_merges_lines():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 10.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    spin, h_unperturbed, _ = nuclear_system_setup(spin_par, None, zeem_par)
+
+    # Only the three degenerate single-quantum transitions are allowed.
+    f, p = power_absorption_spectrum(spin, h_unperturbed, threshold=1e-6)
+    assert len(f) == 3 and np.allclose(f, 10.)
+
+    f, p = power_absorption_spectrum(spin, h_unperturbed, merge_tolerance=1e-6)
+    assert np.allclose(f, [10., 20., 30.])
+    assert np.allclose(p, [10. * (3/4 + 1 + 3/4), 0, 0])
+
+    f, p = power_absorption_spectrum(spin, h_unperturbed, frequency_window=(15., 35.), sort=True)
+    assert np.allclose(f, [20., 20., 30.])
+
+
+def test_broadened_spectrum_agrees_with_sum_of_lineshapes():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 10.,
+                'theta_z' : np.pi/4,
+                'phi_z' : 0}
+
+    quad_par = {'coupling constant' : 2.,
+                'asymmetry parameter' : 0.3,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+
+    spin, h_unperturbed, _ = nuclear_system_setup(spin_par, quad_par, zeem_par)
+    f, p = power_absorption_spectrum(spin, h_unperturbed)
+
+    for lineshape, width in [('lorentzian', 0.2), ('gaussian', 0.3)]:
+        grid, spectrum = broadened_spectrum(f, p, width, lineshape, frequency_range=(0., 40.), n_points=4001)
+        if lineshape == 'lorentzian':
+            profile = lambda x: (width / 2 / np.pi) / (x ** 2 + (width / 2) ** 2)
+        else:
+            sigma = width / (2 * np.sqrt(2 * np.log(2)))
+            profile = lambda x: np.exp(-x ** 2 / (2 * sigma ** 2)) / (sigma * np.sqrt(2 * np.pi))
+        expected = sum(p_i * profile(grid - f_i) for f_i, p_i in zip(f, p))
+        assert np.allclose(spectrum, expected, atol=5e-3 * expected.max())
+
+
+def test_static_hamiltonian_is_diagonalized_once_and_shared():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0.3,
+                'phi_z' : 0}
+
+    quad_par = {'coupling constant' : 2.,
+                'asymmetry parameter' : 0.3,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, quad_par, zeem_par,
+                                                     initial_state='canonical', temperature=1e-4)
+    assert isinstance(h_unperturbed, StaticHamiltonian)
+    energies, eigvects = h_unperturbed.eigh()
+    assert h_unperturbed.eigh()[1] is eigvects
+
+    expected = canonical_density_matrix(Qobj(sum(h_unperturbed)), 1e-4)
+    assert np.allclose(dm_0.full(), expected.full())
+
+    q = Qobj(np.diag(np.arange(4.)), dims=spin.dims)
+    assert np.allclose(changed_picture(q, h_unperturbed, 0.7).full(),
+                       changed_picture(q, h_unperturbed.total, 0.7).full())
+
+    # Changing the terms invalidates the memoized eigendecomposition.
+    h_unperturbed[0] = 2 * h_unperturbed[0]
+    assert h_unperturbed.eigh()[1] is not eigvects
+    assert np.allclose(h_unperturbed.eigh()[0], np.linalg.eigh(Qobj(sum(h_unperturbed)).full())[0])
+
+
+def test_canonical_density_matrix_at_low_and_high_temperature():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1e4,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    # The exponential of the Hamiltonian overflows, but not the normalized weights.
+    spin, h_unperturbed, dm_cold = nuclear_system_setup(spin_par, None, zeem_par, temperature=1e-6)
+    assert np.isclose(dm_cold.tr(), 1)
+    assert np.allclose(np.real(dm_cold.diag()), [1, 0, 0, 0])
+
+    zeem_par['field magnitude'] = 100.
+    _, _, dm_exact = nuclear_system_setup(spin_par, None, zeem_par, temperature=300)
+    _, _, dm_linear = nuclear_system_setup(spin_par, None, zeem_par, initial_state='high_temperature',
+                                           temperature=300)
+    assert np.allclose(dm_linear.full(), dm_exact.full(), atol=1e-9)
+    assert not np.allclose(dm_exact.full(), np.eye(4) / 4, atol=1e-5)
+
+
 def test_magnus_pi_pulse_yields_population_inversion():
     spin_par = {'quantum number' : 5/2,
                 'gamma/2pi' : 1.}
@@ -533,4 +645,161 @@ def test_two_methods_phase_adjustment():
     
     
     
-    
\ No newline at end of file
+    
+
+
+def test_FID_signal_eigenbasis_agrees_with_mesolve():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+    
+    zeem_par = {'field magnitude' : 2.,
+                'theta_z' : np.pi/5,
+                'phi_z' : 0}
+    
+    quad_par = {'coupling constant' : 3.,
+                'asymmetry parameter' : 0.3,
+                'alpha_q' : np.pi/3,
+                'beta_q' : np.pi/5,
+                'gamma_q' : 0,
+                'order' : 2}
+    
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, quad_par, zeem_par,
+                                                     initial_state=rand_dm(4).full())
+    
+    t, fid = FID_signal(spin, h_unperturbed, dm_0, acquisition_time=10, T2=5,
+                        theta=np.pi/4, phi=np.pi/6, n_points=500)
+    
+    Ix_rotated = apply_exp_op(apply_exp_op(spin.I['x'], -1j * np.pi/4 * spin.I['y']),
+                              -1j * np.pi/6 * spin.I['z'])
+    result = mesolve(multiply_by_2pi(h_unperturbed), dm_0, t, e_ops=[Ix_rotated],
+                     options={'atol' : 1e-14, 'rtol' : 1e-14, 'nsteps' : 20000})
+    fid_mesolve = np.array(result.expect)[0] * np.exp(-t / 5)
+    
+    assert np.all(np.isclose(fid, fid_mesolve, atol=1e-9))
+
+
+def test_ed_evolve_matches_exponentiated_hamiltonian_at_all_times():
+    spin_par = {'quantum number' : 1,
+                'gamma/2pi' : 1.}
+    
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : np.pi/3,
+                'phi_z' : 0}
+    
+    quad_par = {'coupling constant' : 2.,
+                'asymmetry parameter' : 0.5,
+                'alpha_q' : 0,
+                'beta_q' : np.pi/4,
+                'gamma_q' : 0,
+                'order' : 2}
+    
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, quad_par, zeem_par,
+                                                     initial_state=rand_dm(3).full())
+    
+    h = Qobj(sum(h_unperturbed))
+    tlist = np.linspace(0, 2, 50)
+    
+    rho_t, e_ops_t = ed_evolve(h_unperturbed, dm_0, spin, tlist, e_ops=[spin.I['z']], all_t=True)
+    
+    for i, t in enumerate(tlist):
+        u = (1j * 2 * np.pi * h * t).expm()
+        rho_expected = u * dm_0 * u.dag()
+        assert np.all(np.isclose(rho_t[i].full(), rho_expected.full(), atol=1e-10))
+        assert np.isclose(e_ops_t[0][i], (spin.I['z'] * rho_expected).tr(), atol=1e-10)
+
+
+def test_magnus_converges_to_mesolve_with_increasing_order():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+    
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0.3,
+                'phi_z' : 0}
+    
+    quad_par = {'coupling constant' : 0.5,
+                'asymmetry parameter' : 0.,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+    
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, quad_par, zeem_par,
+                                                     initial_state='canonical', temperature=1e-4)
+    
+    mode = Pulses(frequencies=[2 * np.pi], amplitudes=[0.1], phases=[0],
+                  theta_p=[np.pi/2], phi_p=[0], pulse_times=[1.])
+    
+    dm_mesolve = evolve(spin, h_unperturbed, dm_0, 'mesolve', mode=mode, display_progress=None)
+    
+    errors = [np.max(np.abs(evolve(spin, h_unperturbed, dm_0, 'magnus', mode=mode, order=order,
+                                   n_points=200).full() - dm_mesolve.full()))
+              for order in (1, 2, 3)]
+    
+    assert errors[0] > errors[1] > errors[2]
+    assert errors[2] < 5e-4
+
+
+def test_krylov_magnus_matches_dense_magnus_without_diagonalizing(monkeypatch):
+    zeem_par = {'field magnitude' : 0.1,
+                'theta_z' : 0.3,
+                'phi_z' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup({'quantum number' : 3/2, 'gamma/2pi' : 1.}, None,
+                                                     zeem_par, initial_state='canonical', temperature=1e-4)
+    mode = Pulses(frequencies=[2 * np.pi * 0.1], amplitudes=[0.01], phases=[0],
+                  theta_p=[np.pi/2], phi_p=[0], pulse_times=[1.])
+    for order in (1, 2, 3):
+        dm_dense = evolve(spin, h_unperturbed, dm_0, 'magnus', mode=mode, order=order, backend='dense')
+        dm_krylov = evolve(spin, h_unperturbed, dm_0, 'magnus', mode=mode, order=order, backend='krylov')
+        assert np.allclose(dm_krylov.full(), dm_dense.full(), atol=1e-10)
+
+    # Above KRYLOV_DIMENSION_THRESHOLD, backend='auto' never diagonalizes the generator of the picture
+    spin, h_unperturbed, dm_0 = nuclear_system_setup({'quantum number' : (KRYLOV_DIMENSION_THRESHOLD + 1) / 2,
+                                                      'gamma/2pi' : 1.}, None, zeem_par,
+                                                     initial_state='canonical', temperature=1e-4)
+    mode.amplitudes = [0.002]
+    assert spin.d > KRYLOV_DIMENSION_THRESHOLD
+    dm_dense = evolve(spin, h_unperturbed, dm_0, 'magnus', mode=mode, backend='dense')
+
+    def eigh(*args, **kwargs):
+        raise AssertionError("dense eigh called by the Krylov backend")
+
+    monkeypatch.setattr(np.linalg, 'eigh', eigh)
+    # A plain list of terms carries no memoized eigendecomposition
+    dm_krylov = evolve(spin, list(h_unperturbed), dm_0, 'magnus', mode=mode, backend='auto')
+    assert np.allclose(dm_krylov.full(), dm_dense.full(), atol=1e-10)
+
+def test_streamed_FID_signal_agrees_with_FID_signal(tmp_path):
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 1.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    quad_par = {'coupling constant' : 2.,
+                'asymmetry parameter' : 0.,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, quad_par, zeem_par)
+    dm = Qobj(np.eye(4) / 4 + 0.1 * spin.I['x'].full(), dims=spin.dims)
+    pulse_mode = Pulses(frequencies=[1.], amplitudes=[0.01], phases=[0],
+                        theta_p=[np.pi/2], phi_p=[0], pulse_times=[3.])
+
+    for kwargs in ({}, {'c_ops' : {'T1' : 30., 'T2' : 10.}}, {'pulse_mode' : pulse_mode}):
+        t, fid = FID_signal(spin, h_unperturbed, dm, 10., T2=20., n_points=301, **kwargs)
+        blocks = list(stream_FID_signal(spin, h_unperturbed, dm, 10., T2=20., n_points=301, chunk_size=64,
+                                        **kwargs))
+
+        assert len(blocks) == 5
+        assert np.allclose(np.concatenate([times for times, _ in blocks]), t)
+        assert np.allclose(np.concatenate([block for _, block in blocks]), fid, atol=1e-9)
+
+    path = write_FID_signal(str(tmp_path / 'fid.npy'), spin, h_unperturbed, dm, 10., n_points=301, T2=20.,
+                            chunk_size=100)
+    stored = np.load(path, mmap_mode='r')
+    assert np.allclose(stored['time'], t)
+    assert np.allclose(stored['fid'], FID_signal(spin, h_unperturbed, dm, 10., T2=20., n_points=301)[1])
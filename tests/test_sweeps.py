@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from pulsee.pulses import Pulses
+
+from pulsee.simulation import nuclear_system_setup, evolve
+
+from pulsee.sweeps import sweep_evolve
+
+
+def _setup():
+    spin_par = {'quantum number' : 3/2,
+                'gamma/2pi' : 1.}
+
+    zeem_par = {'field magnitude' : 5.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    quad_par = {'coupling constant' : 0.05,
+                'asymmetry parameter' : 0.,
+                'alpha_q' : 0,
+                'beta_q' : 0,
+                'gamma_q' : 0,
+                'order' : 0}
+
+    return nuclear_system_setup(spin_par, quad_par, zeem_par, initial_state='canonical', temperature=1e-4)
+
+
+def test_batched_rwa_sweep_matches_evolve_for_each_variant():
+    spin, h_unperturbed, dm_0 = _setup()
+    mode = Pulses(frequencies=[2 * np.pi * 5], amplitudes=[0.1], phases=[0.],
+                  theta_p=[np.pi/2], phi_p=[0.], pulse_times=[1.])
+
+    amplitudes = np.linspace(0, 0.2, 4)
+    pulse_times = [0., 0.5, 1.3]
+    result = sweep_evolve(spin, h_unperturbed, dm_0, mode, amplitudes=amplitudes, pulse_times=pulse_times,
+                          e_ops=[spin.I['z']])
+
+    assert result.states.shape == (4, 3, 4, 4)
+    assert result.expectations.shape == (4, 3, 1)
+    assert list(result.to_dataframe().index.names) == ['amplitude', 'pulse_time']
+
+    for i, amplitude in enumerate(amplitudes):
+        for j, pulse_time in enumerate(pulse_times):
+            variant = Pulses(frequencies=[2 * np.pi * 5], amplitudes=[amplitude], phases=[0.],
+                             theta_p=[np.pi/2], phi_p=[0.], pulse_times=[pulse_time])
+            dm = evolve(spin, h_unperturbed, dm_0, 'rwa', mode=variant)
+            assert np.all(np.isclose(result.state(i, j).full(), dm.full(), atol=1e-12))
+            assert np.isclose(result.expectations[i, j, 0], np.real((dm * spin.I['z']).tr()))
+
+
+def test_rwa_sweep_without_states_computes_only_the_expectations():
+    spin, h_unperturbed, dm_0 = _setup()
+    mode = Pulses(frequencies=[2 * np.pi * 5], amplitudes=[0.1], phases=[0.],
+                  theta_p=[np.pi/2], phi_p=[0.], pulse_times=[1.])
+    e_ops = [spin.I['x'], spin.I['z']]
+
+    stored = sweep_evolve(spin, h_unperturbed, dm_0, mode, amplitudes=[0.05, 0.1, 0.2], e_ops=e_ops)
+    result = sweep_evolve(spin, h_unperturbed, dm_0, mode, amplitudes=[0.05, 0.1, 0.2], e_ops=e_ops,
+                          store_states=False)
+
+    assert result.states is None
+    assert np.allclose(result.expectations, stored.expectations, atol=1e-12)
+
+
+def test_sweep_with_other_solvers_goes_through_evolve():
+    spin, h_unperturbed, dm_0 = _setup()
+    mode = Pulses(frequencies=[2 * np.pi * 5], amplitudes=[0.05], phases=[0.],
+                  theta_p=[np.pi/2], phi_p=[0.], pulse_times=[1.])
+
+    result_rwa = sweep_evolve(spin, h_unperturbed, dm_0, mode, phases=[0., np.pi/2], e_ops=[spin.I['x']])
+    result_mesolve = sweep_evolve(spin, h_unperturbed, dm_0, mode, phases=[0., np.pi/2], e_ops=[spin.I['x']],
+                                  solver='mesolve', store_states=False)
+
+    assert result_mesolve.states is None
+    # The rotating-wave approximation neglects terms of order B_1 / B_0.
+    assert np.all(np.isclose(result_rwa.expectations, result_mesolve.expectations, atol=1e-2))
+
+
+def test_batched_rwa_sweep_of_shaped_pulse_with_negative_gamma_matches_evolve():
+    spin_par = {'quantum number' : 1,
+                'gamma/2pi' : -1.}
+
+    zeem_par = {'field magnitude' : 5.,
+                'theta_z' : 0,
+                'phi_z' : 0}
+
+    spin, h_unperturbed, dm_0 = nuclear_system_setup(spin_par, None, zeem_par,
+                                                     initial_state='canonical', temperature=1e-4)
+    mode = Pulses(frequencies=[2 * np.pi * 5], amplitudes=[0.1], phases=[0.],
+                  theta_p=[np.pi/2], phi_p=[0.], pulse_times=[2.], shape='gaussian')
+
+    phases = [0., np.pi/3]
+    result = sweep_evolve(spin, h_unperturbed, dm_0, mode, phases=phases)
+
+    for i, phase in enumerate(phases):
+        variant = mode.copy()
+        variant.phases = [phase]
+        dm = evolve(spin, h_unperturbed, dm_0, 'rwa', mode=variant)
+        assert np.allclose(result.state(i).full(), dm.full(), atol=1e-12)
+
+
+def test_rwa_sweep_does_not_silently_ignore_relaxation():
+    spin, h_unperturbed, dm_0 = _setup()
+    mode = Pulses(frequencies=[2 * np.pi * 5], amplitudes=[0.1], phases=[0.],
+                  theta_p=[np.pi/2], phi_p=[0.], pulse_times=[1.])
+
+    # evolve(solver='rwa') rejects c_ops for a pulse, and so does the sweep
+    with pytest.raises(NotImplementedError):
+        sweep_evolve(spin, h_unperturbed, dm_0, mode, phases=[0., np.pi/2], c_ops={'T2': 10.})
+
+    # Free relaxation is supported by evolve, and is not replaced by the unitary evolution
+    result = sweep_evolve(spin, h_unperturbed, dm_0, mode, amplitudes=[0.], pulse_times=[1., 2.],
+                          c_ops={'T1': 1., 'T2': 1.})
+    for j, pulse_time in enumerate([1., 2.]):
+        variant = mode.copy()
+        variant.amplitudes = [0.]
+        variant.pulse_times = [pulse_time]
+        dm = evolve(spin, h_unperturbed, dm_0, 'rwa', mode=variant, c_ops={'T1': 1., 'T2': 1.})
+        assert np.allclose(result.state(0, j).full(), dm.full(), atol=1e-12)
+        assert not np.allclose(dm.full(), dm_0.full(), atol=1e-3)